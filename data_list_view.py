@@ -5,12 +5,22 @@ import os.path
 from IPython import embed
 import numpy as np
 
-from file_handling.meae_data_reader import MeaeDataReader
+from file_handling.recording_catalog import RecordingCatalog
+from file_handling.catalog_scan_thread import CatalogScanThread
+from file_handling.overview_thread import OverviewThread
+from file_handling.recording_overview import get_overview_thumbnail
 
 
-# This widget scans for files in different folders via os.path and adds them to a list of which the user can
-# open his/her desired .h5 file
+# This widget lists the recordings of a folder (and its sub folders), of which the user can open his/her desired .h5
+# file. The recordings are taken from the RecordingCatalog, so the list (with sampling frequency, duration and number
+# of channels of every recording) is shown at once. Afterwards the folder is scanned again in the background and the
+# list is updated, if recordings were added, removed or changed. For recordings without an activity overview (RMS of all
+# channels over time and the estimated spike rate), the overview is computed by a low priority OverviewThread and shown
+# as small image in the list.
 class DataListView(QtWidgets.QWidget):
+    column_names = ['file', 'fs [Hz]', 'duration [s]', 'channels', 'spike rate [Hz]', 'overview']
+    overview_size = QtCore.QSize(96, 24)
+
     def __init__(self, parent):
         super().__init__(parent)
 
@@ -18,14 +28,33 @@ class DataListView(QtWidgets.QWidget):
         self.selected_folder_label = QtWidgets.QLabel("")
         self.current_folder = ""
 
+        self.catalog = RecordingCatalog()
+        self.scan_thread = None
+        self.folder_to_scan = None
+        self.overview_thread = None
+        self.items = dict()  # relative path -> item of the list
+
         # implementation of button to set folder directory. The directory will be saved, so once its set it will be
         # shown automatically when the program is opened again
         self.select_folder_button = QtWidgets.QPushButton("...")
         self.select_folder_button.setFixedSize(24, 24)
         self.select_folder_button.pressed.connect(self.on_select_folder_button_pressed)
 
-        # the DataList itself is a QListWidget
-        self.file_list = QtWidgets.QListWidget(self)
+        # only recordings which contain the text of the filter are shown
+        self.filter_input = QtWidgets.QLineEdit(self)
+        self.filter_input.setPlaceholderText("Filter recordings")
+        self.filter_input.textChanged.connect(self.apply_filter)
+
+        self.scan_label = QtWidgets.QLabel("")
+
+        # the DataList itself is a QTreeWidget, which has a column for every piece of metadata
+        self.file_list = QtWidgets.QTreeWidget(self)
+        self.file_list.setColumnCount(len(DataListView.column_names))
+        self.file_list.setHeaderLabels(DataListView.column_names)
+        self.file_list.setRootIsDecorated(False)
+        self.file_list.setIconSize(DataListView.overview_size)
+        self.file_list.setSortingEnabled(True)
+        self.file_list.sortByColumn(0, QtCore.Qt.AscendingOrder)
 
         # layout
         main_layout = QtWidgets.QVBoxLayout(self)
@@ -33,6 +62,8 @@ class DataListView(QtWidgets.QWidget):
         folder_path_layout.addWidget(self.selected_folder_label)
         folder_path_layout.addWidget(self.select_folder_button)
         main_layout.addLayout(folder_path_layout)
+        main_layout.addWidget(self.filter_input)
+        main_layout.addWidget(self.scan_label)
         main_layout.addWidget(self.file_list)
 
     # function, that executes folder selection, once the according button was pressed
@@ -42,67 +73,138 @@ class DataListView(QtWidgets.QWidget):
         if len(selected_folder) > 0:
             self.set_current_folder(selected_folder)
 
-    # function that searches for the data in the choosen directory
+    # function that shows the cataloged recordings of the chosen directory and scans it again in the background
     def set_current_folder(self, folder):
         self.current_folder = folder
         self.selected_folder_label.setText(folder)
+        if self.overview_thread is not None:
+            # the overviews of the recordings of the new folder are computed, once the thread has stopped
+            self.overview_thread.abort()
+        self.show_recordings()
+        self.start_scan(folder)
+
+    def show_recordings(self):
         self.file_list.clear()
-        data_files, meae_indices = self.get_data()
-        for idx, file in enumerate(data_files):
-            self.file_list.addItem(file)
+        self.items = dict()
+        for recording in self.catalog.get_recordings(self.current_folder):
+            item = QtWidgets.QTreeWidgetItem([recording['relative_path']])
+            for column, key in enumerate(['sampling_frequency', 'duration', 'n_channels'], start=1):
+                if recording[key] is not None:
+                    # numbers are set as data (not text), so the columns are sorted numerically
+                    item.setData(column, QtCore.Qt.DisplayRole, round(recording[key], 2))
             tool_tip = "No .meae file found."
-            self.file_list.item(idx).setToolTip(tool_tip)
-            if idx in meae_indices:
-                self.file_list.item(idx).setBackground(QtGui.QColor(0, 134, 153))
-                self.file_list.item(idx).setForeground(QtGui.QColor("white"))
-                self.file_list.item(idx).setToolTip(tool_tip)
-                file_without_extension = ".".join(file.split('.')[:-1])
-                mea_file = self.current_folder + file_without_extension + ".meae"
-                if os.path.exists(mea_file):
-                    reader = MeaeDataReader(mea_file)
-                    keys = list(reader.file.keys())
-                    spiketimes_indices_key_indices = [int(i) for i, key in enumerate(keys) if 'spiketimes_indices' in
-                                                      key]
-                    spiketimes_indices_keys = [keys[idx] for idx in spiketimes_indices_key_indices]
-                    spiketimes_key_indices = np.asarray(spiketimes_indices_key_indices) - 2
-                    spiketimes_keys = [keys[idx] for idx in spiketimes_key_indices]
-                    if len(spiketimes_keys) > 1:
-                        for k_idx, key in enumerate(keys):
-                            if key in spiketimes_keys or key in spiketimes_indices_keys and k_idx == 0:
-                                num_of_spiketimes = len(spiketimes_keys)
-                                tool_tip_keys = [key for key in keys if 'spiketimes' not in key]
-                                tool_tip_keys.append(str(int(num_of_spiketimes)) +
-                                                     ' spiketimes and spike indices found')
-                                tool_tip = "Keys: " + ", ".join(tool_tip_keys)
-                                self.file_list.item(idx).setToolTip(tool_tip)
-                            else:
-                                continue
-                    else:
-                        tool_tip = "Keys: " + ", ".join(keys)
-                        self.file_list.item(idx).setToolTip(tool_tip)
-
-    # function that scans absolute and relative paths of data
-    def get_data(self):
-        # scan recursively for (which file format do we have?) files
-        found_files = []
-        meae_files = []
-        for root, sub_folders, files in os.walk(self.current_folder):
-            for file in files:
-                absolute_path = os.path.join(root, file)
-                relative_path = os.path.relpath(absolute_path, self.current_folder)
-                if relative_path.startswith('$RECYCLE.BIN'):
-                    continue
-                if file.endswith(".h5"):
-                    found_files.append(relative_path)
-                if file.endswith(".meae"):
-                    meae_files.append(relative_path)
-
-        mea_indices = []
-        for index, file in enumerate(found_files):
-            if '.' in file:
-                file_without_extension = ".".join(file.split('.')[:-1])
-                file_as_meae = file_without_extension + ".meae"
-                if file_as_meae in meae_files:
-                    mea_indices.append(index)
-
-        return found_files, mea_indices
+            if recording['meae_path'] is not None:
+                for column in range(len(DataListView.column_names)):
+                    item.setBackground(column, QtGui.QColor(0, 134, 153))
+                    item.setForeground(column, QtGui.QColor("white"))
+                tool_tip = self.get_meae_tool_tip(recording['meae_keys'])
+            if recording['sc_path'] is not None:
+                tool_tip += "\nSpyKING CIRCUS results: " + recording['sc_path']
+            item.setToolTip(0, tool_tip)
+            self.file_list.addTopLevelItem(item)
+            self.items[recording['relative_path']] = item
+        for relative_path, (rms, spike_rates) in self.catalog.get_overviews(self.current_folder).items():
+            self.show_overview(relative_path, rms, spike_rates)
+        self.apply_filter(self.filter_input.text())
+
+    def show_overview(self, relative_path, rms, spike_rates):
+        item = self.items.get(relative_path)
+        if item is None:
+            return
+        item.setData(4, QtCore.Qt.DisplayRole, round(float(np.mean(spike_rates)), 2))
+        thumbnail = get_overview_thumbnail(rms, DataListView.overview_size.height())
+        image = QtGui.QImage(thumbnail.data, thumbnail.shape[1], thumbnail.shape[0], thumbnail.shape[1],
+                             QtGui.QImage.Format_Grayscale8).copy()  # copy, because thumbnail is freed afterwards
+        pixmap = QtGui.QPixmap.fromImage(image).scaled(DataListView.overview_size)
+        item.setData(5, QtCore.Qt.DecorationRole, pixmap)
+        item.setToolTip(5, 'RMS of all channels (rows) over time (columns), bright = high')
+
+    @QtCore.pyqtSlot(str)
+    def apply_filter(self, text):
+        text = text.strip().lower()
+        for index in range(self.file_list.topLevelItemCount()):
+            item = self.file_list.topLevelItem(index)
+            item.setHidden(text not in item.text(0).lower())
+
+    @staticmethod
+    def get_meae_tool_tip(keys):
+        """
+        :param keys: keys of the .meae file
+        :return: tool tip which lists the keys of the .meae file (and the number of spike times instead of their keys)
+        """
+        tool_tip = "Keys: " + ", ".join(keys)
+        spiketimes_indices_key_indices = [int(i) for i, key in enumerate(keys) if 'spiketimes_indices' in key]
+        spiketimes_indices_keys = [keys[idx] for idx in spiketimes_indices_key_indices]
+        spiketimes_key_indices = np.asarray(spiketimes_indices_key_indices, dtype=int) - 2
+        spiketimes_keys = [keys[idx] for idx in spiketimes_key_indices]
+        if len(spiketimes_keys) > 1:
+            for k_idx, key in enumerate(keys):
+                if key in spiketimes_keys or key in spiketimes_indices_keys and k_idx == 0:
+                    num_of_spiketimes = len(spiketimes_keys)
+                    tool_tip_keys = [key for key in keys if 'spiketimes' not in key]
+                    tool_tip_keys.append(str(int(num_of_spiketimes)) + ' spiketimes and spike indices found')
+                    tool_tip = "Keys: " + ", ".join(tool_tip_keys)
+        return tool_tip
+
+    def start_scan(self, folder):
+        if self.scan_thread is not None:
+            # the folder is scanned once the running scan is finished
+            self.folder_to_scan = folder
+            return
+        self.folder_to_scan = None
+        self.scan_thread = CatalogScanThread(self, folder, self.catalog.path)
+        self.scan_thread.operation_changed.connect(self.scan_label.setText)
+        self.scan_thread.finished.connect(self.on_scan_thread_finished)
+
+        debug_mode = False  # set to 'True' in order to debug the scan with embed
+        if debug_mode:
+            self.scan_thread.run()
+        else:
+            self.scan_thread.start()
+
+    def on_scan_thread_finished(self):
+        scanned_folder = self.scan_thread.folder
+        self.scan_thread = None
+        self.scan_label.setText("")
+        if scanned_folder == self.current_folder:
+            self.show_recordings()
+        if self.folder_to_scan is not None:
+            self.start_scan(self.folder_to_scan)
+        else:
+            self.start_overviews()
+
+    def start_overviews(self):
+        if self.overview_thread is not None:
+            return
+        overviews = self.catalog.get_overviews(self.current_folder)
+        relative_paths = [recording['relative_path'] for recording in self.catalog.get_recordings(self.current_folder)
+                          if recording['sampling_frequency'] is not None and
+                          recording['relative_path'] not in overviews]
+        if len(relative_paths) == 0:
+            return
+        self.overview_thread = OverviewThread(self, self.current_folder, relative_paths, self.catalog.path)
+        self.overview_thread.operation_changed.connect(self.scan_label.setText)
+        self.overview_thread.overview_computed.connect(self.on_overview_computed)
+        self.overview_thread.finished.connect(self.on_overview_thread_finished)
+
+        debug_mode = False  # set to 'True' in order to debug the overviews with embed
+        if debug_mode:
+            self.overview_thread.run()
+        else:
+            # lowest priority, so the overviews never slow down the GUI or an analysis
+            self.overview_thread.start(QtCore.QThread.LowestPriority)
+
+    @QtCore.pyqtSlot(str)
+    def on_overview_computed(self, relative_path):
+        if self.overview_thread is None or self.overview_thread.folder != self.current_folder:
+            return
+        overview = self.catalog.get_overviews(self.current_folder, relative_path).get(relative_path)
+        if overview is not None:
+            self.show_overview(relative_path, *overview)
+
+    def on_overview_thread_finished(self):
+        folder = self.overview_thread.folder
+        self.overview_thread = None
+        self.scan_label.setText("")
+        if folder != self.current_folder and self.scan_thread is None:
+            self.start_overviews()
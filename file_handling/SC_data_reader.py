@@ -1,8 +1,63 @@
 import os
+import ast
 import numpy as np
 import h5py
 from circus.shared.parser import CircusParser
 
+from file_handling.io_planner import open_hdf5_file
+
+
+def parse_dead_channels(value):
+    """
+    :param value: dead_channels of the SpyKING CIRCUS parameter file, e.g. '{ 1 : [0, 1, 14, 15] }' (channel group:
+    channels of this group), empty if there are no dead channels
+    :return: list of the dead channels of all channel groups
+    """
+    if isinstance(value, str):
+        if value.strip() == '':
+            return []
+        try:
+            value = ast.literal_eval(value.strip())
+        except (ValueError, SyntaxError):
+            return []
+    if isinstance(value, dict):
+        return [int(channel) for channels in value.values() for channel in channels]
+    return [int(channel) for channel in value]
+
+
+def parse_cut_off(value, fs):
+    """
+    :param value: cut_off of the SpyKING CIRCUS parameter file, e.g. '300, auto' or '[300.0, 4750.0]'
+    :param fs: sampling frequency in Hz
+    :return: lower and upper cutoff frequency of the bandpass in Hz, 'auto' means 95 % of the Nyquist frequency (as in
+    SpyKING CIRCUS)
+    """
+    if not isinstance(value, str):
+        value = ','.join(str(v) for v in value)
+    cut_off = []
+    for token in value.strip().strip('[]()').split(','):
+        token = token.strip().strip('\'"')
+        if token == 'auto':
+            cut_off.append(0.95 * fs / 2)
+        elif token != '':
+            cut_off.append(float(token))
+    if len(cut_off) == 1:
+        cut_off.append(0.95 * fs / 2)
+    return cut_off[0], cut_off[1]
+
+
+def parse_chunk_size(value, default=30.0):
+    """
+    :param value: chunk_size of the data section of the SpyKING CIRCUS parameter file in s, e.g. '30'
+    :param default: chunk size in s if the value is missing or not a number (default of SpyKING CIRCUS)
+    :return: length of the chunks SpyKING CIRCUS filters and references at once in s
+    """
+    try:
+        chunk_size = float(str(value).strip())
+    except (TypeError, ValueError):
+        return default
+    return chunk_size if chunk_size > 0 else default
+
 
 class SCDataReader:
     def __init__(self, path, base_filepath):
@@ -13,7 +68,8 @@ class SCDataReader:
         self.filename_prefix = '.'.join(self.cluster_filename.split('.')[:-2])
 
         self.file = h5py.File(path, 'r')
-        self.base_file = h5py.File(base_filepath, 'r')
+        self.base_filepath = base_filepath
+        self.base_file = open_hdf5_file(base_filepath)
         self.base_file_voltage_traces = self.base_file['Data']['Recording_0']['AnalogStream']['Stream_0']['ChannelData']
         self.sampling_frequency = 1000000 / \
                              self.base_file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel']['Tick'][0]
@@ -22,9 +78,12 @@ class SCDataReader:
         self.spiketimes = self.retrieve_spiketimes()
         self.mua_spikes = self.retrieve_mua_spikes()
         params = CircusParser(base_filepath)
-        self.dead_channels = params.get('detection', 'dead_channels')
-        if len(self.dead_channels) > 1:
-            self.dead_channels = [int(s) for s in self.dead_channels[5:-2].split(',')]
+        self.dead_channels = parse_dead_channels(params.get('detection', 'dead_channels'))
+        # the preprocessing of SC, which the spike check repeats (see preprocessing_engine.py)
+        self.cut_off = parse_cut_off(params.get('filtering', 'cut_off'), self.sampling_frequency)
+        self.remove_median = params.getboolean('filtering', 'remove_median')
+        # the median of every channel is subtracted per chunk of chunk_size seconds
+        self.chunk_size = parse_chunk_size(params.get('data', 'chunk_size'))
 
     def retrieve_mua_spikes(self):
         mua_filename = self.filename_prefix + ".mua.hdf5"
@@ -0,0 +1,25 @@
+from PyQt5 import QtCore
+
+from file_handling.recording_catalog import RecordingCatalog
+
+
+class CatalogScanThread(QtCore.QThread):
+    operation_changed = QtCore.pyqtSignal(str)
+    progress_made = QtCore.pyqtSignal(float)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent, folder, catalog_path=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.catalog_path = catalog_path
+
+    def run(self):
+        self.operation_changed.emit('Scanning ' + self.folder + ' ...')
+        # the thread opens its own connection to the catalog
+        catalog = RecordingCatalog(self.catalog_path)
+        try:
+            for progress in catalog.scan(self.folder):
+                self.progress_made.emit(progress)
+        finally:
+            catalog.close()
+        self.finished.emit()
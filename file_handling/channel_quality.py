@@ -0,0 +1,125 @@
+import argparse
+import numpy as np
+from scipy.signal import sosfiltfilt
+
+from filtering.filter_engine import design_sos
+from filtering.filter_settings import FilterSettings
+from file_handling.recording_reader import open_recording
+
+
+# In this script dead and disturbed channels are recognized without any SpyKING CIRCUS results. A few short probe windows
+# spread over the recording are read (all channels at once), so only a small part of the recording has to be read and
+# a recording is checked within seconds. A channel is flagged as
+#   flat:        its signal hardly changes (e.g. an electrode without contact or a disconnected channel),
+#   saturated:   many samples are stuck at the extreme values of the channel (the amplifier is clipping),
+#   line noise:  most of its power lies at the mains frequency and its harmonics,
+#   noisy:       its noise level (after a 300 Hz highpass) is far above the noise level of the other channels.
+
+class ChannelQuality:
+    GOOD = 0
+    FLAT = 1
+    SATURATED = 2
+    LINE_NOISE = 3
+    NOISY = 4
+
+    names = {GOOD: 'good', FLAT: 'flat', SATURATED: 'saturated', LINE_NOISE: 'line noise', NOISY: 'noisy'}
+
+
+def get_line_noise_fraction(probes, fs, line_frequency, n_harmonics=3, bandwidth=5.0):
+    """
+    :param probes: probe windows with shape (probes, channels, samples)
+    :param fs: sampling frequency in Hz
+    :param line_frequency: mains frequency in Hz (50 or 60)
+    :param bandwidth: minimal width of the band around every harmonic in Hz
+    :return: fraction of the power (above 1 Hz) of every channel which lies at the mains frequency and its harmonics
+    """
+    n_samples = probes.shape[-1]
+    # The Hann window spreads a pure tone over its main lobe, two frequency bins on both sides of the tone. For short
+    # probes (0.2 s give 5 Hz bins) the band has to cover the whole main lobe, otherwise a third of the line noise
+    # power is missed.
+    bandwidth = max(bandwidth, 4 * fs / n_samples)
+    window = np.hanning(n_samples)
+    spectra = np.abs(np.fft.rfft((probes - probes.mean(axis=-1, keepdims=True)) * window, axis=-1)) ** 2
+    power = spectra.sum(axis=0)  # sum of all probes, shape (channels, frequencies)
+    frequencies = np.fft.rfftfreq(n_samples, 1 / fs)
+    line_band = np.zeros(frequencies.shape, dtype=bool)
+    for harmonic in range(1, n_harmonics + 1):
+        line_band |= np.abs(frequencies - harmonic * line_frequency) <= bandwidth / 2 * (1 + 1e-9)
+    total_power = power[:, frequencies >= 1.0].sum(axis=-1)
+    return power[:, line_band].sum(axis=-1) / np.maximum(total_power, 1e-30)
+
+
+def assess_channel_quality(reader, n_probes=10, probe_duration=0.2, line_frequency=50.0, flat_std=0.5,
+                           saturation_fraction=0.01, line_noise_fraction=0.5, noise_factor=5.0,
+                           highpass_cutoff=300.0, should_stop=None):
+    """
+    :param reader: reader of the recording (see recording_reader.py)
+    :param n_probes: number of probe windows, spread evenly over the recording
+    :param probe_duration: duration of every probe window in seconds
+    :param line_frequency: mains frequency in Hz
+    :param flat_std: channels whose standard deviation is below this value (in uV) are flat
+    :param saturation_fraction: channels with more than this fraction of samples at their minimum or maximum are
+    saturated
+    :param line_noise_fraction: channels with more than this fraction of their power at the mains frequency (and
+    harmonics) are dominated by line noise
+    :param noise_factor: channels whose noise level is more than noise_factor times the median noise level of all
+    channels are noisy
+    :param should_stop: function returning True if the assessment should be cancelled
+    :return: quality (ChannelQuality) of every row of the recording and dictionary of the measures the quality is based
+    on ('std', 'saturation', 'line_noise' and 'noise' (uV), one value per row), None if cancelled
+    """
+    dataset = reader.voltage_traces_dataset
+    n_channels, n_samples = dataset.shape
+    fs = reader.sampling_frequency
+    probe_samples = max(1, min(int(probe_duration * fs), n_samples))
+    n_probes = max(1, min(n_probes, n_samples // probe_samples))
+    starts = np.linspace(0, n_samples - probe_samples, n_probes).astype(np.int64)
+    # raw values are kept for the saturation check, all other measures are computed in uV
+    raw_probes = []
+    for start in starts:
+        if should_stop is not None and should_stop():
+            return None
+        raw_probes.append(np.asarray(dataset[:, start:start + probe_samples]))
+    raw_probes = np.stack(raw_probes)
+    probes = reader.scale(raw_probes)
+
+    std = np.median(probes.std(axis=-1), axis=0)
+    # samples equal to the minimum or maximum of the channel (over all probes)
+    channel_min = raw_probes.min(axis=(0, 2))[None, :, None]
+    channel_max = raw_probes.max(axis=(0, 2))[None, :, None]
+    at_extremes = np.count_nonzero((raw_probes == channel_min) | (raw_probes == channel_max), axis=(0, 2))
+    saturation = at_extremes / (n_probes * probe_samples)
+    line_noise = get_line_noise_fraction(probes, fs, line_frequency)
+
+    filtered = probes - probes.mean(axis=-1, keepdims=True)
+    if highpass_cutoff < fs / 2:
+        sos = design_sos(FilterSettings.Mode.HIGHPASS, float(highpass_cutoff), None, float(fs), 4)
+        if probe_samples > 3 * (2 * len(sos) + 1):
+            filtered = sosfiltfilt(sos, filtered, axis=-1)
+    noise = np.median(np.median(np.abs(filtered), axis=-1) / 0.6745, axis=0)
+
+    quality = np.full(n_channels, ChannelQuality.GOOD)
+    flat = std < flat_std
+    quality[flat] = ChannelQuality.FLAT
+    saturated = ~flat & (saturation > saturation_fraction)
+    quality[saturated] = ChannelQuality.SATURATED
+    line_noisy = ~flat & ~saturated & (line_noise > line_noise_fraction)
+    quality[line_noisy] = ChannelQuality.LINE_NOISE
+    # the typical noise level is taken from the channels which are neither flat nor saturated
+    reference_noise = np.median(noise[~flat & ~saturated]) if np.any(~flat & ~saturated) else np.inf
+    quality[(quality == ChannelQuality.GOOD) & (noise > noise_factor * reference_noise)] = ChannelQuality.NOISY
+    return quality, dict(std=std, saturation=saturation, line_noise=line_noise, noise=noise)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Lists the dead and disturbed channels of recordings.')
+    parser.add_argument('recordings', nargs='+', help='paths of MCS .h5 or flat binary / .npy recordings')
+    parser.add_argument('--line-frequency', type=float, default=50.0, help='mains frequency in Hz')
+    arguments = parser.parse_args()
+    for recording_path in arguments.recordings:
+        recording_reader = open_recording(recording_path)
+        channel_quality, _ = assess_channel_quality(recording_reader, line_frequency=arguments.line_frequency)
+        bad_channels = [label + ' (' + ChannelQuality.names[channel_quality[row]] + ')' for label, row in
+                        zip(recording_reader.labels, recording_reader.channel_ids)
+                        if channel_quality[row] != ChannelQuality.GOOD]
+        print(recording_path + ': ' + (', '.join(bad_channels) if len(bad_channels) > 0 else 'no bad channels'))
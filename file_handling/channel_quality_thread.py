@@ -0,0 +1,29 @@
+from PyQt5 import QtCore
+
+from file_handling.channel_quality import assess_channel_quality
+
+
+class ChannelQualityThread(QtCore.QThread):
+    """
+    Checks all channels of a recording for dead and disturbed channels (see channel_quality.py) in the background, can
+    be cancelled with abort()
+    """
+    operation_changed = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent, reader):
+        super().__init__(parent)
+        self.reader = reader
+        self.aborted = False
+        self.quality = None
+        self.measures = None
+
+    def abort(self):
+        self.aborted = True
+
+    def run(self):
+        self.operation_changed.emit('Checking channel quality...')
+        result = assess_channel_quality(self.reader, should_stop=lambda: self.aborted)
+        if result is not None:
+            self.quality, self.measures = result
+        self.finished.emit()
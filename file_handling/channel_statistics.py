@@ -0,0 +1,158 @@
+import os
+import h5py
+import numpy as np
+
+from utility.adc_histogram import AdcHistogram, accumulate_adc_histograms
+
+
+# In this script the statistics of all channels of a recording (median, MAD, noise level for thresholds, mean, standard
+# deviation, RMS, minimum, maximum and percentiles) are computed in a single sequential pass over ChannelData and stored
+# in a sidecar file next to the recording (<recording>_stats.h5). They all follow exactly from the histograms of the raw
+# ADC steps (see adc_histogram.py), which are stored as well, so further percentiles or the value histogram of a channel
+# are available without reading the recording again. The size and modification time of the recording are stored with
+# the statistics, statistics of an older version of the recording are not used.
+
+PERCENTILES = np.array([0.1, 1.0, 5.0, 25.0, 50.0, 75.0, 95.0, 99.0, 99.9])
+
+# values of every channel, all in uV
+STATISTICS_NAMES = ['median', 'mad', 'noise', 'mean', 'std', 'rms', 'min', 'max']
+
+
+def get_statistics_path(recording_path):
+    return os.path.splitext(recording_path)[0] + '_stats.h5'
+
+
+def get_source_signature(source_path):
+    stat = os.stat(source_path)
+    return float(stat.st_mtime), int(stat.st_size)
+
+
+def summarize_histogram(histogram, zero, gain):
+    """
+    :param histogram: AdcHistogram of a channel
+    :param zero: raw value of 0 uV
+    :param gain: uV per raw step
+    :return: dictionary with the STATISTICS_NAMES and 'percentiles' (at PERCENTILES), all in uV. 'mad' is the median
+    absolute deviation from the median, 'noise' the noise level of the MAD thresholds (median(|trace|) / 0.6745)
+    """
+    values = histogram.get_values().astype(np.float64) - zero
+    counts = histogram.counts.astype(np.float64)
+    n = max(counts.sum(), 1)
+    raw_median = histogram.get_median()
+    mean = np.dot(counts, values) / n
+    return dict(median=(raw_median - zero) * gain,
+                mad=histogram.get_absolute_deviation_median(raw_median) * gain,
+                noise=histogram.get_absolute_deviation_median(zero) * gain / 0.6745,
+                mean=mean * gain,
+                std=np.sqrt(np.dot(counts, (values - mean) ** 2) / n) * gain,
+                rms=np.sqrt(np.dot(counts, values ** 2) / n) * gain,
+                min=values[0] * gain,
+                max=values[-1] * gain,
+                percentiles=(histogram.get_percentiles(PERCENTILES) - zero) * gain)
+
+
+def compute_channel_statistics(reader, statistics_path, block_bytes=2**26, should_stop=None):
+    """
+    Computes the statistics of all channels in one pass and writes them to statistics_path. This is a generator, which
+    yields the progress in percent after every block.
+    :param reader: reader of the recording (see recording_reader.py), its values have to be raw integers
+    :param statistics_path: path of the sidecar file, an existing file is replaced
+    :param should_stop: function returning True if the computation should be cancelled (nothing is written then)
+    """
+    raw_scaling = reader.get_raw_scaling()
+    if raw_scaling is None:
+        raise ValueError('The statistics can only be computed from raw integer values')
+    zero, gain = raw_scaling
+    dataset = reader.voltage_traces_dataset
+    n_channels, n_samples = dataset.shape
+    histograms = [AdcHistogram() for _ in range(n_channels)]
+    for progress in accumulate_adc_histograms(histograms, dataset, list(range(n_channels)), block_bytes):
+        if should_stop is not None and should_stop():
+            return
+        yield progress
+
+    summaries = [summarize_histogram(histogram, zero, gain) for histogram in histograms]
+    with h5py.File(statistics_path, 'w') as file:
+        file.attrs['complete'] = False
+        file.attrs['n_channels'] = n_channels
+        file.attrs['n_samples'] = n_samples
+        file.attrs['source_mtime'], file.attrs['source_size'] = get_source_signature(reader.file_path)
+        file.attrs['zero'], file.attrs['gain'] = zero, gain
+        for name in STATISTICS_NAMES:
+            file.create_dataset(name, data=np.array([summary[name] for summary in summaries], dtype=np.float64))
+        file.create_dataset('percentiles', data=np.array([summary['percentiles'] for summary in summaries]))
+        file['percentiles'].attrs['percentiles'] = PERCENTILES
+        # the histograms have different lengths, so they are stored one after the other: the counts of row i are
+        # histogram_counts[histogram_starts[i]:histogram_starts[i + 1]] and belong to the raw values from
+        # histogram_offsets[i] on
+        file.create_dataset('histogram_counts', data=np.concatenate([histogram.counts for histogram in histograms]))
+        file.create_dataset('histogram_starts',
+                            data=np.concatenate([[0], np.cumsum([histogram.counts.size for histogram in histograms])]))
+        file.create_dataset('histogram_offsets', data=np.array([histogram.offset for histogram in histograms],
+                                                               dtype=np.int64))
+        file.attrs['complete'] = True
+
+
+class ChannelStatistics:
+    """
+    The ChannelStatistics hold the statistics of all channels of a recording read from its sidecar file, every
+    statistic is a numpy array with one value per row of ChannelData
+    """
+    def __init__(self, statistics_path):
+        with h5py.File(statistics_path, 'r') as file:
+            self.attrs = dict(file.attrs)
+            self.zero, self.gain = self.attrs['zero'], self.attrs['gain']
+            for name in STATISTICS_NAMES:
+                setattr(self, name, file[name][:])
+            self.percentiles = file['percentiles'][:]
+            self.histogram_counts = file['histogram_counts'][:]
+            self.histogram_starts = file['histogram_starts'][:]
+            self.histogram_offsets = file['histogram_offsets'][:]
+
+    @staticmethod
+    def open(recording_path, n_channels, n_samples):
+        """
+        :return: the ChannelStatistics of the recording or None if there are no complete statistics for the current
+        version of the recording
+        """
+        statistics_path = get_statistics_path(recording_path)
+        if not os.path.exists(statistics_path):
+            return None
+        try:
+            statistics = ChannelStatistics(statistics_path)
+        except (OSError, KeyError):
+            return None
+        if not statistics.attrs.get('complete', False) or \
+                not statistics.matches_source(recording_path, (n_channels, n_samples)):
+            return None
+        return statistics
+
+    def matches_source(self, source_path, shape):
+        """
+        :return: True if the statistics were computed from the current version of the file at source_path and from a
+        matrix with the given shape (channels, samples)
+        """
+        if not self.has_shape(shape) or not os.path.exists(source_path):
+            return False
+        return (self.attrs['source_mtime'], self.attrs['source_size']) == get_source_signature(source_path)
+
+    def has_shape(self, shape):
+        """
+        :return: True if the statistics were computed from a matrix with the given shape (channels, samples)
+        """
+        return (self.attrs['n_channels'], self.attrs['n_samples']) == tuple(shape)
+
+    def get_histogram(self, row):
+        """
+        :return: AdcHistogram of the raw values of the channel in the given row
+        """
+        histogram = AdcHistogram()
+        histogram.offset = int(self.histogram_offsets[row])
+        histogram.counts = self.histogram_counts[self.histogram_starts[row]:self.histogram_starts[row + 1]]
+        return histogram
+
+    def get_percentile(self, row, q):
+        """
+        :return: percentile q (0 to 100) of the channel in the given row in uV, also for percentiles not in PERCENTILES
+        """
+        return (float(self.get_histogram(row).get_percentiles(q)) - self.zero) * self.gain
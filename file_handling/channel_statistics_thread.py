@@ -0,0 +1,35 @@
+from PyQt5 import QtCore
+
+from file_handling.channel_statistics import compute_channel_statistics, get_statistics_path
+
+
+class ChannelStatisticsThread(QtCore.QThread):
+    """
+    Computes the statistics of all channels of a recording (see channel_statistics.py) in the background, can be
+    cancelled with abort()
+    """
+    operation_changed = QtCore.pyqtSignal(str)
+    progress_made = QtCore.pyqtSignal(float)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent, reader):
+        super().__init__(parent)
+        self.reader = reader
+        self.statistics_path = get_statistics_path(reader.file_path)
+        self.aborted = False
+        self.succeeded = False
+
+    def abort(self):
+        self.aborted = True
+
+    def run(self):
+        self.operation_changed.emit('Computing channel statistics...')
+        try:
+            for progress in compute_channel_statistics(self.reader, self.statistics_path,
+                                                       should_stop=lambda: self.aborted):
+                self.progress_made.emit(progress)
+            self.succeeded = not self.aborted
+        except OSError:
+            # without write access to the folder of the recording the analyses compute their statistics themselves
+            self.succeeded = False
+        self.finished.emit()
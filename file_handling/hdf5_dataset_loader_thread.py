@@ -1,74 +1,130 @@
-from PyQt5 import QtCore, QtWidgets
+from PyQt5 import QtCore
+import queue
+import threading
 import numpy as np
-import time
-from IPython import embed
+
+
+# In this script a dataset (e.g. ChannelData) is loaded block by block. Two buffers are used in turns: while the worker
+# hands out one block, a reader thread already reads the next block into the other buffer with read_direct (which
+# reads straight into the preallocated buffer, no temporary array is created). The blocks are read in the native dtype
+# of the dataset and consist of whole HDF5 chunks, so the file is read sequentially and every chunk only once.
+
+def plan_loader_blocks(dataset, target_bytes=2**25):
+    """
+    :param dataset: h5py dataset with shape (channels, samples)
+    :param target_bytes: approximate size of one block
+    :return: number of samples per block, a multiple of the chunk length of the dataset
+    """
+    n_channels, n_samples = dataset.shape
+    chunk_samples = dataset.chunks[1] if dataset.chunks is not None else 1
+    bytes_per_chunk = max(n_channels * chunk_samples * dataset.dtype.itemsize, 1)
+    block_samples = max(1, target_bytes // bytes_per_chunk) * chunk_samples
+    return int(max(1, min(block_samples, n_samples)))
 
 
 class Worker(QtCore.QObject):
-    # worker_id, step_description: emitted every step through work() loop
+    # progress, start, stop and block: emitted for every loaded block
     signal_step = QtCore.pyqtSignal(list)
-    # worker id: emitted at the end of work()
+    # worker id and loaded traces (None if they were not kept): emitted at the end of work()
     signal_done = QtCore.pyqtSignal(list)
     # message to be shown to the user:
     signal_message = QtCore.pyqtSignal(str)
 
-    def __init__(self, name, reader):
+    def __init__(self, name, reader, keep_traces=True, target_block_bytes=2**25):
+        """
+        :param name: id of the worker, sent with signal_done
+        :param reader: McsDataReader of the recording
+        :param keep_traces: if True the whole dataset is collected in voltage_traces (in its native dtype), otherwise
+        the blocks are only handed out with signal_step
+        :param target_block_bytes: approximate size of one block
+        """
         super().__init__()
         self.reader = reader
         self.voltage_traces_dataset = self.reader.voltage_traces_dataset  # just a pointer to the dataset as a whole
         self.__name = name
-        self.__abort = False
-        self.app = QtWidgets.QApplication.instance()
+        self.keep_traces = keep_traces
+        self.target_block_bytes = target_block_bytes
+        # abort() may be called from any thread (directly, not via a queued signal), the event is checked before every
+        # block by the worker and by its reader thread
+        self.__abort = threading.Event()
         self.voltage_traces = None
 
-    @QtCore.pyqtSlot()
-    def work(self):
+    def read_blocks(self, blocks, free_buffers, filled_buffers):
         """
-        Pretend this worker method does work that takes a long time. During this time, the thread's
-        event loop is blocked, except if the application's processEvents() is called: this gives every
-        thread (incl. main) a chance to process events, which in this sample means processing signals
-        received from GUI (such as abort).
+        Runs in the reader thread: reads the blocks into the free buffers and passes them on to the worker
         """
+        dataset = self.voltage_traces_dataset
+        try:
+            for start, stop in blocks:
+                buffer = free_buffers.get()
+                if self.__abort.is_set():
+                    break
+                dataset.read_direct(buffer, source_sel=np.s_[:, start:stop], dest_sel=np.s_[:, :stop - start])
+                filled_buffers.put((start, stop, buffer))
+            filled_buffers.put(None)
+        except Exception as error:
+            # the worker raises the error again in its own thread
+            filled_buffers.put(error)
+
+    @QtCore.pyqtSlot()
+    def work(self):
         thread_name = QtCore.QThread.currentThread().objectName()
         thread_id = int(QtCore.QThread.currentThreadId())  # cast to int() is necessary
         self.signal_message.emit('Running worker #{} from thread "{}" (#{})'.format(self.__name, thread_name, thread_id))
 
-        # before looping through chunks, create np.empty in the shape of whole voltage trace matrix
-        # hopefully s will be shape-like tuple/list, then, the assignment to the np.empty-matrix
-        # should be accessible through s
-        shape_of_vt_dataset = self.voltage_traces_dataset.shape
+        dataset = self.voltage_traces_dataset
+        n_channels, n_samples = dataset.shape
+        block_samples = plan_loader_blocks(dataset, self.target_block_bytes)
+        blocks = [(start, min(start + block_samples, n_samples)) for start in range(0, n_samples, block_samples)]
         try:
-            self.voltage_traces = np.empty(shape_of_vt_dataset)
-            chunk_lens = []
-            chunk_size = self.voltage_traces_dataset.chunks[1]
-            steps = int(np.ceil(shape_of_vt_dataset[1] / chunk_size))
-            chunk_iterator = np.linspace(0, chunk_size * steps, steps)
-            max_index = shape_of_vt_dataset[1] - 1
-            for i, chunk_index in enumerate(chunk_iterator):  # dset = voltage_traces
-                next_index = min((chunk_index + chunk_size), max_index)
-                chunk = self.voltage_traces_dataset[:, int(chunk_index): int(next_index)]
-                self.voltage_traces[:, int(chunk_index):int(next_index)] = chunk
-                chunk_lens.append(len(self.voltage_traces_dataset[:, int(chunk_index): int(next_index)]))
-                time.sleep(0.1)
-                # Here, the progress signal is calculated and then sent to the FilterTab
-                progress = round(((i + 1) / len(chunk_iterator)) * 100.0, 2)
-                self.signal_step.emit([progress, chunk_index, next_index, chunk])
+            if self.keep_traces:
+                self.voltage_traces = np.empty(dataset.shape, dtype=dataset.dtype)
+            buffers = [np.empty((n_channels, block_samples), dtype=dataset.dtype) for _ in range(2)]
+        except MemoryError:
+            self.signal_message.emit('Cannot load the whole trace at once, processing time will be slower than usual')
+            self.voltage_traces = None
+            self.signal_done.emit([self.__name, None])
+            return
 
-                # check if we need to abort the loop; need to process events to receive signals;
-                self.app.processEvents()  # this could cause change to self.__abort
+        free_buffers, filled_buffers = queue.Queue(), queue.Queue()
+        for buffer in buffers:
+            free_buffers.put(buffer)
+        reader_thread = threading.Thread(target=self.read_blocks, args=(blocks, free_buffers, filled_buffers),
+                                         daemon=True)
+        reader_thread.start()
 
-        except MemoryError:
-            print('cannot load the whole trace at once, processing time will be slower than usual')
-            self.abort()
+        block_index = 0
+        try:
+            while True:
+                item = filled_buffers.get()
+                if item is None:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                start, stop, buffer = item
+                if self.keep_traces:
+                    self.voltage_traces[:, start:stop] = buffer[:, :stop - start]
+                    block = self.voltage_traces[:, start:stop]
+                else:
+                    # the buffer is reused for the next blocks, so the receiver gets its own copy
+                    block = buffer[:, :stop - start].copy()
+                free_buffers.put(buffer)
+                block_index += 1
+                progress = round(block_index / len(blocks) * 100.0, 2)
+                self.signal_step.emit([progress, start, stop, block])
+                if self.__abort.is_set():
+                    break
+        finally:
+            if block_index < len(blocks):
+                # stop the reader thread, the extra buffer wakes it up if it waits for a free one
+                self.__abort.set()
+                free_buffers.put(buffers[0])
+            reader_thread.join()
 
-        if self.__abort:
-            # note that "step" value will not necessarily be same for every thread
-            try:
-                self.signal_message.emit('Worker #{} aborting work at step {}'.format(self.__name, i))
-            except UnboundLocalError:
-                self.signal_message.emit('Worker #{} aborting work at step {}'.format(self.__name, 0))
+        if block_index < len(blocks):
+            self.signal_message.emit('Worker #{} aborting work at block {}'.format(self.__name, block_index))
         self.signal_done.emit([self.__name, self.voltage_traces])
 
     def abort(self):
         self.signal_message.emit('Worker #{} notified to abort'.format(self.__name))
-        self.__abort = True
+        self.__abort.set()
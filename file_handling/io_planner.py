@@ -0,0 +1,112 @@
+import numpy as np
+import h5py
+
+
+# In this script the reads of ChannelData are planned according to its chunk layout. MCS files often store ChannelData
+# in time-major chunks, i.e. one chunk holds a short time span of all channels. Reading a single channel then touches
+# every chunk of the file, and if a chunk is larger than the chunk cache of HDF5 (1 MiB by default, 8 MiB since HDF5
+# 2.0), a chunk is even read and decompressed again for every channel that is taken from it. Therefore the files are
+# opened with a chunk cache that holds all chunks of one time span of all channels, and windows of several channels are
+# read as one contiguous block of rows, if the chunks contain these rows anyway. Channel-major files (chunks of one
+# channel, see transcode_recording.py) are read row by row, so only the requested channels are read from disk.
+
+MCS_CHANNEL_DATA_PATH = 'Data/Recording_0/AnalogStream/Stream_0/ChannelData'
+
+MAX_CHUNK_CACHE_BYTES = 2**28
+
+
+def get_chunk_cache_parameters(shape, chunks, itemsize, current_bytes=0, max_bytes=MAX_CHUNK_CACHE_BYTES):
+    """
+    :param shape: shape of the dataset (channels, samples)
+    :param chunks: chunk shape of the dataset (None for contiguous datasets)
+    :param itemsize: bytes per value
+    :param current_bytes: size of the chunk cache the file was opened with
+    :param max_bytes: upper limit for the size of the cache
+    :return: size of the chunk cache in bytes and number of its hash slots, None if the current cache is sufficient
+    """
+    if chunks is None:
+        return None
+    chunk_bytes = int(np.prod(chunks)) * itemsize
+    # all chunks of one time span of all channels, so every chunk is read only once, no matter if a single channel or a
+    # window of all channels is read
+    chunks_per_time_span = -(-shape[0] // chunks[0])
+    cache_bytes = min(max(chunks_per_time_span * chunk_bytes, chunk_bytes), max_bytes)
+    if cache_bytes <= current_bytes:
+        return None
+    # HDF5 recommends about 100 times as many hash slots as chunks fit into the cache, ideally a prime number
+    n_slots = get_next_prime(100 * max(1, cache_bytes // chunk_bytes))
+    return cache_bytes, n_slots
+
+
+def get_next_prime(n):
+    n = max(2, int(n))
+    while any(n % divisor == 0 for divisor in range(2, int(np.sqrt(n)) + 1)):
+        n += 1
+    return n
+
+
+def open_hdf5_file(path, dataset_path=MCS_CHANNEL_DATA_PATH):
+    """
+    Opens a HDF5 file for reading, with a chunk cache sized to the chunks of the given dataset
+    :param path: path of the file
+    :param dataset_path: dataset whose chunk layout determines the cache, e.g. ChannelData of a MCS recording
+    :return: opened h5py.File
+    """
+    file = h5py.File(path, 'r')
+    dataset = file.get(dataset_path)
+    if not isinstance(dataset, h5py.Dataset) or len(dataset.shape) != 2:
+        return file
+    current_bytes = file.id.get_access_plist().get_cache()[2]
+    cache_parameters = get_chunk_cache_parameters(dataset.shape, dataset.chunks, dataset.dtype.itemsize, current_bytes)
+    if cache_parameters is None:
+        return file
+    # the cache can only be set when the file is opened, so the file is opened again (if the file is still open
+    # elsewhere in this process, HDF5 shares that file and keeps its cache)
+    file.close()
+    cache_bytes, n_slots = cache_parameters
+    return h5py.File(path, 'r', rdcc_nbytes=cache_bytes, rdcc_nslots=n_slots)
+
+
+class ReadStrategy:
+    ROWS = 'rows'  # only the requested rows are read (fancy indexing)
+    ROW_BLOCK = 'row_block'  # all rows from the first to the last requested row are read, the others are dropped
+
+
+def plan_row_read(dataset, rows, n_samples, max_block_bytes=2**28):
+    """
+    :param dataset: h5py dataset or numpy array with shape (channels, samples)
+    :param rows: sorted, unique rows that are requested
+    :param n_samples: number of samples that are requested per row
+    :param max_block_bytes: a row block is only read if it is smaller than this
+    :return: ReadStrategy
+    """
+    if not isinstance(dataset, h5py.Dataset) or len(rows) < 2:
+        return ReadStrategy.ROWS
+    n_block_rows = int(rows[-1] - rows[0] + 1)
+    if n_block_rows * n_samples * dataset.dtype.itemsize > max_block_bytes:
+        return ReadStrategy.ROWS
+    if len(rows) == n_block_rows:
+        # consecutive rows, the block is exactly the selection
+        return ReadStrategy.ROW_BLOCK
+    chunk_rows = dataset.chunks[0] if dataset.chunks is not None else 1
+    # the rows between the requested ones are read from disk anyway, if they share chunks with them (time-major
+    # layout), or if most of them are requested. Reading them as one block avoids the slow selection of single rows
+    if chunk_rows >= n_block_rows or len(rows) >= n_block_rows / 2:
+        return ReadStrategy.ROW_BLOCK
+    return ReadStrategy.ROWS
+
+
+def read_rows(dataset, rows, start=None, stop=None):
+    """
+    Reads the samples between start and stop of the given rows with the strategy of plan_row_read
+    :param dataset: h5py dataset or numpy array with shape (channels, samples)
+    :param rows: requested rows (any order, duplicates allowed)
+    :return: array with shape (len(rows), samples) in the dtype of the dataset, rows in the requested order
+    """
+    # h5py needs increasing indices for fancy indexing, so the rows are read sorted and reordered afterwards
+    sorted_rows, inverse = np.unique(np.asarray(rows, dtype=int), return_inverse=True)
+    n_samples = len(range(*slice(start, stop).indices(dataset.shape[1])))
+    if plan_row_read(dataset, sorted_rows, n_samples) == ReadStrategy.ROW_BLOCK:
+        block = dataset[sorted_rows[0]:sorted_rows[-1] + 1, start:stop]
+        return block[sorted_rows[inverse] - sorted_rows[0]]
+    return dataset[list(sorted_rows), start:stop][inverse]
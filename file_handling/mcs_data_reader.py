@@ -2,53 +2,78 @@ import numpy as np
 import h5py
 import time
 
+from file_handling.io_planner import open_hdf5_file, read_rows
+from file_handling.recording_reader import RecordingReader
 from utility.channel_utility import ChannelUtility
 
 
-class McsDataReader:
-    def __init__(self, path):
-        self.file_path = path
-        self.filename = path.split('/')[-1]
+class McsDataReader(RecordingReader):
+    def __init__(self, path, lazy=True):
+        # in lazy mode only the handle of the ChannelData dataset is kept and single channels or time windows are read
+        # from disk once they are requested, in eager mode the whole matrix is loaded into memory while opening
+        super().__init__(path, lazy)
         t0 = time.time()
         self.file = self.open_mea_file()
         t1 = time.time() - t0
+        self.conversion_factor, self.exponent = 1.0, 0  # identity, used if traces are already scaled
         try:
-            self.voltage_traces, self.sampling_frequency, self.duration = self.get_data_of_file()
+            self.voltage_traces_dataset, self.sampling_frequency, self.duration = self.get_data_of_file()
+            self.conversion_factor, self.exponent = self.get_scaling()
         except KeyError:
-            self.voltage_traces = self.file['scaled']
+            self.voltage_traces_dataset = self.file['scaled']
             self.sampling_frequency = 25000.0
             self.duration = 600.0
+        if self.lazy:
+            # h5py datasets support len() and indexing like numpy arrays, so all code that uses voltage_traces as a
+            # matrix keeps working, but only the indexed hyperslab is read
+            self.voltage_traces = self.voltage_traces_dataset
+        else:
+            self.voltage_traces = self.voltage_traces_dataset[:]
         try:
-            self.channel_ids, self.labels = self.get_channel_ids()
+            channel_ids, labels = self.get_channel_ids()
         except KeyError:
-            self.channel_ids = range(252)
+            channel_ids = range(252)
             channel_utility = ChannelUtility()
-            self.labels = channel_utility.get_channel_labels()
+            labels = channel_utility.get_channel_labels()
+        # InfoChannel is read only once, afterwards the row of a channel in ChannelData is looked up by its label
+        self.set_channels(channel_ids, labels)
 
-    def get_channel_id(self, label):
-        for ch in self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel']:
-            if label == ch[4].decode('utf8'):
-                return ch[1]
-
-    def get_scaled_channel(self, label):
-        # so far unclear: will this be done once? -> might be difficult regarding memory
-        # do this for each single channel while the channel is needed -> function has to be called each time when
-        # signal is needed
-        id_by_label = self.get_channel_id(label)
-        vt = self.voltage_traces[id_by_label]
+    def get_scaling(self):
         conversion_factor = \
             self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel'][0]['ConversionFactor']
-        exponent = self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel'][0]['Exponent'] + 6
         # 6 = pV -> uV
-        scaled_trace = vt * conversion_factor * np.power(10.0, exponent)
-        return scaled_trace
+        exponent = self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel'][0]['Exponent'] + 6
+        return conversion_factor, exponent
+
+    def scale(self, raw):
+        """
+        Converts raw ADC values of ChannelData into uV
+        :param raw: numpy array of raw values (any shape)
+        :return: scaled values as float64 array
+        """
+        return raw * self.conversion_factor * np.power(10.0, self.exponent)
+
+    def get_raw_scaling(self):
+        gain = float(self.conversion_factor * np.power(10.0, self.exponent))
+        if self.voltage_traces_dataset.dtype.kind not in 'iu' or gain <= 0:
+            return None
+        return 0, gain
+
+    def read_rows(self, rows, start=None, stop=None):
+        # the read strategy depends on the chunk layout of ChannelData, see io_planner.py
+        return read_rows(self.voltage_traces, rows, start, stop)
+
+    def close(self):
+        super().close()
+        self.file.close()
 
     def open_mea_file(self):
-        file = h5py.File(self.file_path, 'r')
+        # the chunk cache is sized to the chunks of ChannelData, so every chunk is read only once per request
+        file = open_hdf5_file(self.file_path)
         return file
 
     def get_data_of_file(self):
-        voltage_traces = self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['ChannelData'][:]
+        voltage_traces = self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['ChannelData']
         sampling_frequency = 1000000 / \
                              self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel']['Tick'][0]
         duration_index = self.file['Data']['Recording_0']['AnalogStream']['Stream_0']['ChannelDataTimeStamps'][0][2]
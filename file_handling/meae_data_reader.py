@@ -12,6 +12,9 @@ class MeaeDataReader:
             self.sampling_frequency = self.file['fs'][()]
         if 'channel_labels' in list(self.file.keys()):
             self.channel_labels = self.file['channel_labels']
+        if 'filter_labels' in list(self.file.keys()):
+            # labels of the rows of the 'filter' dataset, written by the MeaeDataWriter
+            self.channel_labels = [label.decode('utf8') for label in self.file['filter_labels'][:]]
 
         filtered = "/filter" in self.file
         if filtered:
@@ -0,0 +1,196 @@
+import numpy as np
+import h5py
+
+
+class MeaeDataWriter:
+    """
+    The MeaeDataWriter writes filtered traces into a .meae file while they are produced. The 'filter' dataset is created
+    before filtering starts (chunked per channel, resizable and compressed) and next to it the number of already
+    filtered samples of every channel is stored. So if MEAsure is closed during filtering, everything written so far is
+    kept and filtering can be resumed.
+    Once all channels are filtered, a decimated copy of the 'filter' dataset can be written into the 'lfp' dataset (see
+    lfp_decimation.py), which low frequency analyses read instead of the full sampling rate traces.
+    """
+    # number of samples per chunk of the 'filter' dataset, every chunk holds samples of only one channel
+    chunk_samples = 2 ** 16
+    # number of samples per chunk of the 'lfp' dataset
+    lfp_chunk_samples = 2 ** 14
+
+    def __init__(self, path):
+        self.file_path = path
+        self.file = h5py.File(path, 'a')
+        self.filter_dataset = None
+        self.rows = None
+
+    @staticmethod
+    def get_filter_state(path, n_samples, filter_parameters):
+        """
+        Checks if a .meae file already holds filtered traces that were created with the given parameters
+        :param path: path of the .meae file
+        :param n_samples: number of samples of the recording
+        :param filter_parameters: dictionary of the filter settings (e.g. FilterSettings.to_dict())
+        :return: None if there is no compatible 'filter' dataset, otherwise a dictionary that maps each channel label
+        to the number of samples which are already filtered
+        """
+        try:
+            with h5py.File(path, 'r') as file:
+                if not MeaeDataWriter.is_compatible(file, n_samples, filter_parameters):
+                    return None
+                labels = [label.decode('utf8') for label in file['filter_labels'][:]]
+                return dict(zip(labels, file['filtered_samples'][:]))
+        except OSError:
+            return None
+
+    @staticmethod
+    def is_compatible(file, n_samples, filter_parameters):
+        if 'filter' not in file or 'filtered_samples' not in file or 'filter_labels' not in file:
+            return False
+        if file['filter'].shape[1] != n_samples:
+            return False
+        for key, value in filter_parameters.items():
+            if key not in file['filter'].attrs or file['filter'].attrs[key] != value:
+                return False
+        return True
+
+    @staticmethod
+    def get_lfp_dataset(file):
+        """
+        :param file: opened .meae file
+        :return: the 'lfp' dataset with the decimated copy of all rows of the 'filter' dataset, None if there is no
+        complete copy
+        """
+        if 'lfp' not in file or 'filter' not in file or not file['lfp'].attrs.get('complete', False):
+            return None
+        if file['lfp'].shape[0] != file['filter'].shape[0]:
+            return None
+        return file['lfp']
+
+    def prepare_filter_dataset(self, labels, n_samples, fs, filter_parameters, append=False, dtype='float32',
+                               compression='lzf'):
+        """
+        Creates (or reuses) the 'filter' dataset and assigns a row to every channel
+        :param labels: labels of the channels that will be filtered
+        :param n_samples: number of samples of the recording
+        :param fs: sampling frequency
+        :param filter_parameters: dictionary of the filter settings, stored as attributes of the dataset
+        :param append: if True, channels that are not in the file yet are added to an existing 'filter' dataset
+        :param dtype: data type of the stored traces, 'float32' halves the file size
+        :param compression: 'lzf' (fast) or 'gzip' (smaller), None for no compression
+        :return: list of rows of the channels in the 'filter' dataset
+        """
+        labels = [str(label) for label in labels]
+        if 'fs' not in self.file:
+            self.file.create_dataset('fs', data=fs)
+        # the 'filter' dataset is going to change, so its decimated copy is outdated
+        if 'lfp' in self.file:
+            del self.file['lfp']
+
+        compatible = MeaeDataWriter.is_compatible(self.file, n_samples, filter_parameters)
+        if compatible and not append:
+            # an earlier run can only be continued if it was started for the same channels
+            existing_labels = [label.decode('utf8') for label in self.file['filter_labels'][:]]
+            compatible = existing_labels == labels
+        if not compatible:
+            for key in ['filter', 'filter_labels', 'filtered_samples']:
+                if key in self.file:
+                    del self.file[key]
+            self.file.create_dataset('filter', shape=(0, n_samples), maxshape=(None, n_samples), dtype=dtype,
+                                     chunks=(1, min(n_samples, MeaeDataWriter.chunk_samples)), shuffle=True,
+                                     compression=compression)
+            for key, value in filter_parameters.items():
+                self.file['filter'].attrs[key] = value
+            self.file.create_dataset('filter_labels', shape=(0,), maxshape=(None,), dtype='S4')
+            self.file.create_dataset('filtered_samples', shape=(0,), maxshape=(None,), dtype=np.int64)
+
+        self.filter_dataset = self.file['filter']
+        existing_labels = [label.decode('utf8') for label in self.file['filter_labels'][:]]
+        self.rows = []
+        for label in labels:
+            if label in existing_labels:
+                self.rows.append(existing_labels.index(label))
+            else:
+                # new channels are appended as new rows
+                row = len(existing_labels)
+                for key in ['filter', 'filter_labels', 'filtered_samples']:
+                    self.file[key].resize(row + 1, axis=0)
+                self.file['filter_labels'][row] = label.encode('utf8')
+                self.file['filtered_samples'][row] = 0
+                existing_labels.append(label)
+                self.rows.append(row)
+        self.file.flush()
+        return self.rows
+
+    def get_resume_sample(self):
+        """
+        :return: index of the first sample that is not yet filtered for all prepared channels
+        """
+        filtered_samples = self.file['filtered_samples'][:]
+        return int(min(filtered_samples[row] for row in self.rows)) if self.rows else 0
+
+    def reset_progress(self):
+        """
+        Marks all prepared channels as not filtered, so they are filtered again from the beginning
+        """
+        filtered_samples = self.file['filtered_samples'][:]
+        filtered_samples[self.rows] = 0
+        self.file['filtered_samples'][:] = filtered_samples
+        self.file.flush()
+
+    def write_time_block(self, start, stop, block, positions=None):
+        """
+        Writes a time block of all (or some) prepared channels and marks it as done
+        :param start: index of first sample of the block
+        :param stop: index after the last sample of the block
+        :param block: numpy array with shape (number of channels, stop - start)
+        :param positions: positions of the channels of the block in the prepared channels, None for all of them
+        """
+        rows = self.rows if positions is None else [self.rows[position] for position in positions]
+        # h5py needs increasing row indices, so rows and the block are sorted accordingly
+        order = np.argsort(rows)
+        sorted_rows = list(np.asarray(rows)[order])
+        self.filter_dataset[sorted_rows, start:stop] = block[order]
+        filtered_samples = self.file['filtered_samples'][:]
+        filtered_samples[sorted_rows] = np.maximum(filtered_samples[sorted_rows], stop)
+        self.file['filtered_samples'][:] = filtered_samples
+        self.file.flush()
+
+    def prepare_lfp_dataset(self, fs, decimation, compression='lzf'):
+        """
+        Creates the 'lfp' dataset for the decimated copy of all rows of the 'filter' dataset (an existing one is
+        replaced). The copy is marked as complete by complete_lfp_dataset once all blocks are written.
+        :param fs: sampling frequency of the decimated traces
+        :param decimation: factor between the sampling frequency of the 'filter' dataset and fs
+        :param compression: 'lzf' (fast) or 'gzip' (smaller), None for no compression
+        :return: the 'lfp' dataset
+        """
+        if 'lfp' in self.file:
+            del self.file['lfp']
+        n_rows, n_samples = self.filter_dataset.shape
+        n_lfp_samples = -(-n_samples // decimation)
+        lfp_dataset = self.file.create_dataset('lfp', shape=(n_rows, n_lfp_samples), dtype='float32',
+                                               chunks=(1, max(1, min(n_lfp_samples, MeaeDataWriter.lfp_chunk_samples))),
+                                               shuffle=True, compression=compression)
+        lfp_dataset.attrs['fs'] = fs
+        lfp_dataset.attrs['decimation'] = decimation
+        lfp_dataset.attrs['complete'] = False
+        return lfp_dataset
+
+    def write_lfp_block(self, start, stop, block):
+        """
+        Writes a decimated time block of all rows of the 'filter' dataset
+        :param start: index of the first decimated sample of the block
+        :param stop: index after the last decimated sample of the block
+        :param block: numpy array with shape (number of rows of the 'filter' dataset, stop - start)
+        """
+        self.file['lfp'][:, start:stop] = block
+
+    def complete_lfp_dataset(self):
+        self.file['lfp'].attrs['complete'] = True
+        self.file.flush()
+
+    def is_complete(self):
+        n_samples = self.filter_dataset.shape[1]
+        return all(self.file['filtered_samples'][row] >= n_samples for row in self.rows)
+
+    def close(self):
+        self.file.close()
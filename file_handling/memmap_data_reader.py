@@ -0,0 +1,119 @@
+import os
+import configparser
+import numpy as np
+
+from file_handling.recording_reader import RecordingReader
+from utility.channel_utility import ChannelUtility
+
+
+# In this script flat binary recordings (interleaved samples of all channels, as consumed by SpyKING CIRCUS) and .npy
+# exports are opened as np.memmap. Nothing is read while opening, the rows of the matrix are views into the mapped
+# file, so the operating system pages in only the parts that are accessed (and keeps them in its page cache).
+# Sampling frequency, number of channels, gain and dtype of flat binary files are not stored in the file itself. They
+# are given to the MemmapDataReader or read from the SpyKING CIRCUS parameter file (<recording>.params, section [data])
+# next to the recording.
+
+MEMMAP_EXTENSIONS = ('.dat', '.raw', '.bin', '.npy')
+
+
+def get_params_path(path):
+    return os.path.splitext(path)[0] + '.params'
+
+
+def get_default_dtype_offset(dtype):
+    # unsigned values are centered around the middle of their range, e.g. 32768 for uint16
+    dtype = np.dtype(dtype)
+    return 2 ** (8 * dtype.itemsize - 1) if dtype.kind == 'u' else 0
+
+
+def read_params_file(path):
+    """
+    Reads the parameters of a flat binary recording from the SpyKING CIRCUS parameter file next to it
+    :param path: path of the recording
+    :return: dictionary with the keyword arguments of MemmapDataReader (without path and lazy)
+    """
+    parser = configparser.ConfigParser(inline_comment_prefixes=('#',))
+    if len(parser.read(get_params_path(path))) == 0 or not parser.has_section('data'):
+        raise ValueError('No parameter file with a [data] section found for ' + path)
+    data = parser['data']
+    try:
+        parameters = dict(sampling_frequency=float(data['sampling_rate']))
+    except (KeyError, ValueError):
+        raise ValueError('The parameter file of ' + path + ' does not contain a valid sampling_rate')
+    if data.get('nb_channels', '').strip() != '':
+        parameters['n_channels'] = int(data['nb_channels'])
+    if data.get('data_dtype', '').strip() != '':
+        parameters['dtype'] = data['data_dtype'].strip()
+    if data.get('gain', '').strip() != '':
+        parameters['gain'] = float(data['gain'])
+    if data.get('dtype_offset', 'auto').strip() not in ['', 'auto']:
+        parameters['dtype_offset'] = float(data['dtype_offset'])
+    if data.get('data_offset', 'auto').strip() not in ['', 'auto']:
+        parameters['data_offset'] = int(data['data_offset'])
+    return parameters
+
+
+class MemmapDataReader(RecordingReader):
+    def __init__(self, path, sampling_frequency, n_channels=None, gain=1.0, dtype='int16', dtype_offset=None,
+                 data_offset=0, labels=None, lazy=True):
+        """
+        :param path: path of a flat binary file (samples of all channels interleaved) or of a .npy file
+        :param sampling_frequency: in Hz
+        :param n_channels: number of channels, required for flat binary files. For .npy files it tells which axis holds
+        the channels (None: the shorter axis)
+        :param gain: uV per raw value
+        :param dtype: dtype of the raw values of flat binary files (.npy files store their dtype)
+        :param dtype_offset: raw value of 0 uV, None = middle of the range for unsigned dtypes, 0 otherwise
+        :param data_offset: bytes before the first sample of flat binary files (e.g. a header)
+        :param labels: channel labels in the order of the channels in the file, None = the labels of the 252 channel MEA
+        for 252 channels, otherwise the channel numbers
+        :param lazy: if False the whole matrix is loaded into memory
+        """
+        super().__init__(path, lazy)
+        self.sampling_frequency = float(sampling_frequency)
+        self.gain = float(gain)
+        if os.path.splitext(path)[1].lower() == '.npy':
+            mapped = np.load(path, mmap_mode='r')
+            if mapped.ndim != 2:
+                raise ValueError('The .npy file ' + path + ' does not contain a matrix')
+            channels_first = mapped.shape[0] == n_channels if n_channels is not None else \
+                mapped.shape[0] <= mapped.shape[1]
+            # the transposed view of a memmap is a memmap as well, nothing is copied
+            matrix = mapped if channels_first else mapped.T
+        else:
+            if n_channels is None:
+                raise ValueError('The number of channels of ' + path + ' is unknown')
+            itemsize = np.dtype(dtype).itemsize
+            n_samples = (os.path.getsize(path) - data_offset) // (itemsize * n_channels)
+            mapped = np.memmap(path, dtype=dtype, mode='r', offset=data_offset, shape=(n_samples, n_channels))
+            matrix = mapped.T
+        self.dtype_offset = get_default_dtype_offset(matrix.dtype) if dtype_offset is None else dtype_offset
+        self.voltage_traces_dataset = matrix
+        self.voltage_traces = matrix if self.lazy else np.array(matrix)
+        self.duration = matrix.shape[1] / self.sampling_frequency
+
+        n_channels = matrix.shape[0]
+        if labels is None:
+            labels = ChannelUtility.get_channel_labels() if n_channels == 252 else \
+                [str(channel) for channel in range(n_channels)]
+        self.set_channels(list(range(n_channels)), list(labels))
+
+    @staticmethod
+    def from_params_file(path, lazy=True):
+        """
+        Opens the recording with the parameters of its SpyKING CIRCUS parameter file
+        """
+        return MemmapDataReader(path, lazy=lazy, **read_params_file(path))
+
+    def scale(self, raw):
+        """
+        Converts raw values of the file into uV
+        :param raw: numpy array of raw values (any shape)
+        :return: scaled values as float64 array
+        """
+        return (np.asarray(raw, dtype=np.float64) - self.dtype_offset) * self.gain
+
+    def get_raw_scaling(self):
+        if self.voltage_traces_dataset.dtype.kind not in 'iu' or self.gain <= 0:
+            return None
+        return self.dtype_offset, self.gain
@@ -0,0 +1,81 @@
+from PyQt5 import QtCore
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import time
+
+from file_handling.recording_catalog import RecordingCatalog
+from file_handling.recording_overview import compute_overview, ReadRateLimiter
+from utility.parallel_executor import ParallelExecutor
+
+
+class OverviewThread(QtCore.QThread):
+    """
+    Computes the activity overviews of recordings in a small pool of threads and stores them in the catalog. The thread
+    is meant to run with low priority in the background: all workers together read at most max_bytes_per_second, they
+    wait while an analysis is running (i.e. a ParallelExecutor is in use) and can be cancelled with abort().
+    """
+    operation_changed = QtCore.pyqtSignal(str)
+    overview_computed = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent, folder, relative_paths, catalog_path=None, max_bytes_per_second=20 * 2**20,
+                 max_workers=2):
+        """
+        :param max_workers: number of recordings that are read at once, while one worker waits for the disk the others
+        filter their windows
+        """
+        super().__init__(parent)
+        self.folder = folder
+        self.relative_paths = relative_paths
+        self.catalog_path = catalog_path
+        self.max_bytes_per_second = max_bytes_per_second
+        self.max_workers = max_workers
+        self.aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+    def should_stop(self):
+        # the overviews wait for running analyses, so they never compete with them for the disk or the cores
+        while ParallelExecutor.is_any_active() and not self.aborted:
+            time.sleep(0.5)
+        return self.aborted
+
+    def compute_overview(self, relative_path, read_limiter):
+        # runs in a worker of the pool
+        if self.should_stop():
+            return None
+        path = os.path.join(self.folder, relative_path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        overview = compute_overview(path, read_limiter=read_limiter, should_stop=self.should_stop)
+        if overview is None:
+            return None
+        return (stat.st_size, stat.st_mtime) + tuple(overview)
+
+    def run(self):
+        # the catalog is only used by this thread, the workers hand their overviews back
+        catalog = RecordingCatalog(self.catalog_path)
+        read_limiter = ReadRateLimiter(self.max_bytes_per_second)
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {pool.submit(self.compute_overview, relative_path, read_limiter): relative_path
+                       for relative_path in self.relative_paths}
+            for index, future in enumerate(as_completed(futures)):
+                if self.aborted:
+                    break
+                relative_path = futures[future]
+                self.operation_changed.emit('Overview ' + str(index + 1) + '/' + str(len(futures)) + ': ' +
+                                            relative_path)
+                overview = future.result()
+                if overview is None:
+                    continue
+                catalog.store_overview(self.folder, relative_path, *overview)
+                self.overview_computed.emit(relative_path)
+        finally:
+            # recordings which were not started yet are dropped, the running ones stop at their next window
+            pool.shutdown(wait=True, cancel_futures=True)
+            catalog.close()
+        self.finished.emit()
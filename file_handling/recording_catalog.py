@@ -0,0 +1,192 @@
+import os
+import json
+import sqlite3
+import numpy as np
+import h5py
+
+from file_handling.memmap_data_reader import MemmapDataReader, MEMMAP_EXTENSIONS, get_params_path
+
+
+# In this script the recordings of the data folders are cataloged in a local SQLite file. For every recording its size,
+# modification time, sampling frequency, duration and number of channels are stored, together with the .meae file and
+# SpyKING CIRCUS result file that belong to it. Recordings are MCS .h5 files and flat binary / .npy files with a
+# SpyKING CIRCUS parameter file (see memmap_data_reader.py). The DataListView lists a folder from the catalog without
+# opening any recording. When a folder is scanned again, only recordings (and .meae files) whose size or modification
+# time changed are opened to read their metadata, all others are taken from the catalog. The activity overviews of the
+# recordings are cached in the catalog as well.
+
+# sidecar files written by MEAsure next to the recordings, they are no recordings themselves
+SIDECAR_SUFFIXES = ('_psd.h5', '_spectrograms.h5', '_pyramid.h5', '_stats.h5', '_preprocessed.h5')
+
+
+def read_recording_metadata(path):
+    """
+    :param path: path of a MCS .h5 recording or of a flat binary / .npy recording with parameter file
+    :return: sampling frequency in Hz, duration in s and number of channels (None for all if they can not be read)
+    """
+    if path.lower().endswith(MEMMAP_EXTENSIONS):
+        try:
+            # opening the memory map reads nothing but the parameter file (and the header of .npy files)
+            reader = MemmapDataReader.from_params_file(path)
+            return reader.sampling_frequency, reader.duration, len(reader.labels)
+        except (OSError, ValueError):
+            return None, None, None
+    try:
+        with h5py.File(path, 'r') as file:
+            stream = file['Data']['Recording_0']['AnalogStream']['Stream_0']
+            sampling_frequency = 1000000 / stream['InfoChannel']['Tick'][0]
+            duration = stream['ChannelDataTimeStamps'][0][2] / sampling_frequency
+            n_channels = stream['ChannelData'].shape[0]
+            return float(sampling_frequency), float(duration), int(n_channels)
+    except (OSError, KeyError, ValueError, IndexError):
+        return None, None, None
+
+
+def read_meae_keys(path):
+    try:
+        with h5py.File(path, 'r') as file:
+            return list(file.keys())
+    except OSError:
+        return []
+
+
+class RecordingCatalog:
+    default_path = './recording-catalog.sqlite'
+
+    columns = ['relative_path', 'size', 'mtime', 'sampling_frequency', 'duration', 'n_channels', 'meae_path',
+               'meae_size', 'meae_mtime', 'meae_keys', 'sc_path']
+
+    def __init__(self, path=None):
+        # every thread has to use its own RecordingCatalog, because a SQLite connection can not be shared
+        self.path = RecordingCatalog.default_path if path is None else path
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS recordings (folder TEXT, relative_path TEXT, size INTEGER, '
+                                'mtime REAL, sampling_frequency REAL, duration REAL, n_channels INTEGER, '
+                                'meae_path TEXT, meae_size INTEGER, meae_mtime REAL, meae_keys TEXT, sc_path TEXT, '
+                                'PRIMARY KEY (folder, relative_path))')
+        # the overviews (see recording_overview.py) are stored with the size and modification time of the recording
+        # they were computed from
+        self.connection.execute('CREATE TABLE IF NOT EXISTS overviews (folder TEXT, relative_path TEXT, size INTEGER, '
+                                'mtime REAL, n_channels INTEGER, rms BLOB, spike_rates BLOB, '
+                                'PRIMARY KEY (folder, relative_path))')
+        self.connection.commit()
+
+    def get_recordings(self, folder):
+        """
+        :param folder: scanned data folder
+        :return: list of dictionaries (one per recording, sorted by path) with the columns of the catalog, meae_keys is
+        a list of the keys of the .meae file
+        """
+        cursor = self.connection.execute('SELECT ' + ', '.join(RecordingCatalog.columns) +
+                                         ' FROM recordings WHERE folder = ? ORDER BY relative_path', (folder,))
+        recordings = []
+        for row in cursor.fetchall():
+            recording = dict(zip(RecordingCatalog.columns, row))
+            recording['meae_keys'] = json.loads(recording['meae_keys']) if recording['meae_keys'] else []
+            recordings.append(recording)
+        return recordings
+
+    def scan(self, folder):
+        """
+        Scans the folder recursively and updates its recordings in the catalog. This is a generator, which yields the
+        progress in percent after every recording.
+        """
+        recording_files, companion_files = [], set()
+        for root, sub_folders, files in os.walk(folder):
+            for file in files:
+                relative_path = os.path.relpath(os.path.join(root, file), folder)
+                if relative_path.startswith('$RECYCLE.BIN'):
+                    continue
+                if file.endswith('.h5') and not file.endswith(SIDECAR_SUFFIXES):
+                    recording_files.append(relative_path)
+                elif file.lower().endswith(MEMMAP_EXTENSIONS) and \
+                        os.path.exists(get_params_path(os.path.join(root, file))):
+                    # flat binary and .npy recordings can only be opened with their parameter file
+                    recording_files.append(relative_path)
+                elif file.endswith('.meae') or file.endswith('.clusters.hdf5'):
+                    companion_files.add(relative_path)
+
+        known_recordings = {recording['relative_path']: recording for recording in self.get_recordings(folder)}
+        changed_rows = []
+        for index, relative_path in enumerate(recording_files):
+            recording = known_recordings.get(relative_path, dict())
+            row = self.get_updated_row(folder, relative_path, recording, companion_files)
+            if row is not None:
+                changed_rows.append(row)
+            yield round((index + 1) / len(recording_files) * 100.0, 2)
+
+        self.connection.executemany('INSERT OR REPLACE INTO recordings (folder, ' + ', '.join(RecordingCatalog.columns) +
+                                    ') VALUES (' + ', '.join(['?'] * (len(RecordingCatalog.columns) + 1)) + ')',
+                                    changed_rows)
+        removed_paths = set(known_recordings.keys()) - set(recording_files)
+        for table in ['recordings', 'overviews']:
+            self.connection.executemany('DELETE FROM ' + table + ' WHERE folder = ? AND relative_path = ?',
+                                        [(folder, relative_path) for relative_path in removed_paths])
+        self.connection.commit()
+
+    @staticmethod
+    def get_updated_row(folder, relative_path, recording, companion_files):
+        """
+        :param recording: catalog entry of the recording from the last scan (empty dictionary for new recordings)
+        :return: new row of the recording or None if neither the recording nor its companions changed
+        """
+        stat = os.stat(os.path.join(folder, relative_path))
+        changed = recording.get('size') != stat.st_size or recording.get('mtime') != stat.st_mtime
+        if changed:
+            metadata = read_recording_metadata(os.path.join(folder, relative_path))
+        else:
+            metadata = recording['sampling_frequency'], recording['duration'], recording['n_channels']
+
+        # the companions have the same file name as the recording, except for the extension
+        path_without_extension = '.'.join(relative_path.split('.')[:-1])
+        meae_path = path_without_extension + '.meae'
+        meae_size, meae_mtime, meae_keys = None, None, []
+        if meae_path in companion_files:
+            meae_stat = os.stat(os.path.join(folder, meae_path))
+            meae_size, meae_mtime = meae_stat.st_size, meae_stat.st_mtime
+            if recording.get('meae_size') == meae_size and recording.get('meae_mtime') == meae_mtime:
+                meae_keys = recording['meae_keys']
+            else:
+                meae_keys = read_meae_keys(os.path.join(folder, meae_path))
+        else:
+            meae_path = None
+        sc_path = path_without_extension + '.clusters.hdf5'
+        if sc_path not in companion_files:
+            sc_path = None
+
+        if not changed and meae_path == recording.get('meae_path') and meae_size == recording.get('meae_size') and \
+                meae_mtime == recording.get('meae_mtime') and sc_path == recording.get('sc_path'):
+            return None
+        return (folder, relative_path, stat.st_size, stat.st_mtime) + tuple(metadata) + \
+            (meae_path, meae_size, meae_mtime, json.dumps(meae_keys), sc_path)
+
+    def get_overviews(self, folder, relative_path=None):
+        """
+        :param relative_path: only the overview of this recording is returned, None returns all recordings of the folder
+        :return: dictionary mapping the relative path of every recording of the folder, whose overview is up to date, to
+        its RMS (channels, time bins) and spike rates (channels,)
+        """
+        query = 'SELECT overviews.relative_path, overviews.n_channels, overviews.rms, overviews.spike_rates ' \
+                'FROM overviews JOIN recordings ON overviews.folder = recordings.folder AND ' \
+                'overviews.relative_path = recordings.relative_path ' \
+                'WHERE overviews.folder = ? AND overviews.size = recordings.size AND overviews.mtime = recordings.mtime'
+        parameters = (folder,)
+        if relative_path is not None:
+            query += ' AND overviews.relative_path = ?'
+            parameters += (relative_path,)
+        cursor = self.connection.execute(query, parameters)
+        overviews = dict()
+        for relative_path, n_channels, rms, spike_rates in cursor.fetchall():
+            overviews[relative_path] = (np.frombuffer(rms, dtype=np.float32).reshape(n_channels, -1),
+                                        np.frombuffer(spike_rates, dtype=np.float32))
+        return overviews
+
+    def store_overview(self, folder, relative_path, size, mtime, rms, spike_rates):
+        self.connection.execute('INSERT OR REPLACE INTO overviews VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (folder, relative_path, size, mtime, rms.shape[0],
+                                 np.ascontiguousarray(rms, dtype=np.float32).tobytes(),
+                                 np.ascontiguousarray(spike_rates, dtype=np.float32).tobytes()))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
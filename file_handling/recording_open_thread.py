@@ -0,0 +1,29 @@
+from PyQt5 import QtCore
+
+from file_handling.recording_reader import open_recording
+
+
+class RecordingOpenThread(QtCore.QThread):
+    """
+    Opens a recording (with the McsDataReader or MemmapDataReader, see open_recording) in the background, so the
+    MeaFileView can be shown while the file is opened and its InfoChannel and ChannelDataTimeStamps are read (which can
+    take a while on network drives or in eager mode)
+    """
+    operation_changed = QtCore.pyqtSignal(str)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent, mea_file, lazy=True):
+        super().__init__(parent)
+        self.mea_file = mea_file
+        self.lazy = lazy
+        self.reader = None
+        self.error_message = None
+
+    def run(self):
+        self.operation_changed.emit('Opening recording ' + self.mea_file + ' ...')
+        try:
+            self.reader = open_recording(self.mea_file, lazy=self.lazy)
+        except (OSError, ValueError) as error:
+            self.reader = None
+            self.error_message = str(error)
+        self.finished.emit()
@@ -0,0 +1,100 @@
+import threading
+import time
+import numpy as np
+from scipy.signal import sosfiltfilt
+
+from file_handling.recording_reader import open_recording
+from filtering.filter_engine import design_sos
+from filtering.filter_settings import FilterSettings
+
+
+# In this script a compact overview of a recording is computed, which shows whether (and where) the recording contains
+# activity without opening it in MEAsure: for coarse time bins the RMS of every channel (after a 300 Hz highpass) and
+# for every channel an estimated spike rate. Only a short probe window in the middle of every time bin is read (all
+# channels at once), so only a small fraction of the recording has to be read from disk.
+
+class ReadRateLimiter:
+    """
+    The ReadRateLimiter limits the number of bytes read per second by sleeping before reads which would exceed the rate,
+    it can be shared by several threads
+    """
+    def __init__(self, max_bytes_per_second):
+        self.max_bytes_per_second = max_bytes_per_second
+        self.start_time = time.monotonic()
+        self.bytes_read = 0
+        self.lock = threading.Lock()
+
+    def wait(self, n_bytes):
+        with self.lock:
+            self.bytes_read += n_bytes
+            bytes_read = self.bytes_read
+        if self.max_bytes_per_second is None:
+            return
+        earliest_time = self.start_time + bytes_read / self.max_bytes_per_second
+        delay = earliest_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def compute_overview(path, n_time_bins=64, probe_duration=0.1, highpass_cutoff=300.0, threshold_factor=5.0,
+                     read_limiter=None, should_stop=None):
+    """
+    :param path: path of a MCS .h5 recording or of a flat binary / .npy recording (see open_recording)
+    :param n_time_bins: number of time bins the recording is split into
+    :param probe_duration: duration in seconds of the window that is read per time bin
+    :param highpass_cutoff: cutoff frequency of the highpass applied to every window in Hz
+    :param threshold_factor: spikes are counted where a channel crosses threshold_factor * noise (estimated with the
+    median absolute deviation) downwards
+    :param read_limiter: ReadRateLimiter or None
+    :param should_stop: function returning True if the computation should be cancelled
+    :return: RMS in uV with shape (channels, time bins) and estimated spike rates in Hz with shape (channels,), None if
+    cancelled or if the file can not be opened as recording
+    """
+    try:
+        reader = open_recording(path)
+    except (OSError, KeyError, ValueError, IndexError):
+        return None
+    try:
+        channel_data = reader.voltage_traces_dataset
+        fs = reader.sampling_frequency
+        n_channels, n_samples = channel_data.shape
+        n_time_bins = max(1, min(n_time_bins, n_samples))
+        bin_samples = n_samples // n_time_bins
+        probe_samples = max(1, min(int(probe_duration * fs), bin_samples))
+        sos = design_sos(FilterSettings.Mode.HIGHPASS, float(highpass_cutoff), None, float(fs), 4) \
+            if highpass_cutoff < fs / 2 else None
+
+        rms = np.zeros((n_channels, n_time_bins), dtype=np.float32)
+        n_crossings = np.zeros(n_channels)
+        for time_bin in range(n_time_bins):
+            if should_stop is not None and should_stop():
+                return None
+            start = time_bin * bin_samples + (bin_samples - probe_samples) // 2
+            if read_limiter is not None:
+                read_limiter.wait(n_channels * probe_samples * channel_data.dtype.itemsize)
+            probe = reader.scale(channel_data[:, start:start + probe_samples])
+            probe = probe - probe.mean(axis=-1, keepdims=True)
+            if sos is not None and probe_samples > 3 * (2 * len(sos) + 1):
+                probe = sosfiltfilt(sos, probe, axis=-1)
+            rms[:, time_bin] = np.sqrt(np.mean(probe ** 2, axis=-1))
+            threshold = -threshold_factor * np.median(np.abs(probe), axis=-1, keepdims=True) / 0.6745
+            below = probe < threshold
+            n_crossings += np.count_nonzero(below[:, 1:] & ~below[:, :-1], axis=-1)
+        spike_rates = n_crossings / (n_time_bins * probe_samples / fs)
+        return rms, spike_rates.astype(np.float32)
+    finally:
+        reader.close()
+
+
+def get_overview_thumbnail(rms, height=24):
+    """
+    Converts the RMS of an overview into a small grey scale image: the channels are combined into height rows (by their
+    maximum), the values are scaled logarithmically between the 1st and 99th percentile
+    :return: uint8 numpy array with shape (height, time bins), bright means a high RMS
+    """
+    groups = np.array_split(np.arange(rms.shape[0]), min(height, rms.shape[0]))
+    image = np.array([rms[group].max(axis=0) for group in groups], dtype=np.float64)
+    image = np.log10(np.maximum(image, 1e-3))
+    low, high = np.percentile(image, [1, 99])
+    image = np.clip((image - low) / max(high - low, 1e-9), 0, 1)
+    return np.ascontiguousarray(image * 255, dtype=np.uint8)
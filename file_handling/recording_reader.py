@@ -0,0 +1,115 @@
+import os
+from abc import ABC, abstractmethod
+
+from file_handling.channel_statistics import ChannelStatistics
+
+
+# All readers of recordings (MCS .h5 files in McsDataReader, flat binary and .npy files in MemmapDataReader) offer the
+# same interface to the rest of MEAsure:
+#   file_path, filename, sampling_frequency (Hz), duration (s), labels and channel_ids (row of a label in the matrix),
+#   voltage_traces_dataset (matrix of raw values with shape (channels, samples), read lazily),
+#   voltage_traces (the same matrix, in eager mode loaded into memory),
+#   get_channel_id(label), scale(raw), get_raw_scaling(), get_raw_channel(label, start, stop),
+#   get_scaled_channel(label, start, stop), get_scaled_window(labels, start, stop), get_channel_statistics() and close()
+# open_recording picks the fitting reader by the file extension.
+
+class RecordingReader(ABC):
+    def __init__(self, path, lazy=True):
+        self.file_path = path
+        self.filename = path.split('/')[-1]
+        self.lazy = lazy
+        self.sampling_frequency = None
+        self.duration = None
+        self.voltage_traces_dataset = None
+        self.voltage_traces = None
+        self.channel_ids, self.labels = [], []
+        self.label_row_map = dict()
+        self.channel_statistics = None
+
+    def set_channels(self, channel_ids, labels):
+        self.channel_ids, self.labels = channel_ids, labels
+        # the row of a channel in the matrix is looked up by its label
+        self.label_row_map = {str(label): ch_id for label, ch_id in zip(self.labels, self.channel_ids)}
+
+    def get_channel_id(self, label):
+        return self.label_row_map.get(label)
+
+    @abstractmethod
+    def scale(self, raw):
+        """
+        Converts raw values of the recording into uV, every reader knows the conversion of its file format
+        :param raw: numpy array of raw values (any shape)
+        :return: scaled values as float64 array
+        """
+
+    def get_raw_scaling(self):
+        """
+        :return: raw value of 0 uV and uV per raw step (uV = (raw - zero) * gain), None if the matrix does not hold
+        integer ADC values with a positive gain. Analyses like the threshold detection then work on the raw values and
+        only convert their results.
+        """
+        return None
+
+    def get_channel_statistics(self):
+        """
+        :return: ChannelStatistics of the recording (see channel_statistics.py), None if they were not computed yet
+        """
+        if self.channel_statistics is None:
+            self.channel_statistics = ChannelStatistics.open(self.file_path, *self.voltage_traces_dataset.shape)
+        return self.channel_statistics
+
+    def read_rows(self, rows, start=None, stop=None):
+        """
+        :param rows: rows of the matrix (any order)
+        :return: raw values of the rows between start and stop, rows in the requested order
+        """
+        return self.voltage_traces[rows, start:stop]
+
+    def get_raw_channel(self, label, start=None, stop=None):
+        """
+        :return: raw values of the channel with the given label between start and stop, see get_scaled_channel
+        """
+        id_by_label = self.get_channel_id(label)
+        return self.voltage_traces[id_by_label, start:stop]
+
+    def get_scaled_channel(self, label, start=None, stop=None):
+        """
+        Reads the voltage trace of a single channel, optionally only the samples between start and stop
+        :param label: channel label, e.g. 'B5'
+        :param start: index of first sample (None = beginning of recording)
+        :param stop: index after the last sample (None = end of recording)
+        :return: scaled voltage trace in uV
+        """
+        return self.scale(self.get_raw_channel(label, start, stop))
+
+    def get_scaled_window(self, labels, start=None, stop=None):
+        """
+        Reads a time window of several channels at once
+        :param labels: list of channel labels, rows of the returned matrix follow this order
+        :param start: index of first sample (None = beginning of recording)
+        :param stop: index after the last sample (None = end of recording)
+        :return: scaled voltage traces in uV with shape (len(labels), stop - start)
+        """
+        row_indices = [self.get_channel_id(label) for label in labels]
+        return self.scale(self.read_rows(row_indices, start, stop))
+
+    def close(self):
+        """
+        Releases the file of the recording, the reader can not be used afterwards
+        """
+        self.voltage_traces_dataset = None
+        self.voltage_traces = None
+
+
+def open_recording(path, lazy=True):
+    """
+    :param path: path of a MCS .h5 recording or of a flat binary / .npy recording (see memmap_data_reader.py)
+    :param lazy: if False the whole matrix is loaded into memory
+    :return: McsDataReader or MemmapDataReader
+    """
+    # imported here, because both readers are subclasses of RecordingReader
+    from file_handling.memmap_data_reader import MemmapDataReader, MEMMAP_EXTENSIONS
+    if os.path.splitext(path)[1].lower() in MEMMAP_EXTENSIONS:
+        return MemmapDataReader.from_params_file(path, lazy=lazy)
+    from file_handling.mcs_data_reader import McsDataReader
+    return McsDataReader(path, lazy=lazy)
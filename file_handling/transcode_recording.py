@@ -0,0 +1,100 @@
+import os
+import argparse
+import numpy as np
+import h5py
+
+from file_handling.io_planner import open_hdf5_file, MCS_CHANNEL_DATA_PATH
+
+
+# In this script a MCS recording is transcoded into a channel-major working copy: ChannelData is stored in chunks which
+# hold a long time span of a single channel (compressed, with the shuffle filter, which makes the int32 values compress
+# much better). All other groups, datasets and attributes are copied unchanged, so the working copy is a valid MCS file,
+# which can be opened in MEAsure instead of the original. Reading one channel of the copy only reads the chunks of this
+# channel, while reading one channel of a time-major original reads the whole file.
+#
+# Usage from the main folder of MEAsure:
+#     python -m file_handling.transcode_recording recording.h5 [-o working_copy.h5] [--compression lzf]
+
+def get_working_copy_path(recording_path):
+    return '.'.join(recording_path.split('.')[:-1]) + '_channel_major.h5'
+
+
+def copy_group(source_group, target_group, skipped_path):
+    """
+    Copies all attributes, groups and datasets of source_group into target_group, except the dataset skipped_path
+    """
+    for key, value in source_group.attrs.items():
+        target_group.attrs[key] = value
+    for name, item in source_group.items():
+        if item.name == skipped_path:
+            continue
+        if isinstance(item, h5py.Group):
+            copy_group(item, target_group.create_group(name), skipped_path)
+        else:
+            source_group.copy(item, target_group, name)
+
+
+def transcode_recording(recording_path, target_path=None, chunk_samples=2**16, compression='gzip',
+                        compression_opts=4, block_bytes=2**26, should_stop=None):
+    """
+    Writes a channel-major copy of the recording. This is a generator, which yields the progress in percent after every
+    block of samples. The copy is written into a temporary file first, so a cancelled or failed transcoding never leaves
+    an incomplete working copy behind.
+    :param recording_path: path of the MCS .h5 recording
+    :param target_path: path of the working copy, None = <recording>_channel_major.h5
+    :param chunk_samples: samples per chunk of the working copy (every chunk holds a single channel)
+    :param compression: 'gzip', 'lzf' or None
+    :param compression_opts: level of gzip compression (ignored for other compressions)
+    :param block_bytes: approximate size of the blocks (all channels) which are read and written at once
+    :param should_stop: function returning True if the transcoding should be cancelled
+    """
+    if target_path is None:
+        target_path = get_working_copy_path(recording_path)
+    temporary_path = target_path + '.part'
+    completed = False
+    try:
+        with open_hdf5_file(recording_path) as source, h5py.File(temporary_path, 'w') as target:
+            channel_data = source[MCS_CHANNEL_DATA_PATH]
+            copy_group(source, target, channel_data.name)
+            n_channels, n_samples = channel_data.shape
+            chunk_samples = max(1, min(chunk_samples, n_samples))
+            target_data = target.create_dataset(MCS_CHANNEL_DATA_PATH, shape=channel_data.shape,
+                                                dtype=channel_data.dtype, chunks=(1, chunk_samples),
+                                                compression=compression,
+                                                compression_opts=compression_opts if compression == 'gzip' else None,
+                                                shuffle=compression is not None)
+            for key, value in channel_data.attrs.items():
+                target_data.attrs[key] = value
+            target.attrs['transcoded_from'] = os.path.basename(recording_path)
+
+            # the blocks consist of whole chunks of the working copy, so every chunk is compressed and written only once
+            block_samples = max(1, block_bytes // (n_channels * chunk_samples * channel_data.dtype.itemsize)) * \
+                chunk_samples
+            block = np.empty((n_channels, min(block_samples, n_samples)), dtype=channel_data.dtype)
+            for start in range(0, n_samples, block_samples):
+                if should_stop is not None and should_stop():
+                    return
+                stop = min(start + block_samples, n_samples)
+                channel_data.read_direct(block, source_sel=np.s_[:, start:stop], dest_sel=np.s_[:, :stop - start])
+                target_data[:, start:stop] = block[:, :stop - start]
+                yield round(stop / max(n_samples, 1) * 100.0, 2)
+        os.replace(temporary_path, target_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Transcodes a MCS recording into a channel-major working copy.')
+    parser.add_argument('recording', help='path of the MCS .h5 recording')
+    parser.add_argument('-o', '--output', default=None, help='path of the working copy (default: '
+                                                             '<recording>_channel_major.h5)')
+    parser.add_argument('--chunk-samples', type=int, default=2**16, help='samples per chunk of the working copy')
+    parser.add_argument('--compression', choices=['gzip', 'lzf', 'none'], default='gzip')
+    arguments = parser.parse_args()
+    output_path = arguments.output if arguments.output is not None else get_working_copy_path(arguments.recording)
+    compression_name = None if arguments.compression == 'none' else arguments.compression
+    for progress in transcode_recording(arguments.recording, output_path, arguments.chunk_samples, compression_name):
+        print('\r' + str(progress) + ' %', end='', flush=True)
+    print('\nWorking copy written to ' + output_path)
@@ -0,0 +1,114 @@
+from functools import lru_cache
+import numpy as np
+from scipy.signal import butter, iirnotch, tf2sos, sosfilt, sosfiltfilt
+
+from filtering.filter_settings import FilterSettings
+
+
+# In this script the filters are designed and applied. Filters are designed in second-order sections (sos) form, which
+# is numerically more stable than the (b, a) form for higher orders and narrow bands. Since every channel of a recording
+# is filtered with the same filter, each design is computed only once and then reused.
+
+# Default filter orders of the different filter modes (these are the orders MEAsure used so far).
+DEFAULT_ORDERS = {
+    FilterSettings.Mode.LOWPASS: 4,
+    FilterSettings.Mode.HIGHPASS: 4,
+    FilterSettings.Mode.BANDPASS: 2,
+    FilterSettings.Mode.NOTCH: 2,
+}
+
+# Quality factor of the notch filter: notch frequency / bandwidth
+NOTCH_QUALITY_FACTOR = 30.0
+
+
+@lru_cache(maxsize=32)
+def design_sos(mode, cutoff_1, cutoff_2, fs, order):
+    """
+    Designs a filter in second-order sections form. The result is cached, so calling this function with the same
+    arguments again (e.g. for the next channel or the next file with the same sampling frequency) costs nothing.
+    :param mode: FilterSettings.Mode
+    :param cutoff_1: cutoff frequency for low- and highpass, lower cutoff for bandpass, notch frequency for notch
+    :param cutoff_2: upper cutoff frequency for bandpass, ignored otherwise
+    :param fs: sampling frequency in Hz
+    :param order: filter order (ignored for the notch filter, which is always of second order)
+    :return: sos array of shape (n_sections, 6)
+    """
+    if mode == FilterSettings.Mode.LOWPASS:
+        return butter(order, cutoff_1, btype='low', fs=fs, output='sos')
+    elif mode == FilterSettings.Mode.HIGHPASS:
+        return butter(order, cutoff_1, btype='high', fs=fs, output='sos')
+    elif mode == FilterSettings.Mode.BANDPASS:
+        return butter(order, [cutoff_1, cutoff_2], btype='band', fs=fs, output='sos')
+    elif mode == FilterSettings.Mode.NOTCH:
+        b, a = iirnotch(cutoff_1, NOTCH_QUALITY_FACTOR, fs=fs)
+        return tf2sos(b, a)
+    raise ValueError('Unknown filter mode: ' + str(mode))
+
+
+class FilterEngine:
+    """
+    The FilterEngine holds one filter design and applies it zero-phase (forwards and backwards) to blocks of channels
+    """
+    def __init__(self, mode, cutoff_1, cutoff_2, fs, order=None):
+        if order is None:
+            order = DEFAULT_ORDERS[mode]
+        self.mode = mode
+        self.fs = fs
+        self.sos = design_sos(mode, float(cutoff_1), None if cutoff_2 is None else float(cutoff_2), float(fs),
+                              order)
+        self._padding = None
+
+    def filter_block(self, block):
+        """
+        Filters all channels of a block at once
+        :param block: numpy array with shape (channels, samples) or a single trace with shape (samples,)
+        :return: filtered block with the same shape
+        """
+        return sosfiltfilt(self.sos, block, axis=-1)
+
+    def get_padding(self, tolerance=1e-9):
+        """
+        Computes after how many samples the impulse response of the filter has decayed, so that filtering a block with
+        this many extra samples on both sides gives the same result as filtering the whole trace
+        :param tolerance: the impulse response is considered decayed once the sum of its remaining (absolute) values is
+        below tolerance * the sum of all its values
+        :return: number of padding samples
+        """
+        if self._padding is None:
+            # The impulse response decays like r ** n, where r is the largest radius of the poles of the filter, so its
+            # remaining sum after n samples is about r ** n / (1 - r). It has decayed to the tolerance after about
+            # log(tolerance * (1 - r)) / log(r) samples. Low cutoffs (e.g. a 0.1 Hz highpass) have poles very close to
+            # the unit circle and need a long padding, which is why the length is not capped. The exact length is
+            # measured on an impulse response twice as long as this estimate.
+            poles = np.concatenate([np.roots(section[3:]) for section in self.sos])
+            max_radius = np.max(np.abs(poles)) if len(poles) > 0 else 0.0
+            if max_radius <= 0.0:
+                estimate = len(self.sos) * 2 + 1
+            else:
+                max_radius = min(max_radius, 1.0 - 1e-12)
+                estimate = int(np.ceil(np.log(tolerance * (1.0 - max_radius)) / np.log(max_radius)))
+            impulse = np.zeros(2 * estimate + 1)
+            impulse[0] = 1.0
+            response = np.abs(sosfilt(self.sos, impulse))
+            # remaining_sum[n] is the sum of the impulse response from sample n on
+            remaining_sum = np.cumsum(response[::-1])[::-1]
+            self._padding = int(np.flatnonzero(remaining_sum > tolerance * remaining_sum[0])[-1]) + 1
+        return self._padding
+
+    def plan_blocks(self, n_samples, block_samples, start_sample=0):
+        """
+        Splits a recording into time blocks, which are filtered independently
+        :param n_samples: number of samples of the recording
+        :param block_samples: number of samples of one block (without padding)
+        :param start_sample: first sample to filter
+        :return: list of (block_start, block_stop, read_start, read_stop), where read_start and read_stop include the
+        padding on both sides
+        """
+        padding = self.get_padding()
+        blocks = []
+        for block_start in range(start_sample, n_samples, block_samples):
+            block_stop = min(block_start + block_samples, n_samples)
+            read_start = max(block_start - padding, 0)
+            read_stop = min(block_stop + padding, n_samples)
+            blocks.append((block_start, block_stop, read_start, read_stop))
+        return blocks
@@ -28,6 +28,11 @@ class FilterSettings:
         self.upper_cutoff = 4750
         self.mode = FilterSettings.Mode.BANDPASS
         self.save_filtered_traces = False
+        # filtered traces are stored as float32 (half the file size of float64) and compressed with lzf by default
+        self.save_as_float32 = True
+        self.compression = 'lzf'
+        # a decimated copy (about 2 kHz, see lfp_decimation.py) of the saved traces is written for low frequency analyses
+        self.save_lfp_copy = True
         self.channel_selection = FilterSettings.ChannelSelection.ALL
 
     def to_dict(self):
@@ -40,6 +45,9 @@ class FilterSettings:
         result["lower cutoff"] = self.lower_cutoff
         result["upper cutoff"] = self.upper_cutoff
         result["save filtered traces"] = self.save_filtered_traces
+        result["save as float32"] = self.save_as_float32
+        result["compression"] = self.compression
+        result["save lfp copy"] = self.save_lfp_copy
         result["channel selection"] = self.channel_selection
         return result
 
@@ -56,5 +64,11 @@ class FilterSettings:
             self.upper_cutoff = dictionary["Upper cutoff"]
         if "save filtered traces" in dictionary.keys():
             self.save_filtered_traces = dictionary["save filtered traces"]
+        if "save as float32" in dictionary.keys():
+            self.save_as_float32 = dictionary["save as float32"]
+        if "compression" in dictionary.keys():
+            self.compression = dictionary["compression"]
+        if "save lfp copy" in dictionary.keys():
+            self.save_lfp_copy = dictionary["save lfp copy"]
         if "channel selection" in dictionary.keys():
             self.channel_selection = dictionary["channel selection"]
\ No newline at end of file
@@ -49,11 +49,12 @@ class FilterSettingsWidget(QtWidgets.QGroupBox):
         # Here, a QComboBox (drop down menu) is created. With this, the user can choose which filter type will be used.
         self.filter_combo_box = QtWidgets.QComboBox(self)
 
-        # With the next three lines, new entries for the drop down menu are created and in the brackets, it is defined
+        # With the next four lines, new entries for the drop down menu are created and in the brackets, it is defined
         # which text is assigned to their entry and shown to the user.
         self.filter_combo_box.addItem('Lowpass Filter')
         self.filter_combo_box.addItem('Highpass Filter')
         self.filter_combo_box.addItem('Bandpass Filter')
+        self.filter_combo_box.addItem('Notch Filter')
 
         # Line 56 - 58 were a little trick to be able to set the alignment of the texts to centered.
         self.filter_combo_box.setEditable(True)
@@ -159,6 +160,11 @@ class FilterSettingsWidget(QtWidgets.QGroupBox):
             self.second_textbox_label.setVisible(True)
         elif index == 1:
             self.textbox_label.setText('Upper cutoff frequency [Hz]')
+        elif index == 3:
+            # the notch filter only needs the frequency which should be removed (e.g. 50 Hz line noise)
+            self.textbox_label.setText('Notch frequency [Hz]')
+            self.second_cutoff_textbox.setVisible(False)
+            self.second_textbox_label.setVisible(False)
         else:
             self.second_cutoff_textbox.setVisible(False)
             self.second_textbox_label.setVisible(False)
@@ -6,6 +6,8 @@ import numpy as np
 
 from results import ResultStoring
 from filtering.filter_thread import FilterThread
+from file_handling.meae_data_writer import MeaeDataWriter
+from utility.parallel_executor import Hdf5RowView
 
 
 # Here the tab widget, which will be added to the mea_file_view, is created. This class handles the visualization of
@@ -33,6 +35,13 @@ class FilterTab(QtWidgets.QWidget):
         # the filtering_thread is None, there is no Thread running.
         self.filtered_mat = None
         self.filtering_thread = None
+        # MeaeDataWriter which streams the filtered traces into the .meae file while filtering (only if they are saved)
+        self.meae_writer = None
+        # read-only h5py file of the .meae file the filtered_mat is read from (opened by open_filter_file), it is handed
+        # to the results, which close it before the file is written again
+        self.meae_file = None
+        # set by check_for_filtered_traces, True if an interrupted run should be continued
+        self.resume_filtering = False
 
         # Line 33 - 51 sets up different widgets (for detailed explanation see filter_settings_dialog.py and
         # filter_settings_widget.py)
@@ -108,9 +117,27 @@ class FilterTab(QtWidgets.QWidget):
             self.progress_bar.setValue(0)
             self.progress_label.setText('')
             self.operation_label.setText('Filtering')
+            # If the filtered traces should be saved, the thread writes them into the .meae file block by block.
+            # Otherwise they are kept in memory.
+            output = None
+            if self.settings.save_filtered_traces:
+                # The .meae file of an earlier run is still open read-only for the results. It is closed (and the
+                # traces read from it are dropped), otherwise the MeaeDataWriter can not open it for writing.
+                self.mea_file_view.results.close_meae_file()
+                existing_filter_mat = self.check_for_filtered_traces()
+                if existing_filter_mat is not None:
+                    # the user decided to use the traces that were already filtered with the same settings
+                    self.filtered_mat = existing_filter_mat
+                    self.mea_file_view.results.set_filter_mat(self.filtered_mat, self.meae_file)
+                    self.load_lfp_copy(self.meae_file)
+                    self.operation_label.setText('Loaded filtered traces from: ' + self.get_meae_file_path())
+                    return
+                output = self.create_meae_writer()
             # Here, the thread is initialized. We pass the McsDataReader and the setting variables to the Thread.
             self.filtering_thread = FilterThread(self, self.reader, filter_mode, cutoff_1, cutoff_2, self.grid_indices,
-                                                 self.grid_labels)
+                                                 self.grid_labels, output=output,
+                                                 save_lfp_copy=self.settings.save_lfp_copy,
+                                                 compression=self.settings.compression)
             # The thread sends different signals to this FilterTab. So we have to connect the signals to defined
             # functions.
             self.filtering_thread.progress_made.connect(self.on_progress_made)
@@ -174,62 +201,110 @@ class FilterTab(QtWidgets.QWidget):
         :return: saved .meae file if it is set, self.filtering_thread is set to None again
         """
         self.progress_label.setText('Finished :)')
+        if self.meae_writer is not None:
+            # The filtered traces were already written to the .meae file while filtering. The file is closed and opened
+            # again read-only, so other tabs (and readers) can use the filtered traces.
+            meae_file_path = self.meae_writer.file_path
+            rows = self.meae_writer.rows
+            self.meae_writer.close()
+            self.meae_writer = None
+            self.filtered_mat = self.open_filter_file(meae_file_path)
+            # when channels were appended to an existing file, only the rows of the selected channels are kept (they are
+            # still read from the file, not loaded into memory)
+            if rows != list(range(self.filtered_mat.shape[0])):
+                self.filtered_mat = Hdf5RowView(self.filtered_mat, rows)
+            self.mea_file_view.results.set_filter_mat(self.filtered_mat, self.meae_file)
+            self.load_lfp_copy(self.meae_file)
+            self.filtering_thread = None
+            self.operation_label.setText('Filtered traces saved in: ' + meae_file_path)
+            return
+
         if self.filtering_thread.filtered_mat:
             self.filtered_mat = self.filtering_thread.filtered_mat.copy()
             self.mea_file_view.results.set_filter_mat(self.filtering_thread.filtered_mat)
         self.filtering_thread = None
 
-        if self.settings.save_filtered_traces:
-            path = os.path.split(self.reader.file_path)[0]
-            if self.meae_filename is None:
-                self.meae_filename = os.path.split(self.reader.file_path)[-1][:-3] + '.meae'
-            self.save_filter_mat(self.filtered_mat, os.path.join(path, self.meae_filename), self.reader)
-
-    def save_filter_mat(self, filter_mat, filename, reader):
-        """
-        This function saves the filtered_mat once the filtering thread is finished
-        :param filter_mat: list of arrays of filtered traces
-        :param filename: filename under which .meae file will be stored
-        :param reader: McsReader, currently used to get filename
-        :return:
-        """
-        if self.append_existing_file:
-            self.operation_label.setText('Saving filtered traces im .meae file...')
-            with h5py.File(filename, 'a') as hf:
-                if 'filter' in hf.keys():
-                    hf['filter'].resize((hf['filter'].shape[0] + filter_mat.shape[0]), axis=0)
-                    hf['filter'][-filter_mat.shape[0]:] = filter_mat
-                self.operation_label.setText('Filtered traces saved in: ' + filename)
-        else:
-            self.operation_label.setText('Saving filtered traces im .meae file...')
-            if reader.sampling_frequency and reader.channel_ids and reader.labels:
-                with h5py.File(filename, 'w') as hf:
-                    dset_1 = hf.create_dataset('filter', data=filter_mat)
-                    dset_2 = hf.create_dataset('fs', data=reader.sampling_frequency)
-                    # dset_3 = hf.create_dataset('channel_ids', data=reader.channel_ids)
-                    # save_labels = [label.encode('utf-8') for label in reader.labels]
-                    # dset_3 = hf.create_dataset('channel_labels', data=save_labels)
-            self.operation_label.setText('Filtered traces saved in: ' + filename)
+    def load_lfp_copy(self, meae_file):
+        """
+        This function hands the decimated copy of the filtered traces (if the .meae file holds a complete one) to the
+        results, so low frequency analyses (frequency bands, spectrograms) can use it instead of the filtered traces.
+        :param meae_file: read-only h5py file of the .meae file, the same the filtered_mat is read from
+        """
+        lfp_mat = MeaeDataWriter.get_lfp_dataset(meae_file)
+        if lfp_mat is None:
+            return
+        lfp_fs = lfp_mat.attrs['fs']
+        # the rows of the copy are the rows of the 'filter' dataset, only the rows of the selected channels are kept
+        existing_labels = [label.decode('utf8') for label in meae_file['filter_labels'][:]]
+        rows = [existing_labels.index(str(label)) for label in self.grid_labels]
+        if rows != list(range(lfp_mat.shape[0])):
+            lfp_mat = Hdf5RowView(lfp_mat, rows)
+        self.mea_file_view.results.set_lfp_mat(lfp_mat, lfp_fs)
+
+    def get_meae_file_path(self):
+        """
+        :return: path of the .meae file, which lies in the same folder as the recording
+        """
+        path = os.path.split(self.reader.file_path)[0]
+        if self.meae_filename is None:
+            self.meae_filename = os.path.splitext(os.path.split(self.reader.file_path)[-1])[0] + '.meae'
+        return os.path.join(path, self.meae_filename)
+
+    def get_filter_parameters(self):
+        """
+        :return: dictionary of the settings the filtered traces depend on, it is stored with the 'filter' dataset to
+        recognize traces that were filtered the same way
+        """
+        upper_cutoff = float(self.settings.upper_cutoff) if self.settings.mode == 2 else 0.0
+        return {'mode': self.settings.mode, 'lower cutoff': float(self.settings.lower_cutoff),
+                'upper cutoff': upper_cutoff}
+
+    def create_meae_writer(self):
+        """
+        This function opens the .meae file and prepares the 'filter' dataset, which the FilterThread fills block by
+        block. Without appending, channels of a different earlier run are removed from the file.
+        :return: MeaeDataWriter with one row per selected channel
+        """
+        self.operation_label.setText('Filtering and saving filtered traces to .meae file')
+        self.meae_writer = MeaeDataWriter(self.get_meae_file_path())
+        n_samples = self.reader.voltage_traces_dataset.shape[1]
+        dtype = 'float32' if self.settings.save_as_float32 else 'float64'
+        self.meae_writer.prepare_filter_dataset(self.grid_labels, n_samples, self.reader.sampling_frequency,
+                                                self.get_filter_parameters(), append=self.append_existing_file,
+                                                dtype=dtype, compression=self.settings.compression)
+        if not self.resume_filtering:
+            self.meae_writer.reset_progress()
+        return self.meae_writer
 
     def open_filter_file(self, filepath):
         """
-        This function loads the filtered traces matrix, if it already exists
+        This function loads the filtered traces matrix, if it already exists. The file stays open read-only as
+        self.meae_file, the LFP copy is read from the same handle.
         :param filepath: filepath of the .meae file
         :return: filter_mat, a .h5 file which holds already filtered traces
         """
-        # todo: check if this function is still functional
-        hf = h5py.File(filepath, 'r')
-        key = list(hf.keys())[0]
-        filer_mat = hf[key]
+        self.meae_file = h5py.File(filepath, 'r')
+        filer_mat = self.meae_file['filter']
         return filer_mat
 
     def check_for_filtered_traces(self):
-        # scan path of current file, if the desired .meae file exists
-        # todo: check if it still works
-        filtered = self.mea_file[:-3] + '.meae'
-        if os.path.exists(filtered):
-            # if this file already exists, set it as filter_mat
-            filter_mat = self.open_filter_file(filtered)
+        """
+        This function checks if the .meae file already holds traces of the selected channels, which were filtered with
+        the same settings. If all of them are complete, the user can decide to use them instead of filtering again. If
+        an earlier run was interrupted, the user can decide to resume it.
+        :return: filter_mat with the already filtered traces or None if filtering should (re)start
+        """
+        self.resume_filtering = False
+        meae_file_path = self.get_meae_file_path()
+        if not os.path.exists(meae_file_path):
+            return None
+        n_samples = self.reader.voltage_traces_dataset.shape[1]
+        filter_state = MeaeDataWriter.get_filter_state(meae_file_path, n_samples, self.get_filter_parameters())
+        # in case there is no filter dataset with the same settings found, the filter_mat stays none
+        if filter_state is None:
+            return None
+        filtered_samples = [filter_state.get(str(label), 0) for label in self.grid_labels]
+        if min(filtered_samples) >= n_samples:
             # show user an answer that informs him/her about the file and asks, if the user wants to filter channels
             # again anyways
             answer = QtWidgets.QMessageBox.information(self, 'Filtered channels already found',
@@ -239,11 +314,18 @@ class FilterTab(QtWidgets.QWidget):
             # depending on the answer of the user, set the found file as filter_mat or set filter_mat to none
             if answer == QtWidgets.QMessageBox.Yes:
                 return None
-            else:
-                return filter_mat
-        # in case there is no filter file found, the filter_mat stays none
-        else:
-            return None
+            filter_mat = self.open_filter_file(meae_file_path)
+            rows = [list(filter_state.keys()).index(str(label)) for label in self.grid_labels]
+            if rows != list(range(filter_mat.shape[0])):
+                filter_mat = Hdf5RowView(filter_mat, rows)
+            return filter_mat
+        if max(filtered_samples) > 0:
+            answer = QtWidgets.QMessageBox.question(self, 'Interrupted filtering found',
+                                                    'Resume filtering where it stopped?',
+                                                    QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No,
+                                                    QtWidgets.QMessageBox.Yes)
+            self.resume_filtering = answer == QtWidgets.QMessageBox.Yes
+        return None
 
     # todo: make tab closeable
     def is_busy_filtering(self):
@@ -1,6 +1,27 @@
 from PyQt5 import QtCore
-from scipy.signal import filtfilt, butter
-import time
+
+from filtering.filter_engine import FilterEngine
+from filtering.lfp_decimation import LfpDecimator, get_lfp_decimation
+from utility.parallel_executor import ParallelExecutor, McsTraceSource
+from file_handling.meae_data_writer import MeaeDataWriter
+
+
+# only every 312th sample is sent to the live plot of the FilterTab
+PREVIEW_STEP = 312
+
+
+def filter_window(filter_engine, source, positions, read_start, read_stop, block_start, block_stop):
+    """
+    Reads and filters a time window of several channels, this function runs in a worker process of the
+    ParallelExecutor
+    :return: every PREVIEW_STEP-th unfiltered sample (for the live plot) and the filtered samples between block_start and
+    block_stop (the padding is removed). Only the small preview of the unfiltered samples is sent back to the FilterThread,
+    so a finished block takes up not much more memory than its filtered samples.
+    """
+    padded_block = source.read_window(positions, read_start, read_stop)
+    filtered = filter_engine.filter_block(padded_block)
+    inner = slice(block_start - read_start, block_stop - read_start)
+    return padded_block[:, inner][:, ::PREVIEW_STEP], filtered[:, inner]
 
 
 # In this script the QThread which handles filtering in the background is set up
@@ -12,9 +33,22 @@ class FilterThread(QtCore.QThread):
     finished = QtCore.pyqtSignal()
 
     # As always, the FilterThread class has to be initialized
-    def __init__(self, parent, reader, filter_mode, cutoff_1, cutoff_2, grid_indices, grid_labels):
+    def __init__(self, parent, reader, filter_mode, cutoff_1, cutoff_2, grid_indices, grid_labels, block_size=16,
+                 output=None, block_duration=2.0, save_lfp_copy=True, compression='lzf', memory_limit=2**30):
         super().__init__(parent)
         self.reader = reader
+        # number of channels which are read and filtered at once (16 channels = one column of the MEA)
+        self.block_size = block_size
+        # If an output (a MeaeDataWriter with a prepared 'filter' dataset) is given, the recording is filtered in time
+        # blocks of block_duration seconds and each block is written to the .meae file straight away. This way the
+        # recording never has to fit into memory and an interrupted run can be resumed.
+        self.output = output
+        self.block_duration = block_duration
+        # bytes the time blocks which are filtered or wait to be written at the same time may use (roughly)
+        self.memory_limit = memory_limit
+        # if True, a decimated copy of the 'filter' dataset is written to the .meae file after filtering
+        self.save_lfp_copy = save_lfp_copy
+        self.compression = compression
 
         self.filter_mode = filter_mode
         self.cut_1 = cutoff_1
@@ -24,33 +58,6 @@ class FilterThread(QtCore.QThread):
 
         self.filtered_mat = None
 
-    # Line 26 - 49 set up different filtering functions
-    def butter_bandpass(self, lowcut, highcut, fs, order=2):
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='band')
-        return b, a
-
-    def butter_bandpass_filter(self, data, lowcut, highcut, fs, order=2):
-        b, a = self.butter_bandpass(lowcut, highcut, fs, order=order)
-        y = filtfilt(b, a, data)
-        return y
-
-    def butter_filter(self, cutoff, fs, mode, order=4):
-        nyq = 0.5 * fs
-        normal_cutoff = cutoff/nyq
-        b, a = butter(order, normal_cutoff, btype=mode, analog=False)
-        return b, a
-
-    def butter_div_filters(self, data, cutoff_freq, fs, mode):
-        # todo: check if this still works
-        # as far as I understood it, all three filter types (low, high, notch) can be applied with these functions
-        # and which filter will be applied at the end depends on the chosen mode
-        b, a = self.butter_filter(cutoff_freq, fs, mode)
-        y = filtfilt(b, a, data)
-        return y
-
     def filtering(self, mea_data_reader):
         """
         This function filters the selected channels with the according filter
@@ -58,51 +65,132 @@ class FilterThread(QtCore.QThread):
         :return: filter_mat and signals for the live plot, progress bar and label
         """
         # Set up filter_mat to store filtered traces in and get all necessary variables
-        filter_mat = []
+        filter_mat = [None] * len(self.grid_labels)
         reader = mea_data_reader
-        signals = reader.voltage_traces
-        ids = reader.channel_ids
         labels = reader.labels
         fs = reader.sampling_frequency
-        # With this one liner (list comprehension) only selected channel ids are selected according to chosen
-        # grid_indices
-        # selected_ids = [ids[g_idx] for g_idx in self.grid_indices]
-
-        for idx, label in enumerate(self.grid_labels):
-            # Right now, all the channels should be loaded and filtered, since the way storing of .meae files is set
-            # up it will get very confusing fast.
-            # So basically grid_indices should be a list with the length of all channel indices
-            t1 = time.time()
-            scaled_signal = reader.get_scaled_channel(label)
-            t2 = time.time() - t1
-            print('Time to load channel data: ', t2)
-            t3 = time.time()
-            # Here the filter is chosen according to the filter mode
-            if self.filter_mode == 0:
-                filtered = self.butter_div_filters(scaled_signal, self.cut_1, fs, 'low')
-            elif self.filter_mode == 1:
-                filtered = self.butter_div_filters(scaled_signal, self.cut_1, fs, 'high')
-            elif self.filter_mode == 2:
-                filtered = self.butter_bandpass_filter(scaled_signal, self.cut_1, self.cut_2, fs)
-            # Once data is filtered, it is appended to the filter_mat list.
-            filter_mat.append(filtered)
-            t4 = time.time() - t3
-            print('Time to filter data:', t4)
-            # Here the list of the currently created filtered trace is created. Only every 312th data point of the
-            # original signal is sent, to be able to plot the signals, since there are for once not enough pixels on
-            # screen to plot all data points correctly and also, for massive data loads also the pyqtgraph plot widget
-            # starts lagging.
-            data = [list(scaled_signal[::312]), list(filtered[::312]), str(labels[self.grid_indices[idx]])]
-            self.data_updated.emit(data)    # Here, the signal is sent to the FilterTav
-
-            # Here, the progress signal is calculated and then sent to the FilterTab
-            progress = round(((idx + 1) / len(self.grid_labels)) * 100.0, 2)
-            self.progress_made.emit(progress)
+        n_samples = reader.voltage_traces_dataset.shape[1]
+        # The filter is designed only once (in second-order sections form) and then applied to all channels.
+        filter_engine = FilterEngine(self.filter_mode, self.cut_1, self.cut_2, fs)
+
+        # Instead of one channel at a time, blocks of channels are read and filtered at once. This way there are far
+        # less calls to the reader and to the filter function. The blocks are distributed over all cores, every worker
+        # process reads its channels from the file itself.
+        source = McsTraceSource(reader.file_path, self.grid_labels)
+        tasks = [(filter_engine, source, range(block_start, min(block_start + self.block_size, len(self.grid_labels))),
+                  0, n_samples, 0, n_samples) for block_start in range(0, len(self.grid_labels), self.block_size)]
+        finished_channels = 0
+        with ParallelExecutor() as executor:
+            for task_index, (preview_block, filtered_block) in executor.map_tasks(filter_window, tasks):
+                for block_idx, idx in enumerate(tasks[task_index][2]):
+                    # Once data is filtered, it is stored at the position of its channel in the filter_mat list.
+                    filter_mat[idx] = filtered_block[block_idx]
+                    # Here the list of the currently created filtered trace is created. Only every 312th data point
+                    # of the original signal is sent, to be able to plot the signals, since there are for once not
+                    # enough pixels on screen to plot all data points correctly and also, for massive data loads also
+                    # the pyqtgraph plot widget starts lagging.
+                    data = [list(preview_block[block_idx]), list(filtered_block[block_idx][::PREVIEW_STEP]),
+                            str(labels[self.grid_indices[idx]])]
+                    self.data_updated.emit(data)    # Here, the signal is sent to the FilterTab
+
+                # Here, the progress signal is calculated and then sent to the FilterTab
+                finished_channels += len(tasks[task_index][2])
+                progress = round((finished_channels / len(self.grid_labels)) * 100.0, 2)
+                self.progress_made.emit(progress)
         return filter_mat
 
+    def chunked_filtering(self, mea_data_reader, output):
+        """
+        This function filters the selected channels block by block in time and writes them to the .meae file
+        :param mea_data_reader: McsDataReader to get the signals of the channels
+        :param output: MeaeDataWriter with a prepared 'filter' dataset for the selected channels
+        :return: the 'filter' dataset and signals for the live plot, progress bar and label
+        """
+        reader = mea_data_reader
+        labels = list(self.grid_labels)
+        fs = reader.sampling_frequency
+        n_samples = reader.voltage_traces_dataset.shape[1]
+        filter_engine = FilterEngine(self.filter_mode, self.cut_1, self.cut_2, fs)
+        padding = filter_engine.get_padding()
+        # Every block is read with some extra samples on both sides (the padding), so blocks should not be much
+        # shorter than the padding itself.
+        block_samples = max(int(self.block_duration * fs), 2 * padding)
+        if padding > 10 * fs:
+            # very low cutoffs (e.g. a highpass below 1 Hz) need a padding of many seconds, filtering takes much longer
+            self.operation_changed.emit('Low cutoff frequency: every block is read with ' + str(round(padding / fs, 1))
+                                        + ' s of extra samples on both sides')
+
+        # samples that were already filtered in an earlier (interrupted) run are skipped
+        start_sample = output.get_resume_sample()
+        if start_sample > 0:
+            self.operation_changed.emit('Resuming filtering at ' + str(round(start_sample / fs, 1)) + ' s')
+
+        # A task holds the padded block, the filtered block and the temporary arrays of sosfiltfilt (about three float64
+        # copies of the padded block). If a block of all channels does not fit into the memory limit (long blocks of a
+        # low cutoff), the channels are split into groups, which are filtered as separate tasks.
+        channel_bytes = 3 * (block_samples + 2 * padding) * 8
+        channels_per_task = max(1, min(len(labels), self.memory_limit // channel_bytes))
+        channel_groups = [range(group_start, min(group_start + channels_per_task, len(labels)))
+                          for group_start in range(0, len(labels), channels_per_task)]
+
+        # The time blocks are filtered in parallel by the worker processes, but written to the file in their order, so
+        # the progress stored in the .meae file always marks a continuous filtered part.
+        source = McsTraceSource(reader.file_path, labels)
+        tasks = [(filter_engine, source, positions, read_start, read_stop, block_start, block_stop)
+                 for block_start, block_stop, read_start, read_stop in
+                 filter_engine.plan_blocks(n_samples, block_samples, start_sample) for positions in channel_groups]
+        # Only as many tasks are in flight as fit into the memory limit. Otherwise long blocks would pile up while they
+        # wait to be written in order.
+        task_bytes = channel_bytes * channels_per_task
+        with ParallelExecutor() as executor:
+            max_pending = max(1, min(2 * executor.max_workers, self.memory_limit // task_bytes))
+            for task_index, (preview_block, filtered_block) in executor.map_tasks(filter_window, tasks, ordered=True,
+                                                                                  max_pending=max_pending):
+                positions, block_start, block_stop = tasks[task_index][2], tasks[task_index][5], tasks[task_index][6]
+                output.write_time_block(block_start, block_stop, filtered_block, positions)
+                if positions[0] == 0:
+                    # Only the first selected channel of the current block is shown in the live plot.
+                    data = [list(preview_block[0]), list(filtered_block[0][::PREVIEW_STEP]), str(labels[0])]
+                    self.data_updated.emit(data)
+
+                if positions[-1] == len(labels) - 1:
+                    # the block is written for all channels
+                    progress = round((block_stop / n_samples) * 100.0, 2)
+                    self.progress_made.emit(progress)
+        return output.filter_dataset
+
+    def decimating(self, output, block_bytes=2**27):
+        """
+        This function writes the decimated copy of all filtered traces of the .meae file into its 'lfp' dataset
+        :param output: MeaeDataWriter with the completely filtered 'filter' dataset
+        :param block_bytes: approximate size of the blocks (float64, all rows) which are decimated at once
+        :return: signals for the progress bar and label
+        """
+        filter_dataset = output.filter_dataset
+        n_rows, n_samples = filter_dataset.shape
+        fs = self.reader.sampling_frequency
+        decimator = LfpDecimator(fs, get_lfp_decimation(fs))
+        # a recording with a sampling rate at or below the LFP rate needs no copy
+        if decimator.decimation == 1 or n_rows == 0:
+            return
+        self.operation_changed.emit('Writing LFP copy (' + str(round(decimator.lfp_fs)) + ' Hz) of filtered traces')
+        output.prepare_lfp_dataset(decimator.lfp_fs, decimator.decimation, compression=self.compression)
+        # the blocks consist of whole chunks of the 'filter' dataset, so every chunk is read (and decompressed) once
+        chunk_samples = filter_dataset.chunks[1] if filter_dataset.chunks is not None else MeaeDataWriter.chunk_samples
+        block_samples = max(1, block_bytes // (n_rows * 8 * chunk_samples)) * chunk_samples
+        for progress in decimator.decimate_chunked(lambda start, stop: filter_dataset[:, start:stop], n_samples,
+                                                   output.write_lfp_block, block_samples):
+            self.progress_made.emit(progress)
+        output.complete_lfp_dataset()
+
     def run(self):
         # This function calls the filtering function and by doing so starts the actual filtering
         self.operation_changed.emit('Filtering traces')
-        self.filtered_mat = self.filtering(self.reader)
+        if self.output is not None:
+            self.filtered_mat = self.chunked_filtering(self.reader, self.output)
+            if self.save_lfp_copy and self.output.is_complete():
+                self.decimating(self.output)
+        else:
+            self.filtered_mat = self.filtering(self.reader)
         # Once all selected channels are filtered, a finished signal is sent to the FilterTab.
         self.finished.emit()
@@ -0,0 +1,108 @@
+import numpy as np
+from scipy.signal import resample_poly
+
+
+# In this script traces are decimated to the LFP sampling rate (about 2 kHz). Analyses of low frequencies (frequency
+# bands, spectrograms, CSD) do not need the 10 or 25 kHz of the recording, on the decimated traces they read and
+# compute 5 to 25 times less. resample_poly filters with an anti-aliasing FIR filter before it keeps every
+# decimation-th sample. The traces are decimated in time blocks of all channels: like in the SpectrogramEngine every
+# block is read with 11 * decimation extra samples on both sides (a bit more than the FIR filter reaches) and the block
+# borders are multiples of the decimation factor, so the result equals resample_poly of the whole trace.
+
+# sampling rate of the LFP copy in Hz, frequencies up to about 800 Hz are kept
+LFP_SAMPLING_RATE = 2000.0
+# the anti-aliasing filter of resample_poly keeps the amplitude (within 0.2 %) up to this fraction of the Nyquist
+# frequency of the decimated traces
+LFP_USABLE_BANDWIDTH = 0.8
+
+
+def get_lfp_decimation(fs, lfp_sampling_rate=LFP_SAMPLING_RATE):
+    """
+    :return: integer factor which reduces the sampling frequency fs to about (but not below) lfp_sampling_rate
+    """
+    return max(1, int(fs // lfp_sampling_rate))
+
+
+def select_traces(results, fs, max_frequency):
+    """
+    Low frequency analyses read the LFP copy of the filtered traces instead of the filtered traces, if there is a copy
+    which keeps all frequencies the analysis needs
+    :param results: ResultStoring with the filter_mat and maybe its LFP copy
+    :param fs: sampling frequency of the filter_mat in Hz
+    :param max_frequency: highest frequency the analysis needs in Hz, None if it needs all frequencies
+    :return: traces (LFP copy or filter_mat) and their sampling frequency
+    """
+    lfp_mat, lfp_fs = results.get_lfp_mat()
+    if lfp_mat is not None and max_frequency is not None and max_frequency <= LFP_USABLE_BANDWIDTH * lfp_fs / 2:
+        return lfp_mat, lfp_fs
+    return results.get_filter_mat(), fs
+
+
+class LfpDecimator:
+    """
+    The LfpDecimator decimates blocks of channels by an integer factor
+    """
+    def __init__(self, fs, decimation):
+        self.fs = fs
+        self.decimation = max(1, int(decimation))
+        self.lfp_fs = fs / self.decimation
+        self.padding = 11 * self.decimation if self.decimation > 1 else 0
+
+    def get_n_lfp_samples(self, n_samples):
+        return -(-n_samples // self.decimation)
+
+    def plan_blocks(self, n_samples, block_samples):
+        """
+        Splits a recording into time blocks, which are decimated independently
+        :param n_samples: number of samples of the recording
+        :param block_samples: number of samples of one block (without padding), rounded to a multiple of the decimation
+        :return: list of (block_start, block_stop, read_start, read_stop), where read_start and read_stop include the
+        padding on both sides
+        """
+        block_samples = max(1, block_samples // self.decimation) * self.decimation
+        blocks = []
+        for block_start in range(0, n_samples, block_samples):
+            block_stop = min(block_start + block_samples, n_samples)
+            read_start = max(block_start - self.padding, 0)
+            read_stop = min(block_stop + self.padding, n_samples)
+            blocks.append((block_start, block_stop, read_start, read_stop))
+        return blocks
+
+    def decimate_block(self, padded_block, block_start, block_stop, read_start):
+        """
+        :param padded_block: samples between read_start and read_stop with shape (channels, samples)
+        :return: decimated samples of the block between block_start and block_stop
+        """
+        padded_block = np.asarray(padded_block, dtype=np.float64)
+        if self.decimation == 1:
+            return padded_block[:, block_start - read_start:block_stop - read_start]
+        decimated = resample_poly(padded_block, 1, self.decimation, axis=-1)
+        offset = (block_start - read_start) // self.decimation
+        return decimated[:, offset:offset + self.get_n_lfp_samples(block_stop - block_start)]
+
+    def decimate_chunked(self, read_window, n_samples, write_block, block_samples):
+        """
+        Decimates a recording which does not fit into memory block by block
+        :param read_window: function read_window(start, stop) returning a (channels, stop - start) numpy array
+        :param n_samples: number of samples of the recording
+        :param write_block: function write_block(lfp_start, lfp_stop, decimated_block) storing a decimated block
+        :param block_samples: number of samples of one block (without padding)
+        :return: generator yielding the progress in percent after every block
+        """
+        for block_start, block_stop, read_start, read_stop in self.plan_blocks(n_samples, block_samples):
+            decimated = self.decimate_block(read_window(read_start, read_stop), block_start, block_stop, read_start)
+            lfp_start = block_start // self.decimation
+            write_block(lfp_start, lfp_start + decimated.shape[1], decimated)
+            yield round(block_stop / max(n_samples, 1) * 100.0, 2)
+
+    def decimate(self, read_window, n_channels, n_samples, block_samples=2**16):
+        """
+        :return: decimated traces of all channels (in memory) with shape (n_channels, get_n_lfp_samples(n_samples))
+        """
+        lfp = np.empty((n_channels, self.get_n_lfp_samples(n_samples)))
+
+        def write_block(lfp_start, lfp_stop, block):
+            lfp[:, lfp_start:lfp_stop] = block
+        for _ in self.decimate_chunked(read_window, n_samples, write_block, block_samples):
+            pass
+        return lfp
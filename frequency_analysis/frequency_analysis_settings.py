@@ -6,12 +6,20 @@ class FrequencyAnalysisSettings:
 
     def __init__(self):
         self.channel_selection = FrequencyAnalysisSettings.ChannelSelection.ALL
+        self.max_frequency = 100.0  # in Hz, amplitudes of higher frequencies are not stored
+        self.bin_averaging = 1  # number of neighbouring frequency bins which are averaged into one
 
     def to_dict(self):
         result = dict()
         result['channel selection'] = self.channel_selection
+        result['max frequency'] = self.max_frequency
+        result['bin averaging'] = self.bin_averaging
         return result
 
     def from_dict(self, dictionary):
         if 'channel selection' in dictionary.keys():
             self.channel_selection = dictionary['channel selection']
+        if 'max frequency' in dictionary.keys():
+            self.max_frequency = dictionary['max frequency']
+        if 'bin averaging' in dictionary.keys():
+            self.bin_averaging = dictionary['bin averaging']
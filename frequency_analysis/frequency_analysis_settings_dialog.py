@@ -32,6 +32,18 @@ class FrequencyAnalysisSettingsDialog(QtWidgets.QDialog):
         group_layout.addWidget(self.selected_channels_button)
         main_layout.addWidget(group_box)
 
+        self.max_frequency_textbox = QtWidgets.QLineEdit(self)
+        self.max_frequency_textbox.setAlignment(QtCore.Qt.AlignCenter)
+        self.max_frequency_textbox_label = QtWidgets.QLabel('Maximal frequency [Hz]:')
+        main_layout.addWidget(self.max_frequency_textbox_label)
+        main_layout.addWidget(self.max_frequency_textbox)
+
+        self.bin_averaging_textbox = QtWidgets.QLineEdit(self)
+        self.bin_averaging_textbox.setAlignment(QtCore.Qt.AlignCenter)
+        self.bin_averaging_textbox_label = QtWidgets.QLabel('Number of averaged frequency bins:')
+        main_layout.addWidget(self.bin_averaging_textbox_label)
+        main_layout.addWidget(self.bin_averaging_textbox)
+
         self.okay_button = QtWidgets.QPushButton(self)
         self.okay_button.setText('Execute')
         self.okay_button.clicked.connect(self.on_okay_clicked)
@@ -44,9 +56,24 @@ class FrequencyAnalysisSettingsDialog(QtWidgets.QDialog):
 
         self.setWindowTitle(title)
 
+        if not initial_settings:
+            initial_settings = FrequencyAnalysisSettings()
+
+        self.set_settings(initial_settings)
+
+    def set_settings(self, settings):
+        self.max_frequency_textbox.setText(str(settings.max_frequency))
+        self.bin_averaging_textbox.setText(str(settings.bin_averaging))
+        if settings.channel_selection == FrequencyAnalysisSettings.ChannelSelection.ALL:
+            self.all_channels_button.setChecked(True)
+        elif settings.channel_selection == FrequencyAnalysisSettings.ChannelSelection.SELECTION:
+            self.selected_channels_button.setChecked(True)
+
     def get_settings(self):
         settings = FrequencyAnalysisSettings()
         settings.channel_selection = self.selected_channels_button.isChecked()
+        settings.max_frequency = float(self.max_frequency_textbox.text())
+        settings.bin_averaging = max(1, int(self.bin_averaging_textbox.text()))
         return settings
 
     def on_okay_clicked(self):
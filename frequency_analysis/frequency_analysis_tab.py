@@ -49,6 +49,7 @@ class FrequencyAnalysisTab(QtWidgets.QWidget):
 
         self.frequency_analysis_thread = None
         self.frequencies = None
+        self.frequency_axis = None
 
         self.plot_thread = None
 
@@ -58,7 +59,9 @@ class FrequencyAnalysisTab(QtWidgets.QWidget):
             self.progress_bar.setValue(0)
             self.progress_label.setText('')
             self.operation_label.setText('Analyzing frequency components of recording')
-            self.frequency_analysis_thread = FrequencyAnalysisThread(self, self.reader, self.grid_indices, filtered)
+            self.frequency_analysis_thread = FrequencyAnalysisThread(self, self.reader, self.grid_indices, filtered,
+                                                                     float(self.settings.max_frequency),
+                                                                     int(self.settings.bin_averaging))
             self.frequency_analysis_thread.progress_made.connect(self.on_progress_made)
             self.frequency_analysis_thread.operation_changed.connect(self.on_operation_changed)
             self.frequency_analysis_thread.finished.connect(self.on_frequency_analysis_thread_finished)
@@ -87,6 +90,7 @@ class FrequencyAnalysisTab(QtWidgets.QWidget):
         # self.frequencies = frequencies
         if self.frequency_analysis_thread.frequencies:
             self.frequencies = self.frequency_analysis_thread.frequencies.copy()
+            self.frequency_axis = self.frequency_analysis_thread.frequency_axis
             self.mea_file_view.results.set_frequency_mat(self.frequency_analysis_thread.frequencies)
         self.frequency_analysis_thread = None
         self.initialize_plotting()
@@ -110,13 +114,11 @@ class FrequencyAnalysisTab(QtWidgets.QWidget):
         rows = int(np.ceil(np.sqrt(len(frequencies))))
 
         spec = gridspec.GridSpec(ncols=rows, nrows=rows, figure=figure)
-        for idx, frequency_component in enumerate(frequencies):
+        for idx, amplitudes in enumerate(frequencies):
             ax = figure.add_subplot(spec[idx])
-            N = int(len(frequency_component)/2 + 1)
-            fs = self.reader.sampling_frequency
-            X = np.linspace(0, fs / 2, N, endpoint=True)
-            ax.plot(X, 2.0*np.abs(frequency_component[:N])/N)
-            ax.set_xlim([0, 100])
+            # the spectra only hold the amplitudes up to the maximal frequency, so all of them are plotted
+            ax.plot(self.frequency_axis, amplitudes)
+            ax.set_xlim([0, self.settings.max_frequency])
             ax.set_title(self.grid_labels[idx], pad=0)
             ax.spines['right'].set_visible(False)
             ax.spines['top'].set_visible(False)
@@ -1,5 +1,13 @@
 from PyQt5 import QtCore
-import numpy as np
+
+from frequency_analysis import spectrum_engine
+from utility.parallel_executor import ParallelExecutor, trace_source_from_traces, get_n_samples
+
+
+def block_spectra(source, positions, fs, max_frequency, bin_averaging, workers):
+    # runs in a worker process of the ParallelExecutor
+    return spectrum_engine.magnitude_spectra(source.read_window(positions), fs, max_frequency, bin_averaging,
+                                             workers)
 
 
 class FrequencyAnalysisThread(QtCore.QThread):
@@ -7,31 +15,49 @@ class FrequencyAnalysisThread(QtCore.QThread):
     progress_made = QtCore.pyqtSignal(float)
     finished = QtCore.pyqtSignal()
 
-    def __init__(self, parent, reader, grid_indices, filtered):
+    def __init__(self, parent, reader, grid_indices, filtered, max_frequency=100.0, bin_averaging=1):
         super().__init__(parent)
         self.reader = reader
         self.labels = self.reader.labels
         self.grid_indices = grid_indices
         self.filtered = filtered
+        self.max_frequency = max_frequency
+        self.bin_averaging = bin_averaging
 
         self.frequencies = None
+        self.frequency_axis = None
 
     def analyzing_frequencies(self, reader):
         # idea behind this function is to go through MEA channels and compute the fast fourier transform to this channel
         # and afterwards, additionally the hann window is computed, so the FT is done on hann*signal to prevent leakage
-        # effects
-        frequencies = []
+        # effects. Only the amplitudes up to max_frequency are kept.
         ids = reader.channel_ids
         selected_ids = [ids[g_idx] for g_idx in self.grid_indices]
-        for idx, ch_id in enumerate(selected_ids):
-            signal = self.filtered[idx]
-            # call function to scale signal -> question is, if the effects will then be so soft as with the CSD video
-            # spectrograms
-            hann = np.hanning(len(signal))
-            y_hann = np.fft.fft(hann*signal)
-            frequencies.append(y_hann)
-            progress = round(((idx + 1) / len(selected_ids)) * 100.0, 2)  # change idx of same_len_labels at the
-            self.progress_made.emit(progress)
+        frequencies = [None] * len(selected_ids)
+        fs = reader.sampling_frequency
+        n_samples = get_n_samples(self.filtered)
+        self.frequency_axis = spectrum_engine.get_frequencies(n_samples, fs, self.max_frequency, self.bin_averaging)
+
+        # the channels are transformed in blocks (as many as fit into the memory limit) and the blocks are distributed
+        # over all cores
+        source = trace_source_from_traces(self.filtered)
+        channels_per_block = spectrum_engine.get_channels_per_block(n_samples)
+        try:
+            with ParallelExecutor() as executor:
+                # if several processes compute FFTs, each of them uses one thread only
+                fft_workers = 1 if executor.max_workers > 1 else -1
+                tasks = [(source, range(start, min(start + channels_per_block, len(selected_ids))), fs,
+                          self.max_frequency, self.bin_averaging, fft_workers)
+                         for start in range(0, len(selected_ids), channels_per_block)]
+                finished_channels = 0
+                for task_index, magnitudes in executor.map_tasks(block_spectra, tasks):
+                    for block_idx, idx in enumerate(tasks[task_index][1]):
+                        frequencies[idx] = magnitudes[block_idx]
+                    finished_channels += len(tasks[task_index][1])
+                    progress = round((finished_channels / len(selected_ids)) * 100.0, 2)
+                    self.progress_made.emit(progress)
+        finally:
+            source.close()
         return frequencies
 
     def run(self):
@@ -0,0 +1,64 @@
+import numpy as np
+import scipy.fft
+
+
+# In this script the amplitude spectra of the frequency analysis are computed. Since the recorded signals are real, the
+# real FFT (rfft) is used, which only computes the non-negative frequencies and needs half the time and memory of the
+# complex FFT. Of the spectrum only the magnitudes up to the highest frequency that is analyzed (e.g. 100 Hz) are kept,
+# which for a recording of 10 min at 25 kHz is a few thousand values instead of 15 million complex numbers per channel.
+
+def get_fft_length(n_samples):
+    """
+    :param n_samples: number of samples of the traces
+    :return: FFT length >= n_samples that scipy can compute fast (the traces are zero-padded to this length)
+    """
+    return scipy.fft.next_fast_len(n_samples, real=True)
+
+
+def get_frequencies(n_samples, fs, max_frequency, bin_averaging=1):
+    """
+    :param n_samples: number of samples of the traces
+    :param fs: sampling frequency in Hz
+    :param max_frequency: highest frequency which is kept in Hz
+    :param bin_averaging: number of neighbouring frequency bins which are averaged into one
+    :return: frequencies of the bins returned by magnitude_spectra
+    """
+    n_fft = get_fft_length(n_samples)
+    frequencies = scipy.fft.rfftfreq(n_fft, 1 / fs)
+    n_bins = np.searchsorted(frequencies, max_frequency, side='right')
+    n_bins -= n_bins % bin_averaging
+    return frequencies[:n_bins].reshape(-1, bin_averaging).mean(axis=1)
+
+
+def magnitude_spectra(block, fs, max_frequency, bin_averaging=1, workers=-1):
+    """
+    Computes the amplitude spectra of several channels at once. The traces are multiplied with a hann window to
+    prevent leakage effects.
+    :param block: numpy array with shape (channels, samples) or a single trace
+    :param fs: sampling frequency in Hz
+    :param max_frequency: highest frequency which is kept in Hz
+    :param bin_averaging: number of neighbouring frequency bins which are averaged into one
+    :param workers: number of threads scipy uses for the FFT, -1 uses all cores
+    :return: amplitude spectra with shape (channels, len(get_frequencies(...))) as float32
+    """
+    block = np.asarray(block)
+    n_samples = block.shape[-1]
+    n_fft = get_fft_length(n_samples)
+    spectra = scipy.fft.rfft(block * np.hanning(n_samples), n=n_fft, axis=-1, workers=workers)
+    n_bins = len(get_frequencies(n_samples, fs, max_frequency, bin_averaging)) * bin_averaging
+    # same scaling as the single sided amplitude spectrum MEAsure used so far
+    magnitudes = 2.0 * np.abs(spectra[..., :n_bins]) / (n_samples // 2 + 1)
+    del spectra
+    magnitudes = magnitudes.reshape(magnitudes.shape[:-1] + (-1, bin_averaging)).mean(axis=-1)
+    return magnitudes.astype(np.float32)
+
+
+def get_channels_per_block(n_samples, memory_limit=2**29):
+    """
+    :param n_samples: number of samples of the traces
+    :param memory_limit: bytes the input block, the windowed copy and the complex spectra may use together
+    :return: number of channels which are transformed at once
+    """
+    # float64 input + windowed float64 copy + complex128 spectrum of about half the length
+    bytes_per_channel = n_samples * (8 + 8 + 8)
+    return max(1, int(memory_limit // bytes_per_channel))
@@ -0,0 +1,50 @@
+from functools import lru_cache
+import numpy as np
+import scipy.fft
+
+
+# In this script the PSDs of all channels are reduced to the mean power of frequency bands. The bins that belong to a
+# band only depend on the sampling frequency, the segment length of the Welch PSD and the band table, so they are
+# determined only once. Afterwards the band means of all channels are computed at once from cumulative sums of the PSD
+# matrix.
+
+@lru_cache(maxsize=32)
+def get_band_bins(fs, nperseg, band_table):
+    """
+    Finds the PSD bins of each band
+    :param fs: sampling frequency in Hz
+    :param nperseg: segment length of the Welch PSD (the PSD has nperseg // 2 + 1 bins)
+    :param band_table: tuple of (band name, lower edge, upper edge, upper edge included) tuples, a band holds the
+    frequencies lower edge <= f < upper edge (lower edge <= f <= upper edge if the upper edge is included)
+    :return: index of the first bin and index after the last bin of each band
+    """
+    frequencies = scipy.fft.rfftfreq(nperseg, 1 / fs)
+    starts, stops = [], []
+    for _, lower_edge, upper_edge, upper_included in band_table:
+        start = np.searchsorted(frequencies, lower_edge, side='left')
+        stop = np.searchsorted(frequencies, upper_edge, side='right' if upper_included else 'left')
+        starts.append(start)
+        stops.append(max(stop, start))
+    return np.array(starts, dtype=np.int64), np.array(stops, dtype=np.int64)
+
+
+def compute_band_powers(psd, fs, nperseg, band_table):
+    """
+    Computes the mean power of every band for all channels
+    :param psd: PSD matrix with shape (channels, nperseg // 2 + 1)
+    :param fs: sampling frequency in Hz
+    :param nperseg: segment length of the Welch PSD
+    :param band_table: list of [band name, lower edge, upper edge] with an optional fourth value, which includes the
+    upper edge if True (see FrequencyBandsAnalysisSettings)
+    :return: matrix of mean band powers with shape (channels, bands), bands without bins get the power 0
+    """
+    band_table = tuple((str(band[0]), float(band[1]), float(band[2]), len(band) > 3 and bool(band[3]))
+                       for band in band_table)
+    starts, stops = get_band_bins(float(fs), int(nperseg), band_table)
+    psd = np.atleast_2d(np.asarray(psd, dtype=np.float64))
+    # with the cumulative sum, the sum of any bin range is the difference of two values
+    cumulative = np.zeros((psd.shape[0], psd.shape[1] + 1))
+    np.cumsum(psd, axis=1, out=cumulative[:, 1:])
+    counts = stops - starts
+    sums = cumulative[:, stops] - cumulative[:, starts]
+    return np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
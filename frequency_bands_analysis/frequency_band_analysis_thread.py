@@ -1,5 +1,14 @@
 from PyQt5 import QtCore
-import scipy.signal as signal
+import numpy as np
+
+from frequency_bands_analysis.psd_engine import WelchAccumulator, segment_power_sum
+from frequency_bands_analysis.psd_cache import PsdCache, trace_fingerprint, traces_signature
+from utility.parallel_executor import ParallelExecutor, trace_source_from_traces, get_n_samples
+
+
+def block_power_sum(source, positions, start, stop, window, step, workers):
+    # runs in a worker process of the ParallelExecutor
+    return segment_power_sum(source.read_window(positions, start, stop), window, step, workers)
 
 
 class FrequencyBandAnalysisThread(QtCore.QThread):
@@ -8,37 +17,90 @@ class FrequencyBandAnalysisThread(QtCore.QThread):
     finished = QtCore.pyqtSignal()
     data_updated = QtCore.pyqtSignal(list)
 
-    def __init__(self, parent, reader, grid_indices, grid_labels, filtered):
+    def __init__(self, parent, reader, grid_indices, grid_labels, filtered, nperseg=2**14, cache_path=None, fs=None,
+                 skipped_indices=()):
         super().__init__(parent)
         self.reader = reader
         self.grid_indices = grid_indices
         self.grid_labels = grid_labels
         self.filtered = filtered
+        # bad channels (see channel_quality.py) keep their place in the results, but are not read and get a NaN PSD
+        self.skipped_indices = set(skipped_indices)
+        # sampling frequency of the filtered traces, which differs from the recording for the decimated LFP copy
+        self.fs = reader.sampling_frequency if fs is None else fs
+        # nperseg is given for the sampling frequency of the recording, the segments keep their duration (and so the
+        # frequency resolution of the PSD) for decimated traces
+        self.nperseg = int(round(nperseg * self.fs / reader.sampling_frequency))
+        # PSDs that were already computed from the same traces with the same parameters are loaded from this file
+        self.cache = PsdCache(cache_path) if cache_path is not None else None
         self.frequencies, self.power = None, None
 
     def analyzing_frequency_bands(self):
-        frequencies = []
-        powers = []
         # if analysis is done without filtering before:
         # ids = reader.channel_ids
         # selected_ids = [ids[g_idx] for g_idx in self.grid_indices]
         # for idx, ch_id in enumerate(selected_ids):
         #     label = reader.labels[ch_id]
-        for idx in range(len(self.filtered)):
-            label = self.grid_labels[idx]
-            # scaled_signal = reader.get_scaled_channel(label)
-            filtered_trace = self.filtered[idx]
-            # freqs, Pxx = signal.welch(scaled_signal, self.reader.sampling_frequency, nperseg=2**14)
-            freqs, Pxx = signal.welch(filtered_trace, self.reader.sampling_frequency, nperseg=2**14)
-            frequencies.append(freqs)
-            powers.append(Pxx)
-            data = [label, freqs, Pxx]
+        n_channels = len(self.filtered)
+        n_samples = get_n_samples(self.filtered)
+        accumulator = WelchAccumulator(self.fs, nperseg=self.nperseg)
+
+        # first, all PSDs which are cached for the current traces are loaded (only traces read from a .meae file can be
+        # recognized, see psd_cache.py)
+        cached_psds = dict()
+        signature = traces_signature(self.filtered)
+        use_cache = self.cache is not None and signature is not None
+        if use_cache:
+            self.operation_changed.emit('Looking for cached Power Spectral Densities')
+            cache_key = PsdCache.get_key(accumulator.fs, accumulator.nperseg, accumulator.noverlap)
+            fingerprints = [trace_fingerprint(self.filtered, idx) if idx not in self.skipped_indices else None
+                            for idx in range(n_channels)]
+            _, cached_psds = self.cache.load(cache_key, signature, self.grid_labels, fingerprints)
+        missing = [idx for idx in range(n_channels) if idx not in cached_psds and idx not in self.skipped_indices]
+
+        if len(missing) > 0:
+            self.operation_changed.emit('Calculating Power Spectral Density of channels')
+            # Instead of one channel after the other, time blocks of all (missing) channels are read and the
+            # periodograms of their segments are added up. So the traces are read only once, from beginning to end.
+            blocks = accumulator.plan_blocks(n_samples, accumulator.get_segments_per_block(len(missing)))
+            source = trace_source_from_traces(self.filtered)
+            try:
+                with ParallelExecutor() as executor:
+                    # if several processes compute FFTs, each of them uses one thread only
+                    fft_workers = 1 if executor.max_workers > 1 else -1
+                    tasks = [(source, missing, start, stop, accumulator.window, accumulator.step, fft_workers)
+                             for start, stop in blocks]
+                    for finished, (task_index, (power_sum, n_segments)) in enumerate(
+                            executor.map_tasks(block_power_sum, tasks)):
+                        accumulator.add(power_sum, n_segments)
+                        progress = round(((finished + 1) / len(tasks)) * 100.0, 2)
+                        self.progress_made.emit(progress)
+            finally:
+                source.close()
+            freqs, missing_psds = accumulator.get_psd()
+            if use_cache:
+                self.cache.store(cache_key, signature, [self.grid_labels[idx] for idx in missing],
+                                 [fingerprints[idx] for idx in missing], freqs, missing_psds)
+        else:
+            freqs = np.fft.rfftfreq(accumulator.nperseg, 1 / accumulator.fs)
+            missing_psds = []
+            self.progress_made.emit(100.0)
+
+        psds = [None] * n_channels
+        for idx, psd in cached_psds.items():
+            psds[idx] = psd
+        for idx, psd in zip(missing, missing_psds):
+            psds[idx] = psd
+        for idx in self.skipped_indices:
+            if idx < n_channels:
+                psds[idx] = np.full(len(freqs), np.nan)
+        frequencies = [freqs] * n_channels
+        powers = psds
+        for idx in range(n_channels):
+            data = [self.grid_labels[idx], freqs, psds[idx]]
             self.data_updated.emit(data)
-            progress = round(((idx + 1) / len(self.filtered)) * 100.0, 2)
-            self.progress_made.emit(progress)
         return frequencies, powers
 
     def run(self):
-        self.operation_changed.emit('Calculating Power Spectral Density of channels')
         self.frequencies, self.power = self.analyzing_frequency_bands()
-        self.finished.emit()
\ No newline at end of file
+        self.finished.emit()
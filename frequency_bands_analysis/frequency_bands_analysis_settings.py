@@ -1,3 +1,6 @@
+import copy
+
+
 class FrequencyBandsAnalysisSettings:
 
     class ChannelSelection:
@@ -8,17 +11,56 @@ class FrequencyBandsAnalysisSettings:
         ICTAL = 0
         CSD = 1
 
+    # Band tables which are always available. Every band is [name, lower edge in Hz, upper edge in Hz] and holds the
+    # frequencies lower edge <= f < upper edge. An optional fourth value True includes the upper edge as well: the
+    # '< 1 Hz' band has always held the frequencies 0 <= f <= 1 Hz.
+    DEFAULT_BAND_TABLES = {
+        'ictal activity': [['< 1 Hz', 0, 1, True], ['delta', 2, 6], ['theta', 6, 11], ['alpha', 11, 16],
+                           ['beta', 21, 41], ['gamma', 41, 101]],
+        'CSD': [['50 Hz', 40, 60], ['350 Hz', 340, 360]],
+    }
+    # band table which is used for each analysis mode
+    MODE_BAND_TABLES = {
+        AnalysisMode.ICTAL: 'ictal activity',
+        AnalysisMode.CSD: 'CSD',
+    }
+
     def __init__(self):
         self.channel_selection = FrequencyBandsAnalysisSettings.ChannelSelection.ALL
         self.analysis_mode = FrequencyBandsAnalysisSettings.AnalysisMode.ICTAL
+        # user defined band tables are added to this dictionary
+        self.band_tables = copy.deepcopy(FrequencyBandsAnalysisSettings.DEFAULT_BAND_TABLES)
+        # name of the band table to use, None uses the table of the analysis mode
+        self.band_table_name = None
+
+    def get_band_table_name(self):
+        if self.band_table_name in self.band_tables:
+            return self.band_table_name
+        return FrequencyBandsAnalysisSettings.MODE_BAND_TABLES[self.analysis_mode]
+
+    def get_band_table(self):
+        """
+        :return: list of [band name, lower edge, upper edge] of the selected band table
+        """
+        return self.band_tables[self.get_band_table_name()]
+
+    def get_band_names(self):
+        return [band[0] for band in self.get_band_table()]
 
     def to_dict(self):
         result = dict()
         result['channel selection'] = self.channel_selection
         result['analysis mode'] = self.analysis_mode
+        result['band tables'] = self.band_tables
+        result['band table name'] = self.band_table_name
+        return result
 
     def from_dict(self, dictionary):
         if 'channel selection' in dictionary.keys():
             self.channel_selection = dictionary['channel selection']
         if 'analysis mode' in dictionary.keys():
             self.analysis_mode = dictionary['analysis mode']
+        if 'band tables' in dictionary.keys():
+            self.band_tables.update(dictionary['band tables'])
+        if 'band table name' in dictionary.keys():
+            self.band_table_name = dictionary['band table name']
@@ -38,11 +38,20 @@ class FrequencyBandsAnalysisSettingsDialog(QtWidgets.QDialog):
 
         analysis_selection_layout = QtWidgets.QVBoxLayout(analysis_selection_group_box)
 
-        self.ictal_activity_button = QtWidgets.QRadioButton('analyse ictal activity')
-        analysis_selection_layout.addWidget(self.ictal_activity_button)
-
-        self.csd_activity_button = QtWidgets.QRadioButton('analyse CSD data')
-        analysis_selection_layout.addWidget(self.csd_activity_button)
+        # every band table (the default ones for ictal activity and CSD data and the ones defined by the user) can be
+        # selected here
+        self.band_table_widget = QtWidgets.QComboBox(self)
+        self.band_table_widget.setEditable(False)
+        analysis_selection_layout.addWidget(self.band_table_widget)
+
+        # the bands of the selected table are shown as text, e.g. 'delta: 2-6; theta: 6-11', and can be edited. Edited
+        # bands are stored as a new table under the name entered below.
+        analysis_selection_layout.addWidget(QtWidgets.QLabel('Bands (name: lower edge-upper edge in Hz; ...):'))
+        self.bands_textbox = QtWidgets.QLineEdit(self)
+        analysis_selection_layout.addWidget(self.bands_textbox)
+        analysis_selection_layout.addWidget(QtWidgets.QLabel('Name of band table:'))
+        self.band_table_name_textbox = QtWidgets.QLineEdit(self)
+        analysis_selection_layout.addWidget(self.band_table_name_textbox)
 
         main_layout.addWidget(analysis_selection_group_box)
 
@@ -58,13 +67,66 @@ class FrequencyBandsAnalysisSettingsDialog(QtWidgets.QDialog):
 
         self.setWindowTitle(title)
 
+        if not initial_settings:
+            initial_settings = FrequencyBandsAnalysisSettings()
+        self.band_tables = dict(initial_settings.band_tables)
+
+        self.band_table_widget.currentTextChanged.connect(self.on_band_table_changed)
+        self.set_settings(initial_settings)
+
+    def set_settings(self, settings):
+        if settings.channel_selection == FrequencyBandsAnalysisSettings.ChannelSelection.ALL:
+            self.all_channels_button.setChecked(True)
+        elif settings.channel_selection == FrequencyBandsAnalysisSettings.ChannelSelection.SELECTION:
+            self.selected_channels_button.setChecked(True)
+        self.band_table_widget.addItems(list(self.band_tables.keys()))
+        self.band_table_widget.setCurrentText(settings.get_band_table_name())
+        self.on_band_table_changed(settings.get_band_table_name())
+
+    def on_band_table_changed(self, band_table_name):
+        if band_table_name in self.band_tables:
+            self.bands_textbox.setText(self.bands_to_text(self.band_tables[band_table_name]))
+            self.band_table_name_textbox.setText(band_table_name)
+
+    @staticmethod
+    def bands_to_text(band_table):
+        return '; '.join(str(band[0]) + ': ' + str(band[1]) + '-' + str(band[2]) for band in band_table)
+
+    @staticmethod
+    def text_to_bands(text):
+        band_table = []
+        for band_text in text.split(';'):
+            if ':' not in band_text:
+                continue
+            name, edges = band_text.rsplit(':', 1)
+            lower, upper = edges.split('-')
+            band_table.append([name.strip(), float(lower), float(upper)])
+        return band_table
+
     def get_settings(self):
         settings = FrequencyBandsAnalysisSettings()
         settings.channel_selection = self.selected_channels_button.isChecked()
-        if self.ictal_activity_button.isChecked():
-            settings.analysis_mode = 0
-        elif self.csd_activity_button.isChecked():
-            settings.analysis_mode = 1
+        settings.band_tables = self.band_tables
+        band_table_name = self.band_table_name_textbox.text().strip() or self.band_table_widget.currentText()
+        try:
+            band_table = self.text_to_bands(self.bands_textbox.text())
+        except ValueError:
+            band_table = []
+        # bands that were not changed keep all their values (e.g. an included upper edge, see
+        # FrequencyBandsAnalysisSettings)
+        current_band_table = self.band_tables.get(self.band_table_widget.currentText(), [])
+        existing_bands = {tuple(band[:3]): band for band in current_band_table}
+        band_table = [existing_bands.get(tuple(band), band) for band in band_table]
+        if len(band_table) > 0 and band_table != self.band_tables.get(band_table_name):
+            # edited bands are stored as a new (or changed) user defined table
+            if band_table_name in FrequencyBandsAnalysisSettings.DEFAULT_BAND_TABLES:
+                band_table_name += ' (edited)'
+            settings.band_tables[band_table_name] = band_table
+        settings.band_table_name = band_table_name if band_table_name in settings.band_tables else None
+        # the analysis mode is kept for the default tables
+        for analysis_mode, mode_table_name in FrequencyBandsAnalysisSettings.MODE_BAND_TABLES.items():
+            if settings.band_table_name == mode_table_name:
+                settings.analysis_mode = analysis_mode
         return settings
 
     def on_okay_clicked(self):
@@ -8,15 +8,25 @@ from IPython import embed
 from plots.plot_widget import PlotWidget
 from plot_manager import PlotManager
 from frequency_bands_analysis.frequency_band_analysis_thread import FrequencyBandAnalysisThread
+from frequency_bands_analysis.band_power import compute_band_powers
+from frequency_bands_analysis.psd_cache import get_cache_path
+from filtering.lfp_decimation import select_traces
+
+
+# nicer axis labels for the bands of the default band tables, other bands are labeled with their name
+BAND_TICK_LABELS = {'< 1 Hz': r'$\leq$ 1 Hz', 'delta': r'$\delta$', 'theta': r'$\theta$', 'alpha': r'$\alpha$',
+                    'beta': r'$\beta$', 'gamma': r'$\gamma$'}
 
 
 class FrequencyBandsTab(QtWidgets.QWidget):
-    def __init__(self, parent, reader, grid_indices, grid_labels, settings):
+    def __init__(self, parent, reader, grid_indices, grid_labels, settings, skipped_indices=()):
         super().__init__(parent)
         self.reader = reader
         self.grid_indices = grid_indices
         self.grid_labels = grid_labels
         self.settings = settings
+        # positions (in grid_labels) of bad channels, their band powers are NaN
+        self.skipped_indices = skipped_indices
 
         self.mea_file_view = parent
 
@@ -58,15 +68,18 @@ class FrequencyBandsTab(QtWidgets.QWidget):
 
     def initialize_frequency_bands_analysis(self):
         if self.frequency_bands_matrix is None:
-            filtered = self.mea_file_view.results.get_filter_mat()
+            # the decimated LFP copy of the filtered traces is used if it holds all bands
+            max_frequency = max(band[2] for band in self.settings.get_band_table())
+            filtered, fs = select_traces(self.mea_file_view.results, self.reader.sampling_frequency, max_frequency)
             self.progress_bar.setValue(0)
             self.progress_label.setText('')
             self.operation_label.setText('Calculating PSD')
             self.frequency_bands_thread = FrequencyBandAnalysisThread(self, self.reader, self.grid_indices,
-                                                                      self.grid_labels, filtered)
+                                                                      self.grid_labels, filtered,
+                                                                      cache_path=get_cache_path(self.reader.file_path),
+                                                                      fs=fs, skipped_indices=self.skipped_indices)
             self.frequency_bands_thread.progress_made.connect(self.on_progress_made)
             self.frequency_bands_thread.operation_changed.connect(self.on_operation_changed)
-            self.frequency_bands_thread.data_updated.connect(self.on_data_updated)
             self.frequency_bands_thread.finished.connect(self.on_frequency_bands_thread_finished)
 
             debug_mode = False
@@ -75,55 +88,20 @@ class FrequencyBandsTab(QtWidgets.QWidget):
             else:
                 self.frequency_bands_thread.start()
 
-    @QtCore.pyqtSlot(list)
-    def on_data_updated(self, data):
-        # utility functions
-        # find Paper reference for this
-        def get_band_name(frequency):
-            if self.settings.analysis_mode == 0:
-                if 0 <= frequency <= 1:
-                    return '< 1 Hz'
-                if 2 <= frequency < 6:
-                    return 'delta'
-                elif 6 <= frequency < 11:
-                    return 'theta'
-                elif 11 <= frequency < 16:
-                    return 'alpha'
-                elif 21 <= frequency < 41:
-                    return 'beta'
-                elif 41 <= frequency < 101:
-                    return 'gamma'
-                else:
-                    return None
-            elif self.settings.analysis_mode == 1:
-                if 40 <= frequency < 60:
-                    return '50 Hz'
-                elif 340 <= frequency < 360:
-                    return '350 Hz'
-                else:
-                    return None
-
-        label, frequencies, powers = data[0], data[1], data[2]
-        if self.settings.analysis_mode == 0:
-            band_names = '< 1 Hz', 'delta', 'theta', 'alpha', 'beta', 'gamma'
-        elif self.settings.analysis_mode == 1:
-            band_names = '50 Hz', '350 Hz'
-
-        band_amplitude_map = dict()
-        for band_name in band_names:
-            band_amplitude_map[band_name] = []
-        for freq, power in zip(frequencies, powers):
-            band_name = get_band_name(freq)
-            if band_name:
-                band_amplitude_map[band_name].append(power)
-        band_sum_map = dict()
-        for band_name in band_names:
-            band_amplitudes = band_amplitude_map[band_name]
-            if len(band_amplitudes) > 0:
-                band_sum_map[band_name] = np.mean(band_amplitudes)
-            else:
-                band_sum_map[band_name] = 0
-        self.mea_file_view.results.add_frequency_analysis_result(label, band_sum_map)
+    def compute_band_powers(self, psd_matrix, fs, nperseg):
+        """
+        Reduces the PSDs of all channels to the mean power of each band of the selected band table and stores them in
+        the results
+        :param psd_matrix: PSDs with shape (channels, frequencies)
+        :param fs: sampling frequency of the traces the PSDs were computed from
+        :param nperseg: segment length the PSDs were computed with
+        """
+        band_table = self.settings.get_band_table()
+        band_names = [band[0] for band in band_table]
+        band_powers = compute_band_powers(psd_matrix, fs, nperseg, band_table)
+        for label, channel_band_powers in zip(self.grid_labels, band_powers):
+            band_sum_map = dict(zip(band_names, channel_band_powers))
+            self.mea_file_view.results.add_frequency_analysis_result(label, band_sum_map)
 
     @QtCore.pyqtSlot(str)
     def on_operation_changed(self, operation):
@@ -137,6 +115,8 @@ class FrequencyBandsTab(QtWidgets.QWidget):
 
     def on_frequency_bands_thread_finished(self):
         self.progress_label.setText('Finished :)')
+        self.compute_band_powers(np.asarray(self.frequency_bands_thread.power), self.frequency_bands_thread.fs,
+                                 self.frequency_bands_thread.nperseg)
         self.frequency_bands_thread = None
         self.plot()
 
@@ -157,20 +137,14 @@ class FrequencyBandsTab(QtWidgets.QWidget):
                                                     key=lambda r: r.label)):
                     ax = fig.add_subplot(spec[idx])
 
-                    if self.settings.analysis_mode == 0:
-                        band_names = '< 1 Hz', 'delta', 'theta', 'alpha', 'beta', 'gamma'
-                    elif self.settings.analysis_mode == 1:
-                        band_names = '50 Hz', '350 Hz'
+                    band_names = result.band_names
                     means = []
                     for band in band_names:
                         mean = result.band_map[band]
                         means.append(mean)
 
                     # calculate sum of amplitudes
-                    if self.settings.analysis_mode == 0:
-                        xticklabels = [r'$\leq$ 1 Hz', r'$\delta$', r'$\theta$', r'$\alpha$', r'$\beta$', r'$\gamma$']
-                    elif self.settings.analysis_mode == 1:
-                        xticklabels = ['50 Hz', '350 Hz']
+                    xticklabels = [BAND_TICK_LABELS.get(band, band) for band in band_names]
                     ax.bar(range(len(means)), means, align='center')
                     ax.set_xticks(range(len(means)))
                     ax.set_xticklabels(xticklabels)
@@ -195,13 +169,8 @@ class FrequencyBandsTab(QtWidgets.QWidget):
 
                 rows = dict()
 
-                if self.settings.analysis_mode == 0:
-                    band_names = '< 1 Hz', 'delta', 'theta', 'alpha', 'beta', 'gamma'
-                    xticklabels = [r'$\leq$ 1 Hz', r'$\delta$', r'$\theta$', r'$\alpha$', 'SMR', r'$\beta$',
-                                   r'$\gamma$']
-                elif self.settings.analysis_mode == 1:
-                    band_names = '50 Hz', '350 Hz'
-                    xticklabels = ['50 Hz', '350 Hz']
+                # older results may have been computed with another band table
+                band_names = self.mea_file_view.results.get_frequency_band_names()
                 for key_int in key_ints:
                     rows[key_int] = dict()
                     for band in band_names:
@@ -213,8 +182,8 @@ class FrequencyBandsTab(QtWidgets.QWidget):
                     x_labels.append(result.label)
                     # reorganize dictionary that saves plot information
                     row_index = int(result.label[1:]) - 1 # -1 to map first row to index 0
-                    for key in list(result.band_map.keys()):
-                        rows[row_index][key].append(result.band_map[key])
+                    for key in band_names:
+                        rows[row_index][key].append(result.band_map.get(key, np.nan))
                 for key_idx, key in enumerate(list(rows.keys())):
                     ax = fig.add_subplot(spec[key_idx])
                     for j, band_key in enumerate(list(rows[key_idx].keys())):
@@ -242,10 +211,10 @@ class FrequencyBandsTab(QtWidgets.QWidget):
                                                                               'J', 'K', 'L', 'M', 'N', 'O', 'P', 'R']]
                             ax.set_xticks(np.arange(1, len(rows[key_idx][band_key]) + 1))
                             ax.set_xticklabels(xlabels)
-                        maxs.append(np.max(rows[key_idx][band_key]))
+                        maxs.append(np.nanmax(rows[key_idx][band_key]))
                 axs = fig.get_axes()
                 for axi in axs:
-                    axi.set_ylim(0, np.max(maxs)+5)
+                    axi.set_ylim(0, np.nanmax(maxs)+5)
                 fig.text(0.5, 0.01, 'channel', ha='center')
                 fig.text(0.01, 0.5, r'mean power [$\mu V^{2}/$Hz]', va='center', rotation='vertical')
                 fig.legend()
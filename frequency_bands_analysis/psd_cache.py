@@ -0,0 +1,122 @@
+import hashlib
+import os
+import numpy as np
+import h5py
+
+from file_handling.channel_statistics import get_source_signature
+from utility.parallel_executor import Hdf5RowView, get_n_samples, read_trace
+
+
+# In this script the PSDs of the frequency bands analysis are cached in a sidecar file next to the recording
+# (<recording>_psd.h5). When the analysis is run again (e.g. with another band table) the PSDs are loaded from there
+# instead of being estimated again. A PSD is only taken from the cache if it was computed with the same parameters
+# (sampling frequency, segment length and overlap) from the same traces. The traces are recognized by the .meae file
+# they are read from: its modification time and size change whenever it is written again (e.g. filtered again or
+# resumed) and its 'filter' dataset holds the filter parameters. As an extra check, a fingerprint of a few hundred
+# samples at the beginning, middle and end of every trace is stored with its PSD. Filtered traces that are only held
+# in memory can not be recognized reliably, their PSDs are not cached.
+
+def get_cache_path(recording_path):
+    return os.path.splitext(recording_path)[0] + '_psd.h5'
+
+
+def traces_signature(traces):
+    """
+    :param traces: traces handed to the analysis (list of numpy arrays, matrix, h5py dataset or Hdf5RowView)
+    :return: hex string which changes if the .meae file of the traces is written again or holds traces filtered with
+    other parameters, None for traces held in memory
+    """
+    if isinstance(traces, Hdf5RowView):
+        dataset = traces.dataset
+    elif isinstance(traces, h5py.Dataset):
+        dataset = traces
+    else:
+        return None
+    file = dataset.file
+    signature = hashlib.sha1(repr(get_source_signature(file.filename)).encode('utf8'))
+    signature.update(dataset.name.encode('utf8'))
+    # the filter parameters are attributes of the 'filter' dataset, an LFP copy is decimated from it
+    for dataset_name in sorted({'filter', dataset.name.strip('/')}):
+        if dataset_name in file:
+            for key in sorted(file[dataset_name].attrs.keys()):
+                signature.update((key + '=' + repr(file[dataset_name].attrs[key])).encode('utf8'))
+    return signature.hexdigest()
+
+
+def trace_fingerprint(traces, position, n_probe_samples=256):
+    """
+    :param traces: traces handed to the analysis (list of numpy arrays, matrix or h5py dataset)
+    :param position: position of the trace in traces
+    :param n_probe_samples: number of samples read at the beginning, middle and end of the trace
+    :return: hex string which changes if the length or the probed samples of the trace change
+    """
+    # only the probed samples are read, a row of a h5py dataset is never read completely
+    n_samples = get_n_samples(traces)
+    middle = n_samples // 2
+    probes = [read_trace(traces, position, 0, min(n_probe_samples, n_samples)),
+              read_trace(traces, position, middle, min(middle + n_probe_samples, n_samples)),
+              read_trace(traces, position, max(n_samples - n_probe_samples, 0), n_samples)]
+    fingerprint = hashlib.sha1(str(n_samples).encode('utf8'))
+    for probe in probes:
+        fingerprint.update(np.ascontiguousarray(probe, dtype=np.float64).tobytes())
+    return fingerprint.hexdigest()
+
+
+class PsdCache:
+    """
+    The PsdCache stores one PSD per channel label and parameter set in a sidecar HDF5 file
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def get_key(fs, nperseg, noverlap):
+        return 'fs_' + str(float(fs)) + '_nperseg_' + str(int(nperseg)) + '_noverlap_' + str(int(noverlap))
+
+    def load(self, key, signature, labels, fingerprints):
+        """
+        :param key: parameter key (see get_key)
+        :param signature: signature of the current traces (see traces_signature)
+        :param labels: channel labels
+        :param fingerprints: fingerprints of the current traces of the channels
+        :return: frequencies (None if nothing is cached) and a dictionary mapping the position of each channel, whose
+        PSD is cached for the same trace, to its PSD
+        """
+        psds = dict()
+        if not os.path.exists(self.path):
+            return None, psds
+        try:
+            with h5py.File(self.path, 'r') as file:
+                if key not in file:
+                    return None, psds
+                group = file[key]
+                for position, (label, fingerprint) in enumerate(zip(labels, fingerprints)):
+                    label = str(label)
+                    if label in group and group[label].attrs.get('signature') == signature and \
+                            group[label].attrs['fingerprint'] == fingerprint:
+                        psds[position] = group[label][:]
+                return group['frequencies'][:], psds
+        except OSError:
+            # a damaged or locked cache is simply not used
+            return None, psds
+
+    def store(self, key, signature, labels, fingerprints, frequencies, psds):
+        """
+        Stores (or replaces) the PSDs of the given channels
+        :param psds: PSDs with shape (len(labels), len(frequencies))
+        """
+        try:
+            with h5py.File(self.path, 'a') as file:
+                group = file.require_group(key)
+                if 'frequencies' not in group:
+                    group.create_dataset('frequencies', data=frequencies)
+                for label, fingerprint, psd in zip(labels, fingerprints, psds):
+                    label = str(label)
+                    if label in group:
+                        del group[label]
+                    group.create_dataset(label, data=psd)
+                    group[label].attrs['signature'] = signature
+                    group[label].attrs['fingerprint'] = fingerprint
+        except OSError:
+            # without write access to the folder of the recording the PSDs are not cached
+            pass
@@ -0,0 +1,106 @@
+import numpy as np
+import scipy.fft
+from scipy.signal import get_window
+
+
+# In this script the power spectral densities (PSD) of the frequency bands analysis are estimated with Welch's method:
+# the traces are cut into overlapping segments, every segment is detrended, windowed and Fourier transformed and the
+# periodograms of all segments are averaged. Instead of calling scipy.signal.welch for one whole trace after the other,
+# the segments of all channels in a time block are transformed with one FFT call and only the sum of their periodograms
+# is kept. Adding up these sums block by block gives the same result as scipy.signal.welch (with its default
+# settings), but the recording is read only once from beginning to end and never has to fit into memory.
+
+class WelchAccumulator:
+    """
+    The WelchAccumulator sums up the periodograms of the segments of all channels and computes the PSDs from them
+    """
+    def __init__(self, fs, nperseg=2**14, noverlap=None):
+        """
+        :param fs: sampling frequency in Hz
+        :param nperseg: number of samples per segment
+        :param noverlap: number of samples two following segments overlap, None means half a segment
+        """
+        self.fs = fs
+        self.nperseg = nperseg
+        self.noverlap = nperseg // 2 if noverlap is None else noverlap
+        self.step = self.nperseg - self.noverlap
+        self.window = get_window('hann', self.nperseg)
+        self.power_sum = None
+        self.n_segments = 0
+
+    def plan_blocks(self, n_samples, segments_per_block):
+        """
+        Splits a recording into time blocks of whole segments. Each segment is in exactly one block, so the blocks can
+        be processed independently (and in any order).
+        :param n_samples: number of samples of the recording
+        :param segments_per_block: number of segments per block
+        :return: list of (start, stop) sample indices of the blocks
+        """
+        n_total_segments = 0 if n_samples < self.nperseg else (n_samples - self.nperseg) // self.step + 1
+        blocks = []
+        for first_segment in range(0, n_total_segments, segments_per_block):
+            last_segment = min(first_segment + segments_per_block, n_total_segments) - 1
+            blocks.append((first_segment * self.step, last_segment * self.step + self.nperseg))
+        return blocks
+
+    def get_segments_per_block(self, n_channels, memory_limit=2**29):
+        """
+        :param n_channels: number of channels that are processed at once
+        :param memory_limit: bytes a block may use (the block itself, the windowed segments and their spectra)
+        :return: number of segments per block
+        """
+        # the windowed segments and their spectra are about twice as large as the block itself (with 50 % overlap)
+        bytes_per_segment = n_channels * self.nperseg * 8 * 5
+        return max(1, int(memory_limit // bytes_per_segment))
+
+    def add(self, power_sum, n_segments):
+        """
+        Adds the result of segment_power_sum to the running sum
+        """
+        if self.power_sum is None:
+            self.power_sum = np.zeros_like(power_sum)
+        self.power_sum += power_sum
+        self.n_segments += n_segments
+
+    def add_block(self, block, workers=-1):
+        """
+        Adds all segments of a block, the block has to start at the beginning of a segment (see plan_blocks)
+        :param block: numpy array with shape (channels, samples)
+        :param workers: number of threads scipy uses for the FFT, -1 uses all cores
+        """
+        self.add(*segment_power_sum(block, self.window, self.step, workers))
+
+    def get_psd(self):
+        """
+        :return: frequencies and PSDs with shape (channels, frequencies) in uV^2/Hz (if the traces are in uV)
+        """
+        frequencies = scipy.fft.rfftfreq(self.nperseg, 1 / self.fs)
+        psd = self.power_sum / max(self.n_segments, 1) / (self.fs * np.sum(self.window ** 2))
+        # one sided spectrum: the power of the negative frequencies is added to the positive ones (except for the
+        # frequency 0 and the Nyquist frequency, which exist only once)
+        if self.nperseg % 2 == 0:
+            psd[..., 1:-1] *= 2
+        else:
+            psd[..., 1:] *= 2
+        return frequencies, psd
+
+
+def segment_power_sum(block, window, step, workers=1):
+    """
+    Computes the summed periodograms of all segments which fit completely into a block
+    :param block: numpy array with shape (channels, samples)
+    :param window: window function of length nperseg
+    :param step: number of samples between the starts of two segments
+    :param workers: number of threads scipy uses for the FFT
+    :return: sum of the squared FFT magnitudes with shape (channels, nperseg // 2 + 1) and the number of segments
+    """
+    block = np.asarray(block, dtype=np.float64)
+    nperseg = len(window)
+    if block.shape[-1] < nperseg:
+        return np.zeros(block.shape[:-1] + (nperseg // 2 + 1,)), 0
+    # (channels, segments, nperseg) view on the block, no data is copied here
+    segments = np.lib.stride_tricks.sliding_window_view(block, nperseg, axis=-1)[:, ::step]
+    # detrend (remove mean of each segment) and window
+    windowed = (segments - segments.mean(axis=-1, keepdims=True)) * window
+    spectra = scipy.fft.rfft(windowed, axis=-1, workers=workers)
+    return np.sum(spectra.real ** 2 + spectra.imag ** 2, axis=1), segments.shape[1]
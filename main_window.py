@@ -110,9 +110,9 @@ class MainWindow(QtWidgets.QMainWindow):
         self.save_settings()
         super().closeEvent(close_event)
 
-    @QtCore.pyqtSlot(QtWidgets.QListWidgetItem)
-    def on_file_double_clicked(self, item):
-        absolute_path = os.path.join(self.file_list_view.current_folder, item.text())
+    @QtCore.pyqtSlot(QtWidgets.QTreeWidgetItem, int)
+    def on_file_double_clicked(self, item, column):
+        absolute_path = os.path.join(self.file_list_view.current_folder, item.text(0))
         self.mea_tab_widget.show_mea_file_view(absolute_path)
 
     def save_settings(self):
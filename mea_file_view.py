@@ -1,7 +1,10 @@
 from PyQt5 import QtWidgets, QtGui, QtCore
 
 # all the following imports are script of the MEAsure application
-from file_handling.mcs_data_reader import McsDataReader
+from file_handling.recording_open_thread import RecordingOpenThread
+from file_handling.channel_statistics_thread import ChannelStatisticsThread
+from file_handling.channel_quality_thread import ChannelQualityThread
+from file_handling.channel_quality import ChannelQuality
 from file_handling.meae_data_reader import MeaeDataReader
 from file_handling.SC_data_reader import SCDataReader
 
@@ -28,6 +31,7 @@ from frequency_bands_analysis.frequency_bands_analysis_settings import Frequency
 from frequency_bands_analysis.frequency_bands_tab import FrequencyBandsTab
 
 from plots.raw_trace_plot.raw_trace_plot_tab import RawTracePlotTab
+from plots.trace_browser.trace_browser_tab import TraceBrowserTab
 from plots.csd_plot.csd_plot_tab import CsdPlotTab
 from plots.raster_plot.rasterplot_tab import RasterplotTab
 from plots.heatmap.heatmap_tab import HeatmapTab
@@ -56,11 +60,17 @@ class MeaFileView(QtWidgets.QWidget):
     def __init__(self, parent, mea_file):
         super().__init__(parent)
         self.results = ResultStoring()
-        self.reader = McsDataReader(mea_file)  # in the beginning we will take the mcs python module to look into the
-        # file
+        # The McsDataReader is created by the RecordingOpenThread in the background (see start_opening_recording), so
+        # the view is shown immediately. Until the reader is there, all actions that need the recording are disabled.
+        self.reader = None
+        self.recording_open_thread = None
+        self.channel_statistics_thread = None
+        self.channel_quality_thread = None
+        # labels of dead or disturbed channels and the reason, found by the ChannelQualityThread
+        self.bad_channels = dict()
         self.mea_file = mea_file  # this is just the path to the current mea recording h5 file
 
-        self.file_manager = FileManager(self, self.reader.filename)  # this widget handles tasks in respect to
+        self.file_manager = FileManager(self, mea_file.split('/')[-1])  # this widget handles tasks in respect to
         # filepaths, with it the user is able to chose the .meae filepath (just .h5 data after analysis) or the
         # filepath of results of spyking circus
 
@@ -111,6 +121,12 @@ class MeaFileView(QtWidgets.QWidget):
         self.show_raw_trace_plot_dialog.setIcon(raw_trace_plot_icon)
         self.toolbar.addAction(self.show_raw_trace_plot_dialog)
 
+        self.add_trace_browser_tab = QtWidgets.QAction('Trace browser', self)
+        self.add_trace_browser_tab.triggered.connect(self.open_trace_browser)
+        trace_browser_icon = QtGui.QIcon('./icons/raw_trace_icon.png')
+        self.add_trace_browser_tab.setIcon(trace_browser_icon)
+        self.toolbar.addAction(self.add_trace_browser_tab)
+
         self.show_filter_dialog = QtWidgets.QAction("Filtering", self)
         self.show_filter_dialog.triggered.connect(self.open_filter_dialog)
         filter_icon = QtGui.QIcon("./icons/filter_icon.png")
@@ -173,6 +189,19 @@ class MeaFileView(QtWidgets.QWidget):
 
         main_layout.addWidget(self.toolbar)
 
+        # all actions except showing the file manager and the MEA grid need the recording
+        self.recording_actions = [action for action in self.toolbar.actions()
+                                  if action not in (self.show_file_manager, self.show_mea_grid)]
+        for action in self.recording_actions:
+            action.setEnabled(False)
+
+        # while the recording is opened a busy indicator is shown, afterwards the metadata of the recording
+        self.recording_label = QtWidgets.QLabel(self)
+        main_layout.addWidget(self.recording_label)
+        self.loading_bar = QtWidgets.QProgressBar(self)
+        self.loading_bar.setRange(0, 0)  # no range => busy indicator
+        main_layout.addWidget(self.loading_bar)
+
         sub_layout = QtWidgets.QHBoxLayout(self)
         sub_layout.setAlignment(QtCore.Qt.AlignCenter | QtCore.Qt.AlignTop)
 
@@ -182,6 +211,11 @@ class MeaFileView(QtWidgets.QWidget):
         self.mea_grid = MeaGrid(self)
         self.mea_grid.setFixedSize(600, 600)
         mea_grid_and_minor_widgets_layout.addWidget(self.mea_grid)
+        self.skip_bad_channels_check_box = QtWidgets.QCheckBox('Skip bad channels when all channels are analyzed', self)
+        self.skip_bad_channels_check_box.setToolTip('Flat, saturated, noisy and line noise channels (marked red in the '
+                                                    'grid) are left out of the spike detection of all channels')
+        self.skip_bad_channels_check_box.setChecked(True)
+        mea_grid_and_minor_widgets_layout.addWidget(self.skip_bad_channels_check_box)
         sub_layout.addLayout(mea_grid_and_minor_widgets_layout)
 
         self.tab_widget = QtWidgets.QTabWidget(self)
@@ -198,6 +232,7 @@ class MeaFileView(QtWidgets.QWidget):
         self.mea_grid.setVisible(self.show_mea_grid.isChecked())
 
         self.raw_trace_tab = None
+        self.trace_browser_tab = None
         self.filter_tab = None
         self.spike_detection_tab = None
 
@@ -209,6 +244,97 @@ class MeaFileView(QtWidgets.QWidget):
         self.isi_histogram_tab = None
         self.spectrograms_tab = None
 
+        self.start_opening_recording()
+
+    def start_opening_recording(self):
+        self.recording_open_thread = RecordingOpenThread(self, self.mea_file)
+        self.recording_open_thread.operation_changed.connect(self.recording_label.setText)
+        self.recording_open_thread.finished.connect(self.on_recording_opened)
+
+        debug_mode = False  # set to 'True' in order to debug opening with embed
+        if debug_mode:
+            self.recording_open_thread.run()
+        else:
+            self.recording_open_thread.start()
+
+    def on_recording_opened(self):
+        self.loading_bar.hide()
+        self.reader = self.recording_open_thread.reader
+        error_message = self.recording_open_thread.error_message
+        self.recording_open_thread = None
+        if self.reader is None:
+            self.recording_label.setText('The recording could not be opened: ' + str(error_message))
+            return
+        n_channels, n_samples = self.reader.voltage_traces_dataset.shape
+        self.recording_label.setText(str(n_channels) + ' channels, sampling frequency: ' +
+                                     str(self.reader.sampling_frequency) + ' Hz, duration: ' +
+                                     str(round(self.reader.duration, 2)) + ' s')
+        for action in self.recording_actions:
+            action.setEnabled(True)
+        self.start_channel_quality_check()
+
+    def start_channel_quality_check(self):
+        # a few short windows of all channels are enough to find dead and disturbed channels, the statistics of all
+        # channels are computed afterwards
+        self.channel_quality_thread = ChannelQualityThread(self, self.reader)
+        self.channel_quality_thread.operation_changed.connect(self.loading_bar.setFormat)
+        self.channel_quality_thread.finished.connect(self.on_channel_quality_thread_finished)
+        self.loading_bar.setRange(0, 0)
+        self.loading_bar.show()
+
+        debug_mode = False  # set to 'True' in order to debug the quality check with embed
+        if debug_mode:
+            self.channel_quality_thread.run()
+        else:
+            self.channel_quality_thread.start()
+
+    def on_channel_quality_thread_finished(self):
+        quality = self.channel_quality_thread.quality
+        aborted = self.channel_quality_thread.aborted
+        self.channel_quality_thread = None
+        self.loading_bar.hide()
+        if aborted:
+            return
+        if quality is not None:
+            self.bad_channels = {label: ChannelQuality.names[quality[row]] for label, row in
+                                 zip(self.reader.labels, self.reader.channel_ids)
+                                 if quality[row] != ChannelQuality.GOOD}
+            self.mea_grid.set_bad_channels(self.bad_channels)
+        self.start_channel_statistics()
+
+    def get_skipped_channel_indices(self):
+        """
+        :return: indices (into reader.labels) of the bad channels, which are skipped by analyses of all channels, empty
+        if they should not be skipped
+        """
+        if not self.skip_bad_channels_check_box.isChecked():
+            return []
+        return [index for index, label in enumerate(self.reader.labels) if label in self.bad_channels]
+
+    def start_channel_statistics(self):
+        # the statistics of all channels (noise levels, histograms, ...) are computed once per recording and reused by
+        # the analyses, they need the raw integer values of the recording
+        if self.reader.get_channel_statistics() is not None or self.reader.get_raw_scaling() is None:
+            return
+        self.channel_statistics_thread = ChannelStatisticsThread(self, self.reader)
+        self.channel_statistics_thread.operation_changed.connect(lambda text: self.loading_bar.setFormat(text + ' %p%'))
+        self.channel_statistics_thread.progress_made.connect(self.loading_bar.setValue)
+        self.channel_statistics_thread.finished.connect(self.on_channel_statistics_thread_finished)
+        self.loading_bar.setRange(0, 100)
+        self.loading_bar.setValue(0)
+        self.loading_bar.show()
+
+        debug_mode = False  # set to 'True' in order to debug the statistics with embed
+        if debug_mode:
+            self.channel_statistics_thread.run()
+        else:
+            # lowest priority, the statistics run while the user already works with the recording
+            self.channel_statistics_thread.start(QtCore.QThread.LowestPriority)
+
+    def on_channel_statistics_thread_finished(self):
+        self.channel_statistics_thread = None
+        self.loading_bar.hide()
+
     def open_raw_trace_plot_dialog(self, is_pressed):
         channel_labels_and_indices = self.mea_grid.get_selected_channels()
         allowed_channel_modes = [RawTraceSettings.ChannelSelection.ALL]
@@ -230,6 +356,16 @@ class MeaFileView(QtWidgets.QWidget):
                                                  grid_indices, sampling_rate)
             self.tab_widget.addTab(self.raw_trace_tab, 'Raw trace plot')
 
+    def open_trace_browser(self, is_pressed):
+        # the selected channels are shown, or all channels if none are selected
+        grid_labels_and_indices = self.mea_grid.get_selected_channels()
+        if len(grid_labels_and_indices) > 0:
+            grid_labels = [values[0] for values in grid_labels_and_indices]
+        else:
+            grid_labels = self.reader.labels
+        self.trace_browser_tab = TraceBrowserTab(self, self.reader, grid_labels)
+        self.tab_widget.addTab(self.trace_browser_tab, 'Trace browser')
+
     def open_isi_histogram_settings_dialog(self, is_pressed):
         channel_labels_and_indices = self.mea_grid.get_selected_channels()
         allowed_channel_modes = [IsiHistogramSettings.ChannelSelection.ALL]
@@ -312,15 +448,18 @@ class MeaFileView(QtWidgets.QWidget):
         if settings_dialog.exec() == 1:
             self.frequency_band_analysis_settings = settings_dialog.get_settings()
             Settings.instance.frequency_band_analysis_settings = self.frequency_band_analysis_settings
+            skipped_indices = []
             if self.frequency_band_analysis_settings.channel_selection == FrequencyBandsAnalysisSettings.ChannelSelection.ALL:
                 grid_indices = range(len(self.reader.voltage_traces))
                 grid_labels = self.reader.labels
+                skipped_indices = self.get_skipped_channel_indices()
             elif self.frequency_band_analysis_settings.channel_selection == FrequencyBandsAnalysisSettings.ChannelSelection.SELECTION:
                 grid_labels_and_indices = self.mea_grid.get_selected_channels()
                 grid_indices = [values[1] for values in grid_labels_and_indices]
                 grid_labels = [values[0] for values in grid_labels_and_indices]
             self.frequency_bands_analysis_tab = FrequencyBandsTab(self, self.reader, grid_indices, grid_labels,
-                                                                  self.frequency_band_analysis_settings)
+                                                                  self.frequency_band_analysis_settings,
+                                                                  skipped_indices)
             # todo: solve plotting of all channels
             self.tab_widget.addTab(self.frequency_bands_analysis_tab, "Frequency Analysis")
             self.frequency_bands_analysis_tab.initialize_frequency_bands_analysis()
@@ -336,15 +475,17 @@ class MeaFileView(QtWidgets.QWidget):
         if settings_dialog.exec() == 1:
             self.spectrograms_settings = settings_dialog.get_settings()
             Settings.instance.spectrograms_settings = self.spectrograms_settings
+        skipped_indices = []
         if self.spectrograms_settings.channel_selection == SpectrogramsSettings.ChannelSelection.ALL:
             grid_indices = range(len(self.reader.voltage_traces))
             grid_labels = self.reader.labels
+            skipped_indices = self.get_skipped_channel_indices()
         elif self.spectrograms_settings.channel_selection == SpectrogramsSettings.ChannelSelection.SELECTION:
             grid_labels_and_indices = self.mea_grid.get_selected_channels()
             grid_indices = [values[1] for values in grid_labels_and_indices]
             grid_labels = [values[0] for values in grid_labels_and_indices]
         self.spectrograms_tab = SpectrogramsTab(self, self.reader, grid_indices, grid_labels,
-                                                self.spectrograms_settings)
+                                                self.spectrograms_settings, skipped_indices)
         self.spectrograms_tab.initialize_spectrogram_calculation()
         self.tab_widget.addTab(self.spectrograms_tab, "Spectrograms")
 
@@ -363,20 +504,23 @@ class MeaFileView(QtWidgets.QWidget):
             # overwrite global settings as well
             Settings.instance.plot_settings = self.heatmap_settings
 
+            # the heatmap always shows all channels, bad channels are left blank
+            skipped_labels = [self.reader.labels[index] for index in self.get_skipped_channel_indices()]
+
             # initialise plotting
             if self.heatmap_settings.mode == HeatmapSettings.Mode.MCS:
-                self.heatmap_tab = HeatmapTab(self, self.reader, self.heatmap_settings)
+                self.heatmap_tab = HeatmapTab(self, self.reader, self.heatmap_settings, skipped_labels)
                 self.tab_widget.addTab(self.heatmap_tab, "Heatmap")
             elif self.heatmap_settings.mode == HeatmapSettings.Mode.MEAE:
                 meae_path = self.file_manager.get_verified_meae_file()
                 meae_reader = MeaeDataReader(meae_path)
-                self.heatmap_tab = HeatmapTab(self, meae_reader, self.heatmap_settings)
+                self.heatmap_tab = HeatmapTab(self, meae_reader, self.heatmap_settings, skipped_labels)
                 self.tab_widget.addTab(self.heatmap_tab, "Heatmap")
             elif self.heatmap_settings.mode == HeatmapSettings.Mode.SC:
                 sc_path = self.file_manager.get_verified_sc_file()
                 sc_base_filepath = self.file_manager.get_verified_sc_base_file()
                 sc_reader = SCDataReader(sc_path, sc_base_filepath)
-                self.heatmap_tab = HeatmapTab(self, sc_reader, self.heatmap_settings)
+                self.heatmap_tab = HeatmapTab(self, sc_reader, self.heatmap_settings, skipped_labels)
                 self.tab_widget.addTab(self.heatmap_tab, "Heatmap")
 
     def open_rasterplot_settings_dialog(self, is_pressed):
@@ -446,9 +590,11 @@ class MeaFileView(QtWidgets.QWidget):
         if settings_dialog.exec() == 1:  # 'Execute' clicked
             self.spike_detection_settings = settings_dialog.get_settings()
             meae_filename = settings_dialog.meae_filename
+            skipped_indices = []
             if self.spike_detection_settings.channel_selection == SpikeDetectionSettings.ChannelSelection.ALL:
                 grid_indices = range(len(self.reader.voltage_traces))
                 grid_labels = self.reader.labels
+                skipped_indices = self.get_skipped_channel_indices()
             elif self.spike_detection_settings.channel_selection == SpikeDetectionSettings.ChannelSelection.SELECTION:
                 grid_labels_and_indices = self.mea_grid.get_selected_channels()
                 grid_indices = [values[1] for values in grid_labels_and_indices]
@@ -460,7 +606,7 @@ class MeaFileView(QtWidgets.QWidget):
             if self.spike_detection_settings.file_mode == SpikeDetectionSettings.FileMode.MCS:
                 self.spike_detection_tab = SpikeDetectionTab(self, meae_filename, self.reader, grid_indices,
                                                              grid_labels,
-                                                             self.spike_detection_settings)
+                                                             self.spike_detection_settings, skipped_indices)
                 self.tab_widget.addTab(self.spike_detection_tab, "Spike detection")
                 self.spike_detection_tab.initialize_spike_detection()
             elif self.spike_detection_settings.file_mode == SpikeDetectionSettings.FileMode.MEAE:
@@ -468,7 +614,7 @@ class MeaFileView(QtWidgets.QWidget):
                 meae_reader = MeaeDataReader(meae_path)
                 self.spike_detection_tab = SpikeDetectionTab(self, meae_filename, meae_reader, grid_indices,
                                                              grid_labels,
-                                                             self.spike_detection_settings)
+                                                             self.spike_detection_settings, skipped_indices)
                 self.tab_widget.addTab(self.spike_detection_tab, "Spike detection")
                 self.spike_detection_tab.initialize_spike_detection()
 
@@ -559,6 +705,17 @@ class MeaFileView(QtWidgets.QWidget):
         # else: do not close tab because it is busy (= ignore close request)
 
     def can_be_closed(self):
+        # the recording is still opened in the background
+        if self.recording_open_thread is not None:
+            return False
+        # the quality check and the statistics are cancelled, the view can be closed once the threads have stopped
+        if self.channel_quality_thread is not None:
+            self.channel_quality_thread.abort()
+            return False
+        # the statistics are cancelled, the view can be closed once the thread has stopped
+        if self.channel_statistics_thread is not None:
+            self.channel_statistics_thread.abort()
+            return False
         tab_count = self.tab_widget.count()
 
         # check if all tabs can be closed
@@ -65,9 +65,43 @@ class MeaGrid(QWidget):
                 else:
                     self.label_indices_map[id]['grid index'] = row + (col*16) - 3
 
+        # labels of the dead or disturbed channels (see channel_quality.py) and the reason why they are bad
+        self.bad_channels = dict()
+
         self.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.on_context_menu)
 
+    def get_item(self, label):
+        for item in self.grid_table.findItems(label, QtCore.Qt.MatchExactly):
+            return item
+        return None
+
+    def set_bad_channels(self, bad_channels):
+        """
+        Marks dead or disturbed channels in the grid: their labels are shown in grey on red, the reason is shown as
+        tooltip
+        :param bad_channels: dictionary of label and reason (e.g. 'flat') of every bad channel
+        """
+        for label in self.bad_channels:
+            item = self.get_item(label)
+            if item is not None:
+                item.setBackground(QtGui.QBrush())
+                item.setForeground(QtGui.QBrush())
+                item.setToolTip('')
+        self.bad_channels = dict(bad_channels)
+        for label, reason in self.bad_channels.items():
+            item = self.get_item(label)
+            if item is not None:
+                item.setBackground(QtGui.QColor('#f2b8b5'))
+                item.setForeground(QtGui.QColor('#707070'))
+                item.setToolTip(label + ': ' + reason)
+
+    def deselect_bad_channels(self):
+        for label in self.bad_channels:
+            item = self.get_item(label)
+            if item is not None:
+                item.setSelected(False)
+
     def get_selected_channels(self):
         selected_channels = []
         for item in self.grid_table.selectedItems():
@@ -113,4 +147,9 @@ class MeaGrid(QWidget):
         invert_selection_action.triggered.connect(self.invert_selection)
         menu.addAction(invert_selection_action)
 
+        deselect_bad_channels_action = QtWidgets.QAction("Deselect Bad Channels")
+        deselect_bad_channels_action.triggered.connect(self.deselect_bad_channels)
+        deselect_bad_channels_action.setEnabled(len(self.bad_channels) > 0)
+        menu.addAction(deselect_bad_channels_action)
+
         menu.exec(self.mapToGlobal(point))
@@ -10,6 +10,7 @@ from IPython import embed
 
 from plot_manager import PlotManager
 from plots.plot_widget import PlotWidget
+from filtering.lfp_decimation import LfpDecimator, get_lfp_decimation
 
 
 class CsdPlotTab(QtWidgets.QWidget):
@@ -35,23 +36,34 @@ class CsdPlotTab(QtWidgets.QWidget):
         self.ch_ids = self.reader.channel_ids
         self.labels = self.reader.labels
         self.fs = self.reader.sampling_frequency
-        self.duration = self.reader.current_file['duration']
+        self.duration = self.reader.duration
 
         self.plot(self.figure)
 
+    def get_lfp_traces(self, labels):
+        """
+        The CSD only shows frequencies below 10 Hz, so the traces are decimated to the LFP sampling rate (see
+        lfp_decimation.py) while they are read. All channels are read at once in time blocks.
+        :param labels: labels of the channels
+        :return: decimated traces in uV with shape (channels, samples) and their sampling frequency
+        """
+        decimator = LfpDecimator(self.fs, get_lfp_decimation(self.fs))
+        n_samples = self.reader.voltage_traces_dataset.shape[1]
+        lfp = decimator.decimate(lambda start, stop: self.reader.get_scaled_window(labels, start, stop), len(labels),
+                                 n_samples)
+        return lfp, decimator.lfp_fs
+
     def plot(self, figure):
-        time = np.arange(0, self.reader.voltage_traces_dataset.shape[1]/self.fs, 1/self.fs)
+        grid_labels = [label for label in self.grid_labels if len(label) <= 2]
+        lfp_traces, fs = self.get_lfp_traces(grid_labels)
+        time = np.arange(lfp_traces.shape[1]) / fs
+        # windows around the maxima, 0.2 s (5000 samples at 25 kHz) before and after them
+        half_window = int(0.2 * fs)
 
         maxima = []
         filtered = []
         labels = []
-        for idx, label in enumerate(self.grid_labels):
-            if len(label) > 2:
-                continue
-            signal = self.reader.get_traces_with_label(label)
-            # function to scale voltage trace
-            fs = self.reader.sampling_frequency
-
+        for label, signal in zip(grid_labels, lfp_traces):
             nyq = 0.5 * fs
             normal_cutoff = 10 / nyq
             b, a = butter(2, normal_cutoff, btype='low', analog=False)
@@ -70,12 +82,12 @@ class CsdPlotTab(QtWidgets.QWidget):
         sorted_maxima = np.array(maxima)[np.argsort(maxima)]
         for i, maxi in enumerate(sorted_maxima[:5]):
             max_index = len(filtered[i])
-            if maxi > 5000:
-                start_index = maxi - 5000
-                end_index = min((maxi + 5000), max_index)
+            if maxi > half_window:
+                start_index = maxi - half_window
+                end_index = min((maxi + half_window), max_index)
             else:
                 start_index = 0
-                end_index = min((maxi + 10000), max_index)
+                end_index = min((maxi + 2 * half_window), max_index)
             ax = figure.add_subplot(spec[i])
             # ax.plot(time[start_index:end_index], filtered[i][start_index:end_index], color='white')
             ax.fill_between(time[start_index:end_index], np.zeros(len(filtered[i][start_index:end_index])),
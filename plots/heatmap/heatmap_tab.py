@@ -5,13 +5,16 @@ from IPython import embed
 
 from plot_manager import PlotManager
 from plots.plot_widget import PlotWidget
+from utility.channel_utility import ChannelUtility
 
 
 class HeatmapTab(QtWidgets.QWidget):
-    def __init__(self, parent, reader, settings):
+    def __init__(self, parent, reader, settings, skipped_labels=()):
         super().__init__(parent)
         self.reader = reader
         self.settings = settings
+        # bad channels (see channel_quality.py) are left blank in the heatmap
+        self.skipped_ordered_indices = {ChannelUtility.get_ordered_index(str(label)) for label in skipped_labels}
         self.colors = ['#749800', '#006d7c']
         self.single_heatmap = []
 
@@ -37,7 +40,12 @@ class HeatmapTab(QtWidgets.QWidget):
         old_heatmap = self.settings.heatmap_for_normalizing
         sc_channel_counter = 0
         for idx in range(252):
-            if idx not in self.reader.dead_channels and len(spike_mat[sc_channel_counter])/self.reader.duration >= 0.05:
+            if idx in self.skipped_ordered_indices:
+                # the spike train of a bad channel keeps its place, but is not counted
+                if idx not in self.reader.dead_channels:
+                    sc_channel_counter += 1
+                self.single_heatmap.append(np.nan)
+            elif idx not in self.reader.dead_channels and len(spike_mat[sc_channel_counter])/self.reader.duration >= 0.05:
                 self.single_heatmap.append(len(spike_mat[sc_channel_counter]))
                 sc_channel_counter += 1
             else:
@@ -54,10 +62,10 @@ class HeatmapTab(QtWidgets.QWidget):
         x_labels = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 'R']
         xticks = np.arange(0.5, 16.5, 1)
         if old_heatmap is not None:
-            sns.heatmap(self.single_heatmap, cmap='PuBuGn', vmin=0, vmax=np.max(old_heatmap), ax=ax,
+            sns.heatmap(self.single_heatmap, cmap='PuBuGn', vmin=0, vmax=np.nanmax(old_heatmap), ax=ax,
                         cbar_kws={'label': 'spike count'})
         else:
-            sns.heatmap(self.single_heatmap, cmap='PuBuGn', vmin=0, vmax=np.max(self.single_heatmap), ax=ax,
+            sns.heatmap(self.single_heatmap, cmap='PuBuGn', vmin=0, vmax=np.nanmax(self.single_heatmap), ax=ax,
                         cbar_kws={'label': 'spike count'})
         yticks = np.arange(0.5, 16.5, 1)
         ax.set_xticks(xticks)
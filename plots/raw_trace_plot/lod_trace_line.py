@@ -0,0 +1,80 @@
+import numpy as np
+
+from plots.raw_trace_plot.trace_pyramid import reduce_bins, envelope_to_line
+
+
+class LodTraceLine:
+    """
+    The LodTraceLine draws a voltage trace into a matplotlib axis with a level of detail that matches the shown time
+    window: whenever the x limits of the axis change (zooming, panning, setting them), only the visible part of the trace
+    is redrawn from at most about max_points points. Short windows are drawn sample by sample, longer ones as min/max
+    envelope, which is read from a TracePyramid or (without pyramid) computed from the samples of the window.
+    """
+    def __init__(self, ax, read_samples, n_samples, fs, scale=None, pyramid=None, row=None, max_points=4000,
+                 **plot_kwargs):
+        """
+        :param ax: matplotlib axis
+        :param read_samples: function read_samples(start, stop) returning the samples of the channel in this window
+        :param n_samples: number of samples of the trace
+        :param fs: sampling frequency in Hz
+        :param scale: function converting raw samples (and pyramid values) into uV, None if they are already scaled
+        :param pyramid: TracePyramid of the recording or None
+        :param row: row of the channel in the pyramid
+        :param max_points: maximal number of points of the line
+        :param plot_kwargs: passed on to ax.plot
+        """
+        self.ax = ax
+        self.read_samples = read_samples
+        self.n_samples = n_samples
+        self.fs = fs
+        self.scale = scale
+        self.pyramid = pyramid
+        self.row = row
+        self.max_points = max_points
+        self.line, = ax.plot([], [], **plot_kwargs)
+        # note: ax.cla() removes this callback, a new LodTraceLine has to be created after clearing the axis
+        self.callback_id = ax.callbacks.connect('xlim_changed', self.on_xlim_changed)
+
+    def draw(self, start_time=None, end_time=None):
+        """
+        Draws the whole trace (to scale the y axis to it) and zooms to the given time window afterwards
+        """
+        self.update_window(0, self.n_samples)
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+        start_time = 0 if start_time is None else start_time
+        end_time = self.n_samples / self.fs if end_time is None else end_time
+        # triggers on_xlim_changed, which draws the window in full detail
+        self.ax.set_xlim(start_time, end_time)
+
+    def set_pyramid(self, pyramid, row):
+        self.pyramid = pyramid
+        self.row = row
+        self.on_xlim_changed(self.ax)
+        self.ax.figure.canvas.draw_idle()
+
+    def on_xlim_changed(self, ax):
+        start_time, end_time = ax.get_xlim()
+        # a bit more than the visible window is drawn, so small pans do not show empty borders
+        margin = (end_time - start_time) * 0.1
+        start = max(int(np.floor((start_time - margin) * self.fs)), 0)
+        stop = min(int(np.ceil((end_time + margin) * self.fs)) + 1, self.n_samples)
+        if stop > start:
+            self.update_window(start, stop)
+
+    def update_window(self, start, stop):
+        max_bins = self.max_points // 2
+        if stop - start <= self.max_points:
+            y = np.asarray(self.read_samples(start, stop))
+            x = np.arange(start, start + len(y))
+        elif self.pyramid is not None:
+            first_sample, bin_size, mins, maxs = self.pyramid.get_envelope(self.row, start, stop, max_bins)
+            x, y = envelope_to_line(first_sample, bin_size, mins, maxs)
+        else:
+            bin_size = -(-(stop - start) // max_bins)
+            samples = np.asarray(self.read_samples(start, stop))
+            x, y = envelope_to_line(start, bin_size, reduce_bins(samples, bin_size, np.minimum),
+                                    reduce_bins(samples, bin_size, np.maximum))
+        if self.scale is not None:
+            y = self.scale(y)
+        self.line.set_data(x / self.fs, y)
@@ -5,6 +5,9 @@ import seaborn as sns
 
 from plot_manager import PlotManager
 from plots.plot_widget import PlotWidget
+from plots.raw_trace_plot.lod_trace_line import LodTraceLine
+from plots.raw_trace_plot.trace_pyramid import TracePyramid
+from plots.raw_trace_plot.trace_pyramid_thread import TracePyramidThread
 
 
 class RawTracePlotTab(QtWidgets.QWidget):
@@ -16,15 +19,35 @@ class RawTracePlotTab(QtWidgets.QWidget):
         self.grid_indices = grid_indices
         self.fs = sampling_rate
 
+        # the traces are drawn from the min/max pyramid of the recording, which is built once if it does not exist yet
+        n_channels, self.n_samples = self.reader.voltage_traces.shape
+        self.pyramid = TracePyramid.open(self.reader.file_path, n_channels, self.n_samples)
+        self.pyramid_thread = None
+        self.trace_lines = dict()
+
         main_layout = QtWidgets.QVBoxLayout(self)
         main_layout.setAlignment(QtCore.Qt.AlignTop | QtCore.Qt.AlignCenter)
 
+        self.operation_label = QtWidgets.QLabel(self)
+        main_layout.addWidget(self.operation_label)
+
+        self.progress_bar = QtWidgets.QProgressBar(self)
+        self.progress_bar.setMinimum(0)
+        self.progress_bar.setMaximum(100)
+        self.progress_bar.setTextVisible(True)
+        main_layout.addWidget(self.progress_bar)
+
         self.plot_tab_widget = QtWidgets.QTabWidget(self)
         self.plot_tab_widget.setMovable(True)
         self.plot_tab_widget.setTabsClosable(False)
         self.plot_tab_widget.setUsesScrollButtons(True)
         main_layout.addWidget(self.plot_tab_widget)
         self.plot()
+        if self.pyramid is None:
+            self.initialize_pyramid_building()
+        else:
+            self.operation_label.hide()
+            self.progress_bar.hide()
 
     def plot(self):
         for idx, label in enumerate(self.grid_labels):
@@ -33,17 +56,49 @@ class RawTracePlotTab(QtWidgets.QWidget):
             sns.set()
             fig = plot_widget.figure
             ax = fig.add_subplot(111)
-            start_time = int(self.settings.start_time * self.fs)
-            end_time = int(self.settings.end_time * self.fs)
-            plot_time = np.arange(self.settings.start_time, self.settings.end_time, 1/self.fs)
-            scaled_trace = self.reader.get_scaled_channel(label)
-            ax.plot(plot_time, scaled_trace[start_time:end_time])
-            ax.set_xlim([plot_time[0], plot_time[-1]])
+            row = self.reader.get_channel_id(label)
+            # The whole recording is plotted, but only the part in the current x limits is drawn, from at most a few
+            # thousand points. Zooming and panning with the toolbar reads the visible window again.
+            trace_line = LodTraceLine(ax, lambda start, stop, row=row: self.reader.voltage_traces[row, start:stop],
+                                      self.n_samples, self.fs, scale=self.reader.scale, pyramid=self.pyramid, row=row)
+            trace_line.draw(self.settings.start_time, self.settings.end_time)
+            self.trace_lines[label] = trace_line
             ax.set_ylabel(r'amplitude [$\mu$ V]')
             ax.set_xlabel(r'time [s]')
 
             PlotManager.instance.add_plot(plot_widget)
 
+    def initialize_pyramid_building(self):
+        self.pyramid_thread = TracePyramidThread(self, self.reader)
+        self.pyramid_thread.operation_changed.connect(self.on_operation_changed)
+        self.pyramid_thread.progress_made.connect(self.on_progress_made)
+        self.pyramid_thread.finished.connect(self.on_pyramid_thread_finished)
+
+        debug_mode = False
+        if debug_mode:
+            self.pyramid_thread.run()
+        else:
+            self.pyramid_thread.start()
+
+    @QtCore.pyqtSlot(float)
+    def on_progress_made(self, progress):
+        self.progress_bar.setValue(int(progress))
+
+    @QtCore.pyqtSlot(str)
+    def on_operation_changed(self, operation):
+        self.operation_label.setText(operation)
+
+    def on_pyramid_thread_finished(self):
+        n_channels = self.reader.voltage_traces.shape[0]
+        if self.pyramid_thread.succeeded:
+            self.pyramid = TracePyramid.open(self.reader.file_path, n_channels, self.n_samples)
+        self.pyramid_thread = None
+        self.operation_label.hide()
+        self.progress_bar.hide()
+        if self.pyramid is not None:
+            for label, trace_line in self.trace_lines.items():
+                trace_line.set_pyramid(self.pyramid, self.reader.get_channel_id(label))
+
     def create_plot_tab(self, label):
         plot_name = 'Raw_trace_channel_' + str(label) + '_' + self.reader.filename
         plot_widget = PlotWidget(self, plot_name)
@@ -62,5 +117,5 @@ class RawTracePlotTab(QtWidgets.QWidget):
             return None
 
     def can_be_closed(self):
-        # plot is not running a thread => can be always closed
-        return True
\ No newline at end of file
+        # only closeable if the pyramid is not being built currently
+        return self.pyramid_thread is None
\ No newline at end of file
@@ -0,0 +1,170 @@
+import os
+import numpy as np
+import h5py
+
+
+# In this script a min/max level of detail pyramid of all channels of a recording is built and read. On a screen a trace
+# of millions of samples covers only a few thousand pixels, so instead of every sample only the minimum and the maximum
+# of the samples behind every pixel have to be drawn to get the same picture. The pyramid stores these minima and maxima
+# for bins of 16, 64, 256, ... samples in a sidecar file next to the recording (<recording>_pyramid.h5). For any time
+# window the level with the fewest bins that still has (at least) about one bin per pixel is read, so every zoom level
+# of every channel is drawn from at most a few thousand points.
+# The pyramid is built in one pass over ChannelData, reading time blocks of all channels at once. The raw ADC values are
+# stored (in the dtype of ChannelData), they are scaled only when they are drawn.
+
+def get_pyramid_path(recording_path):
+    return os.path.splitext(recording_path)[0] + '_pyramid.h5'
+
+
+def reduce_bins(values, bin_size, function):
+    """
+    Reduces every bin_size following values of the last axis with function (np.minimum or np.maximum), a last
+    incomplete bin is reduced as well
+    :param values: numpy array with shape (..., samples)
+    :return: numpy array with shape (..., ceil(samples / bin_size))
+    """
+    n_values = values.shape[-1]
+    n_full_bins = n_values // bin_size
+    full_bins = values[..., :n_full_bins * bin_size].reshape(values.shape[:-1] + (n_full_bins, bin_size))
+    reduced = function.reduce(full_bins, axis=-1)
+    if n_values % bin_size:
+        rest = function.reduce(values[..., n_full_bins * bin_size:], axis=-1)
+        reduced = np.concatenate([reduced, rest[..., np.newaxis]], axis=-1)
+    return reduced
+
+
+def envelope_to_line(first_sample, bin_size, mins, maxs):
+    """
+    Converts the minima and maxima of consecutive bins into one line, which goes from the minimum to the maximum of every
+    bin at the start time of the bin
+    :return: sample indices and values of the line
+    """
+    positions = first_sample + np.arange(len(mins)) * bin_size
+    x = np.repeat(positions, 2)
+    y = np.empty(2 * len(mins), dtype=np.result_type(mins, maxs))
+    y[0::2] = mins
+    y[1::2] = maxs
+    return x, y
+
+
+def get_source_signature(source_path):
+    stat = os.stat(source_path)
+    return float(stat.st_mtime), int(stat.st_size)
+
+
+def get_level_bin_sizes(n_samples, base_bin_size=16, level_factor=4, min_bins=256):
+    """
+    :return: bin sizes of all levels, the coarsest level still has at least min_bins bins
+    """
+    bin_sizes = [base_bin_size]
+    while n_samples // (bin_sizes[-1] * level_factor) >= min_bins:
+        bin_sizes.append(bin_sizes[-1] * level_factor)
+    return bin_sizes
+
+
+def build_pyramid(channel_data, pyramid_path, source_path, base_bin_size=16, level_factor=4, memory_limit=2**27):
+    """
+    Builds the pyramid of all rows of channel_data in one pass and writes it to pyramid_path. This is a generator, which
+    yields the progress in percent after every time block.
+    :param channel_data: h5py dataset (or numpy array) with shape (channels, samples), e.g. ChannelData
+    :param pyramid_path: path of the sidecar file, an existing file is replaced
+    :param source_path: path of the recording, its modification time and size are stored to recognize changed files
+    :param memory_limit: bytes a time block of all channels may use
+    """
+    n_channels, n_samples = channel_data.shape
+    bin_sizes = get_level_bin_sizes(n_samples, base_bin_size, level_factor)
+    # every block starts at a multiple of the largest bin size, so no bin of any level spans two blocks
+    top_bin_size = bin_sizes[-1]
+    bytes_per_top_bin = n_channels * top_bin_size * channel_data.dtype.itemsize
+    block_samples = max(1, int(memory_limit // bytes_per_top_bin)) * top_bin_size
+
+    with h5py.File(pyramid_path, 'w') as file:
+        file.attrs['complete'] = False
+        file.attrs['n_channels'] = n_channels
+        file.attrs['n_samples'] = n_samples
+        file.attrs['source_mtime'], file.attrs['source_size'] = get_source_signature(source_path)
+        file.attrs['bin_sizes'] = bin_sizes
+        levels = []
+        for bin_size in bin_sizes:
+            n_bins = -(-n_samples // bin_size)
+            chunks = (1, min(n_bins, 4096)) if n_bins > 0 else None
+            level = file.create_group(str(bin_size))
+            levels.append((level.create_dataset('min', shape=(n_channels, n_bins), dtype=channel_data.dtype,
+                                                chunks=chunks),
+                           level.create_dataset('max', shape=(n_channels, n_bins), dtype=channel_data.dtype,
+                                                chunks=chunks)))
+
+        for start in range(0, n_samples, block_samples):
+            stop = min(start + block_samples, n_samples)
+            block = np.asarray(channel_data[:, start:stop])
+            # the first level is reduced from the samples, every further level from the level before
+            mins = reduce_bins(block, bin_sizes[0], np.minimum)
+            maxs = reduce_bins(block, bin_sizes[0], np.maximum)
+            for level_index, (bin_size, (min_dataset, max_dataset)) in enumerate(zip(bin_sizes, levels)):
+                if level_index > 0:
+                    mins = reduce_bins(mins, level_factor, np.minimum)
+                    maxs = reduce_bins(maxs, level_factor, np.maximum)
+                first_bin = start // bin_size
+                min_dataset[:, first_bin:first_bin + mins.shape[-1]] = mins
+                max_dataset[:, first_bin:first_bin + maxs.shape[-1]] = maxs
+            yield round(stop / n_samples * 100.0, 2)
+        file.attrs['complete'] = True
+
+
+class TracePyramid:
+    """
+    The TracePyramid reads the min/max envelope of a time window of a channel from a pyramid sidecar file
+    """
+    def __init__(self, pyramid_path):
+        self.file = h5py.File(pyramid_path, 'r')
+        self.n_samples = int(self.file.attrs['n_samples'])
+        self.bin_sizes = [int(bin_size) for bin_size in self.file.attrs['bin_sizes']]
+
+    @staticmethod
+    def open(recording_path, n_channels, n_samples):
+        """
+        :return: the TracePyramid of the recording or None if there is no complete pyramid for the current version of
+        the recording
+        """
+        pyramid_path = get_pyramid_path(recording_path)
+        if not os.path.exists(pyramid_path):
+            return None
+        try:
+            pyramid = TracePyramid(pyramid_path)
+        except OSError:
+            return None
+        attrs = pyramid.file.attrs
+        if not attrs.get('complete', False) or attrs['n_channels'] != n_channels or attrs['n_samples'] != n_samples \
+                or (attrs['source_mtime'], attrs['source_size']) != get_source_signature(recording_path):
+            pyramid.close()
+            return None
+        return pyramid
+
+    def get_bin_size(self, n_window_samples, max_bins):
+        """
+        :return: smallest bin size of the pyramid with at most max_bins bins in the window (the largest bin size if no
+        level is coarse enough)
+        """
+        for bin_size in self.bin_sizes:
+            if -(-n_window_samples // bin_size) <= max_bins:
+                return bin_size
+        return self.bin_sizes[-1]
+
+    def get_envelope(self, row, start, stop, max_bins=2000):
+        """
+        :param row: row of the channel in ChannelData
+        :param start: index of first sample of the window
+        :param stop: index after the last sample of the window
+        :param max_bins: maximal number of bins which should be returned
+        :return: index of the first sample of the first bin, bin size and raw minima and maxima of all bins overlapping
+        the window
+        """
+        bin_size = self.get_bin_size(stop - start, max_bins)
+        first_bin = max(start, 0) // bin_size
+        stop_bin = -(-min(stop, self.n_samples) // bin_size)
+        level = self.file[str(bin_size)]
+        return first_bin * bin_size, bin_size, level['min'][row, first_bin:stop_bin], \
+            level['max'][row, first_bin:stop_bin]
+
+    def close(self):
+        self.file.close()
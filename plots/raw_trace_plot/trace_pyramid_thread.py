@@ -0,0 +1,27 @@
+from PyQt5 import QtCore
+
+from plots.raw_trace_plot.trace_pyramid import build_pyramid, get_pyramid_path
+
+
+class TracePyramidThread(QtCore.QThread):
+    operation_changed = QtCore.pyqtSignal(str)
+    progress_made = QtCore.pyqtSignal(float)
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, parent, reader):
+        super().__init__(parent)
+        self.reader = reader
+        self.pyramid_path = get_pyramid_path(reader.file_path)
+        self.succeeded = False
+
+    def run(self):
+        self.operation_changed.emit('Building overview of raw traces...')
+        try:
+            for progress in build_pyramid(self.reader.voltage_traces_dataset, self.pyramid_path,
+                                          self.reader.file_path):
+                self.progress_made.emit(progress)
+            self.succeeded = True
+        except OSError:
+            # without write access to the folder of the recording the traces are drawn without the pyramid
+            self.succeeded = False
+        self.finished.emit()
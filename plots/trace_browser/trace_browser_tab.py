@@ -0,0 +1,181 @@
+from PyQt5 import QtCore, QtWidgets
+from collections import OrderedDict
+import pyqtgraph as pg
+import numpy as np
+
+from plots.raw_trace_plot.trace_pyramid import TracePyramid
+from plots.trace_browser.trace_window_loader_thread import TraceWindowLoaderThread
+from utility.channel_utility import ChannelUtility
+
+
+# Here the trace browser tab is created, which shows the raw traces of many channels stacked above each other. The
+# recording is split into blocks as long as the shown time window. Only the blocks of the visible time window and
+# channels are read, by a TraceWindowLoaderThread in the background. When these are loaded, the blocks before and after
+# them (and the ones of the next channels) are loaded as well, so scrolling on shows them without waiting for the disk.
+# Long windows are read as min/max envelope (from the pyramid of the recording, if it was already built by the raw trace
+# plot), so a window never has more than a few thousand points per channel.
+
+class TraceBrowserTab(QtWidgets.QWidget):
+    # number of loaded blocks that are kept in memory
+    CACHE_SIZE = 32
+    # maximal number of min/max bins per channel and block, a window shows at most two blocks
+    MAX_BINS = 1000
+    # the time scroll bar moves in steps of a tenth of the window
+    SCROLL_STEPS_PER_WINDOW = 10
+
+    def __init__(self, parent, reader, grid_labels):
+        super().__init__(parent)
+        self.reader = reader
+        # the channels are shown in the order of the MEA labels (A2, A3, ..., R15)
+        self.labels = sorted(grid_labels, key=ChannelUtility.get_ordered_index)
+        self.fs = reader.sampling_frequency
+        n_channels, self.n_samples = reader.voltage_traces.shape
+
+        self.window_cache = OrderedDict()
+        self.visible_keys = []
+        self.curves = []
+
+        main_layout = QtWidgets.QVBoxLayout(self)
+        main_layout.setAlignment(QtCore.Qt.AlignTop | QtCore.Qt.AlignHCenter)
+
+        settings_layout = QtWidgets.QHBoxLayout()
+        settings_layout.addWidget(QtWidgets.QLabel('Window [s]:'))
+        self.window_duration_box = QtWidgets.QDoubleSpinBox(self)
+        self.window_duration_box.setRange(0.01, max(self.n_samples / self.fs, 0.01))
+        self.window_duration_box.setValue(min(1.0, self.n_samples / self.fs))
+        self.window_duration_box.setDecimals(2)
+        settings_layout.addWidget(self.window_duration_box)
+
+        settings_layout.addWidget(QtWidgets.QLabel('Channels shown:'))
+        self.channel_count_box = QtWidgets.QSpinBox(self)
+        self.channel_count_box.setRange(1, max(len(self.labels), 1))
+        self.channel_count_box.setValue(min(16, len(self.labels)))
+        settings_layout.addWidget(self.channel_count_box)
+
+        settings_layout.addWidget(QtWidgets.QLabel('Spacing [µV]:'))
+        self.spacing_box = QtWidgets.QDoubleSpinBox(self)
+        self.spacing_box.setRange(1.0, 100000.0)
+        self.spacing_box.setValue(200.0)
+        settings_layout.addWidget(self.spacing_box)
+        main_layout.addLayout(settings_layout)
+
+        plot_layout = QtWidgets.QHBoxLayout()
+        # the same pyqtgraph set up as in the filter and spike detection tab, but the view is moved with the scroll bars
+        # only, because every move has to go through the loader
+        self.plot_widget = pg.PlotWidget()
+        self.plot_widget.setBackground('w')
+        styles = {'color': 'k', 'font-size': '10px'}
+        self.plot_widget.setLabel('left', 'channel', **styles)
+        self.plot_widget.setLabel('bottom', 'time [s]', **styles)
+        self.plot_widget.setMouseEnabled(x=False, y=False)
+        self.plot_widget.hideButtons()
+        plot_layout.addWidget(self.plot_widget)
+
+        self.channel_scroll_bar = QtWidgets.QScrollBar(QtCore.Qt.Vertical, self)
+        plot_layout.addWidget(self.channel_scroll_bar)
+        main_layout.addLayout(plot_layout)
+
+        self.time_scroll_bar = QtWidgets.QScrollBar(QtCore.Qt.Horizontal, self)
+        main_layout.addWidget(self.time_scroll_bar)
+
+        self.loader_thread = TraceWindowLoaderThread(self, reader,
+                                                     TracePyramid.open(reader.file_path, n_channels, self.n_samples))
+        self.loader_thread.window_loaded.connect(self.on_window_loaded)
+
+        self.window_duration_box.valueChanged.connect(self.on_window_changed)
+        self.channel_count_box.valueChanged.connect(self.on_window_changed)
+        self.spacing_box.valueChanged.connect(self.draw)
+        self.time_scroll_bar.valueChanged.connect(self.update_view)
+        self.channel_scroll_bar.valueChanged.connect(self.update_view)
+        self.on_window_changed()
+
+    def get_block_samples(self):
+        return max(int(round(self.window_duration_box.value() * self.fs)), 1)
+
+    def get_shown_labels(self):
+        first_channel = self.channel_scroll_bar.value()
+        return tuple(self.labels[first_channel:first_channel + self.channel_count_box.value()])
+
+    def get_block_key(self, labels, block_index):
+        block_samples = self.get_block_samples()
+        start = block_index * block_samples
+        return labels, start, min(start + block_samples, self.n_samples), self.MAX_BINS
+
+    @QtCore.pyqtSlot()
+    def on_window_changed(self):
+        # the blocks depend on the window length and the number of shown channels, so all loaded blocks are dropped
+        self.window_cache.clear()
+        step_samples = self.get_block_samples() / self.SCROLL_STEPS_PER_WINDOW
+        n_steps = int(np.ceil(max(self.n_samples - self.get_block_samples(), 0) / step_samples))
+        self.time_scroll_bar.setRange(0, n_steps)
+        self.time_scroll_bar.setPageStep(self.SCROLL_STEPS_PER_WINDOW)
+        self.channel_scroll_bar.setRange(0, max(len(self.labels) - self.channel_count_box.value(), 0))
+        self.channel_scroll_bar.setPageStep(self.channel_count_box.value())
+
+        self.plot_widget.clear()
+        pen = pg.mkPen(color='#006e7d')
+        self.curves = [self.plot_widget.plot([], [], pen=pen) for _ in range(self.channel_count_box.value())]
+        self.update_view()
+
+    @QtCore.pyqtSlot()
+    def update_view(self):
+        block_samples = self.get_block_samples()
+        start = int(self.time_scroll_bar.value() * block_samples / self.SCROLL_STEPS_PER_WINDOW)
+        stop = min(start + block_samples, self.n_samples)
+        first_block = start // block_samples
+        stop_block = max(-(-stop // block_samples), first_block + 1)
+        n_blocks = -(-self.n_samples // block_samples)
+        labels = self.get_shown_labels()
+        self.visible_keys = [self.get_block_key(labels, block) for block in range(first_block, stop_block)]
+
+        # neighbouring blocks in time and the next channels are loaded after the visible ones
+        prefetch_keys = [self.get_block_key(labels, block) for block in (stop_block, first_block - 1, stop_block + 1)
+                         if 0 <= block < n_blocks]
+        next_channel = self.channel_scroll_bar.value() + self.channel_count_box.value()
+        if next_channel < len(self.labels):
+            next_labels = tuple(self.labels[next_channel:next_channel + self.channel_count_box.value()])
+            prefetch_keys += [self.get_block_key(next_labels, block) for block in range(first_block, stop_block)]
+        missing_keys = [key for key in self.visible_keys + prefetch_keys if key not in self.window_cache]
+        if missing_keys:
+            if not self.loader_thread.isRunning():
+                self.loader_thread.start()
+            self.loader_thread.request(missing_keys)
+
+        self.plot_widget.setXRange(start / self.fs, stop / self.fs, padding=0)
+        self.draw()
+
+    @QtCore.pyqtSlot(object, object)
+    def on_window_loaded(self, key, window):
+        self.window_cache[key] = window
+        while len(self.window_cache) > self.CACHE_SIZE:
+            self.window_cache.popitem(last=False)
+        if key in self.visible_keys:
+            self.draw()
+
+    @QtCore.pyqtSlot()
+    def draw(self):
+        labels = self.get_shown_labels()
+        spacing = self.spacing_box.value()
+        # blocks that are not loaded yet are left empty until on_window_loaded draws again
+        windows = [self.window_cache[key] for key in self.visible_keys if key in self.window_cache]
+        for key in self.visible_keys:
+            if key in self.window_cache:
+                self.window_cache.move_to_end(key)
+        for channel_index, curve in enumerate(self.curves):
+            if channel_index >= len(labels) or not windows:
+                curve.setData([], [])
+                continue
+            time = np.concatenate([window[0] for window in windows])
+            values = np.concatenate([window[1][channel_index] for window in windows])
+            # every channel is centered on its own offset, the first channel is on top
+            curve.setData(time, values - np.median(values) - channel_index * spacing)
+
+        ay = self.plot_widget.getAxis('left')
+        ay.setTicks([[(-channel_index * spacing, label) for channel_index, label in enumerate(labels)]])
+        self.plot_widget.setYRange(-(len(self.curves) - 0.5) * spacing, 0.5 * spacing, padding=0)
+
+    def can_be_closed(self):
+        # the loader does not change any data, so it is simply stopped and the tab can always be closed
+        self.loader_thread.stop()
+        self.loader_thread.wait()
+        return True
@@ -0,0 +1,80 @@
+from PyQt5 import QtCore
+import threading
+import numpy as np
+
+from plots.raw_trace_plot.trace_pyramid import reduce_bins, envelope_to_line
+
+
+def load_window(reader, pyramid, labels, start, stop, max_bins):
+    """
+    Reads a time window of several channels. Short windows are returned sample by sample, longer ones as min/max envelope
+    with at most max_bins bins, which is read from the pyramid or (without pyramid) computed from the samples.
+    :param reader: McsDataReader of the recording
+    :param pyramid: TracePyramid of the recording or None
+    :param labels: channel labels, the rows of the returned matrix follow this order
+    :param start: index of the first sample of the window
+    :param stop: index after the last sample of the window
+    :param max_bins: maximal number of min/max bins per channel
+    :return: time in seconds of all points and the scaled values with shape (len(labels), points) in uV
+    """
+    fs = reader.sampling_frequency
+    if stop - start <= 2 * max_bins:
+        values = reader.get_scaled_window(list(labels), start, stop)
+        return np.arange(start, start + values.shape[-1]) / fs, values
+    if pyramid is not None:
+        lines = [envelope_to_line(*pyramid.get_envelope(reader.get_channel_id(label), start, stop, max_bins))
+                 for label in labels]
+        # all channels have the same bins, so the time axis of the first one is used for all of them
+        return lines[0][0] / fs, reader.scale(np.array([line[1] for line in lines]))
+    bin_size = -(-(stop - start) // max_bins)
+    samples = reader.get_scaled_window(list(labels), start, stop)
+    mins = reduce_bins(samples, bin_size, np.minimum)
+    maxs = reduce_bins(samples, bin_size, np.maximum)
+    values = np.empty((len(labels), 2 * mins.shape[-1]))
+    values[:, 0::2] = mins
+    values[:, 1::2] = maxs
+    return np.repeat(start + np.arange(mins.shape[-1]) * bin_size, 2) / fs, values
+
+
+class TraceWindowLoaderThread(QtCore.QThread):
+    """
+    In contrast to the other threads of MEAsure this thread keeps running while the trace browser is open. It loads the
+    windows that were requested last, one after the other, and sends every loaded window back to the browser. A new
+    request replaces all windows that are still waiting, so the loader never works on windows which are not needed
+    anymore after the user scrolled on.
+    """
+    window_loaded = QtCore.pyqtSignal(object, object)
+
+    def __init__(self, parent, reader, pyramid):
+        super().__init__(parent)
+        self.reader = reader
+        self.pyramid = pyramid
+        self.pending = []
+        self.stop_requested = False
+        self.condition = threading.Condition()
+
+    def request(self, keys):
+        """
+        :param keys: list of windows (labels, start, stop, max_bins), the first one is loaded first
+        """
+        with self.condition:
+            self.pending = list(keys)
+            self.condition.notify()
+
+    def stop(self):
+        with self.condition:
+            self.pending = []
+            self.stop_requested = True
+            self.condition.notify()
+
+    def run(self):
+        self.stop_requested = False
+        while True:
+            with self.condition:
+                while not self.pending and not self.stop_requested:
+                    self.condition.wait()
+                if self.stop_requested:
+                    return
+                key = self.pending.pop(0)
+            labels, start, stop, max_bins = key
+            self.window_loaded.emit(key, load_window(self.reader, self.pyramid, labels, start, stop, max_bins))
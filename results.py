@@ -3,40 +3,59 @@ import csv
 
 # sub classes for specific results
 class FrequencyAnalysisResult:
-    # todo: bring distinction of different analysis in here, for now it'll be hard coded
-    band_names = 'delta', 'theta', 'alpha', 'smr', 'beta', 'gamma'
-    # band_names = '50 Hz', '350 Hz'
-
     # static method is called with FrequencyAnalysisResult.get_header
     # it does not need any 'self' data
     @staticmethod
-    def get_header():
-        return ['label'] + list(FrequencyAnalysisResult.band_names)
+    def get_header(band_names):
+        return ['label'] + list(band_names)
 
     def __init__(self, label, band_map):
         self.label = label
         self.band_map = band_map
+        # the band table can change between two analyses, so every result keeps the names of its own bands
+        self.band_names = list(band_map.keys())
 
-    def get_as_row(self):
+    def get_as_row(self, band_names):
         row = [self.label]
-        for band in FrequencyAnalysisResult.band_names:
-            row.append(self.band_map[band])
+        for band in band_names:
+            row.append(self.band_map.get(band, ''))
         return row
 
 
 class ResultStoring:
     def __init__(self):
         self._filter_mat = None
+        # read-only h5py file of the .meae file the filter_mat (and its LFP copy) is read from, None if the filter_mat is
+        # held in memory
+        self._meae_file = None
+        # decimated copy of the filter_mat (same rows) and its sampling frequency, see lfp_decimation.py
+        self._lfp_mat = None
+        self._lfp_sampling_frequency = None
         self.spike_times = None
         self._frequency_mat = None
 
         # frequency analysis
         self.frequency_analysis_results = []
 
-    def set_filter_mat(self, filter_mat):
+    def set_filter_mat(self, filter_mat, meae_file=None):
+        """
+        :param filter_mat: filtered traces, either in memory or a dataset (or Hdf5RowView) of meae_file
+        :param meae_file: read-only h5py file the filter_mat is read from, it stays open until the filter_mat is replaced
+        or close_meae_file is called
+        """
+        if self._meae_file is not None and self._meae_file is not meae_file:
+            self._meae_file.close()
+        self._meae_file = meae_file
         self._filter_mat = filter_mat
+        # a decimated copy belongs to the former filter_mat
+        self._lfp_mat = None
+        self._lfp_sampling_frequency = None
         print(self._filter_mat)
 
+    def set_lfp_mat(self, lfp_mat, lfp_sampling_frequency):
+        self._lfp_mat = lfp_mat
+        self._lfp_sampling_frequency = lfp_sampling_frequency
+
     def set_frequency_mat(self, frequency_mat):
         self._frequency_mat = frequency_mat
         print(self._frequency_mat)
@@ -44,12 +63,43 @@ class ResultStoring:
     def get_filter_mat(self):
         return self._filter_mat
 
+    def close_meae_file(self):
+        """
+        Closes the .meae file the filter_mat is read from, so it can be opened for writing again. The filter_mat and its
+        LFP copy are read from this file, so they are dropped as well.
+        """
+        if self._meae_file is None:
+            return
+        self._meae_file.close()
+        self._meae_file = None
+        self._filter_mat = None
+        self._lfp_mat = None
+        self._lfp_sampling_frequency = None
+
+    def get_lfp_mat(self):
+        """
+        :return: decimated copy of the filter_mat and its sampling frequency, (None, None) if there is none
+        """
+        return self._lfp_mat, self._lfp_sampling_frequency
+
     def get_frequency_mat(self):
         return self._frequency_mat
 
     def add_frequency_analysis_result(self, label, band_map):
+        # a new analysis of a channel replaces its old result
+        self.frequency_analysis_results = [result for result in self.frequency_analysis_results
+                                           if result.label != label]
         self.frequency_analysis_results.append(FrequencyAnalysisResult(label, band_map))
 
+    def get_frequency_band_names(self):
+        """
+        :return: names of all bands of the frequency analysis results, in the order they first appear
+        """
+        band_names = []
+        for frequency_result in self.frequency_analysis_results:
+            band_names += [band for band in frequency_result.band_names if band not in band_names]
+        return band_names
+
     def save_frequency_analysis_results_to(self, file_path):
         # sort list of results by label
         sorted(self.frequency_analysis_results, key=lambda result: result.label)
@@ -57,10 +107,13 @@ class ResultStoring:
         with open(file_path, 'w', newline='') as csvfile:
             writer = csv.writer(csvfile)
 
+            # the bands depend on the band table used for the analysis, so the header is taken from the results
+            band_names = self.get_frequency_band_names()
+
             # write header
-            writer.writerow(FrequencyAnalysisResult.get_header())
+            writer.writerow(FrequencyAnalysisResult.get_header(band_names))
 
             for frequency_result in self.frequency_analysis_results:
-                writer.writerow(frequency_result.get_as_row())
+                writer.writerow(frequency_result.get_as_row(band_names))
 
 
@@ -1,50 +1,112 @@
 from PyQt5 import QtCore
-import scipy.signal as signal
+import os
+import h5py
 import numpy as np
 
+from spectrograms.spectrogram_engine import SpectrogramEngine
+from utility.parallel_executor import ParallelExecutor, trace_source_from_traces, get_n_samples
+
+
+def spectrogram_block(spectrogram_engine, source, positions, n_samples, first_segment, stop_segment):
+    # runs in a worker process of the ParallelExecutor
+    def read_window(start, stop):
+        return source.read_window(positions, start, stop)
+    return spectrogram_engine.compute_block(read_window, n_samples, first_segment, stop_segment)
+
+
+def get_spectrogram_file_path(recording_path):
+    return os.path.splitext(recording_path)[0] + '_spectrograms.h5'
+
 
 class SpectrogramsThread(QtCore.QThread):
     operation_changed = QtCore.pyqtSignal(str)
     progress_made = QtCore.pyqtSignal(float)
     finished = QtCore.pyqtSignal()
 
-    def __init__(self, parent, reader, grid_indices, grid_labels, filtered):
+    def __init__(self, parent, reader, grid_indices, grid_labels, filtered, settings, fs=None, skipped_indices=()):
         super().__init__(parent)
         self.reader = reader
         self.grid_indices = grid_indices
         self.grid_labels = grid_labels
         self.filtered = filtered
+        self.settings = settings
+        # bad channels (see channel_quality.py) keep their dataset in the spectrogram file, but it stays NaN
+        self.skipped_indices = set(skipped_indices)
+        # sampling frequency of the filtered traces, which differs from the recording for the decimated LFP copy
+        self.fs = reader.sampling_frequency if fs is None else fs
 
         self.frequencies, self.time, self.Sxx = None, None, None
+        self.spectrogram_file_path = get_spectrogram_file_path(reader.file_path)
+        # read-only handle of the spectrogram file, the tab closes it once the spectrograms are plotted
+        self.spectrogram_file = None
+        self.error_message = None
 
     def calculating_spectrogram(self, reader):
-        frequencies = []
-        time = []
-        Sxx = []
         # analysis of raw traces:
         # ids = reader.channel_ids
         # selected_ids = [ids[g_idx] for g_idx in self.grid_indices]
-        for idx in range(len(self.filtered)):
-            filtered_trace = self.filtered[idx]
-            # downsampling_stepsize = 1000
-            # sampling_rate = reader.sampling_frequency / downsampling_stepsize
-            sampling_rate = reader.sampling_frequency
-            # freqs, t, S_xx = signal.spectrogram(filtered_trace[::downsampling_stepsize], sampling_rate, nperseg=2**14,
-            #                                     noverlap=2 ** 10)
-            freqs, t, S_xx = signal.spectrogram(filtered_trace, sampling_rate, nperseg=2**16,
-                                                noverlap=2**15)
-
-            frequencies.append(freqs)
-
-            time.append(t)
-            Sxx.append(S_xx)
-            progress = round((idx + 1) / len(self.filtered) * 100.0, 2)
-            self.progress_made.emit(progress)
-        #   label = reader.labels[ch_id]
+        sampling_rate = self.fs
+        decimation = 1
+        if self.settings.decimate:
+            # the traces are decimated to about the LFP sampling rate before the spectrograms are computed
+            decimation = max(1, int(sampling_rate // self.settings.lfp_sampling_rate))
+        spectrogram_engine = SpectrogramEngine(sampling_rate, decimation, self.settings.segment_duration,
+                                               min_frequency=self.settings.min_frequency,
+                                               max_frequency=self.settings.max_frequency)
+        n_channels = len(self.filtered)
+        n_samples = get_n_samples(self.filtered)
+        n_segments = spectrogram_engine.get_n_segments(n_samples)
+
+        # The spectrograms are written to a file next to the recording block by block while they are computed, so
+        # neither the traces nor the spectrograms of all channels have to fit into memory. The file is written into a
+        # temporary file first and replaces the file of an earlier run only once it is complete.
+        temporary_path = self.spectrogram_file_path + '.part'
+        with h5py.File(temporary_path, 'w') as file:
+            file.create_dataset('frequencies', data=spectrogram_engine.frequencies)
+            file.create_dataset('times', data=spectrogram_engine.get_times(n_samples))
+            # decimation relative to the sampling rate of the recording
+            file.attrs['decimation'] = decimation * reader.sampling_frequency / sampling_rate
+            file.attrs['nperseg'] = spectrogram_engine.nperseg
+            file.attrs['noverlap'] = spectrogram_engine.noverlap
+            shape = (len(spectrogram_engine.frequencies), n_segments)
+            chunks = (shape[0], min(n_segments, 256)) if min(shape) > 0 else None
+            datasets = [file.create_dataset('Sxx/' + str(label), shape=shape, dtype='float32', chunks=chunks,
+                                            fillvalue=np.nan)
+                        for label in self.grid_labels]
+            positions = [idx for idx in range(n_channels) if idx not in self.skipped_indices]
+
+            segments_per_block = spectrogram_engine.get_segments_per_block(max(len(positions), 1))
+            blocks = spectrogram_engine.plan_blocks(n_samples, segments_per_block)
+            source = trace_source_from_traces(self.filtered)
+            try:
+                with ParallelExecutor() as executor:
+                    tasks = [(spectrogram_engine, source, positions, n_samples, first, stop)
+                             for first, stop in blocks] if len(positions) > 0 else []
+                    for finished, (task_index, columns) in enumerate(executor.map_tasks(spectrogram_block, tasks)):
+                        first, stop = blocks[task_index]
+                        for column_idx, idx in enumerate(positions):
+                            datasets[idx][:, first:stop] = columns[column_idx]
+                        progress = round((finished + 1) / len(tasks) * 100.0, 2)
+                        self.progress_made.emit(progress)
+            finally:
+                source.close()
+        os.replace(temporary_path, self.spectrogram_file_path)
+
+        # the spectrograms are read from the file when they are plotted
+        self.spectrogram_file = h5py.File(self.spectrogram_file_path, 'r')
+        frequencies = [self.spectrogram_file['frequencies'][:]] * n_channels
+        time = [self.spectrogram_file['times'][:]] * n_channels
+        Sxx = [self.spectrogram_file['Sxx/' + str(label)] for label in self.grid_labels]
         return frequencies, time, Sxx
-        # for idx, ch_id in enumerate(selected_ids):
 
     def run(self):
         self.operation_changed.emit('Calculating spectrograms...')
-        self.frequencies, self.time, self.Sxx = self.calculating_spectrogram(self.reader)
+        try:
+            self.frequencies, self.time, self.Sxx = self.calculating_spectrogram(self.reader)
+        except OSError as error:
+            # e.g. the spectrogram file is still opened by another program
+            self.error_message = str(error)
+            temporary_path = self.spectrogram_file_path + '.part'
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
         self.finished.emit()
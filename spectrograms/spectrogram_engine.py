@@ -0,0 +1,112 @@
+import numpy as np
+import scipy.fft
+from scipy.signal import get_window, resample_poly
+
+
+# In this script the spectrograms are computed block by block, so that the spectrograms of all channels of a recording
+# can be computed without holding the traces or the full spectrograms in memory. Optionally, the traces are first
+# decimated to a lower (LFP) sampling rate, which makes the segments much shorter without losing any of the low
+# frequencies that are looked at. Of every spectrum only the bins of the requested frequency range are kept, as float32.
+# The result equals scipy.signal.spectrogram (with its default window, detrending and scaling) of the decimated trace,
+# cropped to the frequency range.
+
+class SpectrogramEngine:
+    """
+    The SpectrogramEngine splits a recording into blocks of whole segments and computes the spectrogram columns of all
+    channels of a block at once
+    """
+    def __init__(self, fs, decimation=1, segment_duration=2.62144, overlap=0.5, min_frequency=0.0,
+                 max_frequency=None):
+        """
+        :param fs: sampling frequency of the traces in Hz
+        :param decimation: integer factor the sampling frequency is reduced by before the spectrogram is computed
+        :param segment_duration: duration of one segment in seconds (2.62144 s = 2**16 samples at 25 kHz)
+        :param overlap: fraction two following segments overlap
+        :param min_frequency: lowest frequency which is kept in Hz
+        :param max_frequency: highest frequency which is kept in Hz, None keeps all up to the Nyquist frequency
+        """
+        self.fs = fs
+        self.decimation = max(1, int(decimation))
+        self.output_fs = fs / self.decimation
+        self.nperseg = int(round(segment_duration * self.output_fs))
+        self.noverlap = int(round(overlap * self.nperseg))
+        self.step = self.nperseg - self.noverlap
+        self.window = get_window(('tukey', 0.25), self.nperseg)
+        self.scale = 1.0 / (self.output_fs * np.sum(self.window ** 2))
+
+        all_frequencies = scipy.fft.rfftfreq(self.nperseg, 1 / self.output_fs)
+        if max_frequency is None:
+            max_frequency = self.output_fs / 2
+        first_bin = np.searchsorted(all_frequencies, min_frequency, side='left')
+        last_bin = np.searchsorted(all_frequencies, max_frequency, side='right')
+        self.bins = slice(first_bin, last_bin)
+        self.frequencies = all_frequencies[self.bins]
+        # resample_poly filters with a FIR filter of 10 * decimation samples on each side, so blocks are read with
+        # (at least) this many extra samples to avoid edge effects. The padding is a multiple of the decimation factor,
+        # so the decimated samples of every block lie on the same grid as those of the whole trace.
+        self.padding = 11 * self.decimation if self.decimation > 1 else 0
+
+    def get_n_output_samples(self, n_samples):
+        return -(-n_samples // self.decimation)
+
+    def get_n_segments(self, n_samples):
+        n_output_samples = self.get_n_output_samples(n_samples)
+        if n_output_samples < self.nperseg:
+            return 0
+        return (n_output_samples - self.nperseg) // self.step + 1
+
+    def get_times(self, n_samples):
+        """
+        :return: time of the middle of every segment in seconds
+        """
+        return (np.arange(self.get_n_segments(n_samples)) * self.step + self.nperseg / 2) / self.output_fs
+
+    def get_segments_per_block(self, n_channels, memory_limit=2**28):
+        """
+        :param n_channels: number of channels that are processed at once
+        :param memory_limit: bytes a block may use
+        :return: number of segments per block
+        """
+        # raw block, windowed segments and their spectra per segment and channel
+        bytes_per_segment = n_channels * (self.step * self.decimation * 8 + self.nperseg * 8 * 3)
+        return max(1, int(memory_limit // bytes_per_segment))
+
+    def plan_blocks(self, n_samples, segments_per_block):
+        """
+        :return: list of (first segment, segment after the last one) of all blocks
+        """
+        n_segments = self.get_n_segments(n_samples)
+        return [(first, min(first + segments_per_block, n_segments))
+                for first in range(0, n_segments, segments_per_block)]
+
+    def compute_block(self, read_window, n_samples, first_segment, stop_segment):
+        """
+        Computes the spectrogram columns of the segments first_segment to stop_segment - 1
+        :param read_window: function read_window(start, stop) returning a (channels, stop - start) numpy array
+        :param n_samples: number of samples of the recording
+        :return: PSDs with shape (channels, frequencies, segments) as float32
+        """
+        output_start = first_segment * self.step
+        output_stop = (stop_segment - 1) * self.step + self.nperseg
+        raw_start = output_start * self.decimation
+        raw_stop = min(output_stop * self.decimation, n_samples)
+        read_start = max(raw_start - self.padding, 0)
+        read_stop = min(raw_stop + self.padding, n_samples)
+        block = np.asarray(read_window(read_start, read_stop), dtype=np.float64)
+        if self.decimation > 1:
+            block = resample_poly(block, 1, self.decimation, axis=-1)
+        offset = (raw_start - read_start) // self.decimation
+        block = block[:, offset:offset + output_stop - output_start]
+
+        segments = np.lib.stride_tricks.sliding_window_view(block, self.nperseg, axis=-1)[:, ::self.step]
+        windowed = (segments - segments.mean(axis=-1, keepdims=True)) * self.window
+        spectra = scipy.fft.rfft(windowed, axis=-1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+        # one sided spectrum: the power of the negative frequencies is added to the positive ones (except for the
+        # frequency 0 and the Nyquist frequency, which exist only once)
+        factors = np.full(power.shape[-1], 2.0)
+        factors[0] = 1.0
+        if self.nperseg % 2 == 0:
+            factors[-1] = 1.0
+        power = power[..., self.bins] * (factors[self.bins] * self.scale)
+        return np.transpose(power, (0, 2, 1)).astype(np.float32)
@@ -6,11 +6,32 @@ class SpectrogramsSettings:
 
     def __init__(self):
         self.channel_selection = SpectrogramsSettings.ChannelSelection.ALL
+        self.decimate = True  # decimate traces to the LFP sampling rate before computing the spectrograms
+        self.lfp_sampling_rate = 1000.0  # in Hz
+        self.segment_duration = 2.62144  # in seconds (2**16 samples at 25 kHz)
+        self.min_frequency = 0.0  # in Hz
+        self.max_frequency = 100.0  # in Hz, only frequencies up to here are stored
 
     def to_dict(self):
         result = dict()
         result['channel selection'] = self.channel_selection
+        result['decimate'] = self.decimate
+        result['lfp sampling rate'] = self.lfp_sampling_rate
+        result['segment duration'] = self.segment_duration
+        result['min frequency'] = self.min_frequency
+        result['max frequency'] = self.max_frequency
+        return result
 
     def from_dict(self, dict):
         if 'channel selection' in dict.keys():
             self.channel_selection = dict['channel selection']
+        if 'decimate' in dict.keys():
+            self.decimate = dict['decimate']
+        if 'lfp sampling rate' in dict.keys():
+            self.lfp_sampling_rate = dict['lfp sampling rate']
+        if 'segment duration' in dict.keys():
+            self.segment_duration = dict['segment duration']
+        if 'min frequency' in dict.keys():
+            self.min_frequency = dict['min frequency']
+        if 'max frequency' in dict.keys():
+            self.max_frequency = dict['max frequency']
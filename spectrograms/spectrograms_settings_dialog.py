@@ -31,6 +31,15 @@ class SpectrogramsSettingsDialog(QtWidgets.QDialog):
         group_layout.addWidget(self.selected_channels_button)
         main_layout.addWidget(group_box)
 
+        self.decimate_box = QtWidgets.QCheckBox('Decimate traces to LFP sampling rate first')
+        main_layout.addWidget(self.decimate_box)
+
+        self.max_frequency_textbox = QtWidgets.QLineEdit(self)
+        self.max_frequency_textbox.setAlignment(QtCore.Qt.AlignCenter)
+        self.max_frequency_textbox_label = QtWidgets.QLabel('Maximal frequency [Hz]:')
+        main_layout.addWidget(self.max_frequency_textbox_label)
+        main_layout.addWidget(self.max_frequency_textbox)
+
         self.okay_button = QtWidgets.QPushButton(self)
         self.okay_button.setText('Execute')
         self.okay_button.clicked.connect(self.on_okay_clicked)
@@ -43,9 +52,28 @@ class SpectrogramsSettingsDialog(QtWidgets.QDialog):
 
         self.setWindowTitle(title)
 
+        if not initial_settings:
+            initial_settings = SpectrogramsSettings()
+        self.initial_settings = initial_settings
+        self.set_settings(initial_settings)
+
+    def set_settings(self, settings):
+        if settings.channel_selection == SpectrogramsSettings.ChannelSelection.ALL:
+            self.all_channels_button.setChecked(True)
+        elif settings.channel_selection == SpectrogramsSettings.ChannelSelection.SELECTION:
+            self.selected_channels_button.setChecked(True)
+        self.decimate_box.setChecked(settings.decimate)
+        self.max_frequency_textbox.setText(str(settings.max_frequency))
+
     def get_settings(self):
         settings = SpectrogramsSettings()
+        settings.from_dict(self.initial_settings.to_dict())
         settings.channel_selection = self.selected_channels_button.isChecked()
+        settings.decimate = self.decimate_box.isChecked()
+        try:
+            settings.max_frequency = float(self.max_frequency_textbox.text())
+        except ValueError:
+            pass
 
         return settings
 
@@ -7,15 +7,18 @@ from IPython import embed
 from plots.plot_widget import PlotWidget
 from plot_manager import PlotManager
 from spectrograms.spectograms_thread import SpectrogramsThread
+from filtering.lfp_decimation import select_traces
 
 
 class SpectrogramsTab(QtWidgets.QWidget):
-    def __init__(self, parent, reader, grid_indices, grid_labels, settings):
+    def __init__(self, parent, reader, grid_indices, grid_labels, settings, skipped_indices=()):
         super().__init__(parent)
         self.reader = reader
         self.grid_indices = grid_indices
         self.grid_labels = grid_labels
         self.settings = settings
+        # positions (in grid_labels) of bad channels, their spectrograms are not computed
+        self.skipped_indices = set(skipped_indices)
 
         self.mea_file_view = parent
 
@@ -51,12 +54,20 @@ class SpectrogramsTab(QtWidgets.QWidget):
 
     def initialize_spectrogram_calculation(self):
         if self.frequencies is None:
-            filtered = self.mea_file_view.results.get_filter_mat()
+            filtered, fs = self.mea_file_view.results.get_filter_mat(), None
+            if self.settings.decimate and self.settings.max_frequency is not None:
+                # the decimated LFP copy of the filtered traces is used if it holds all frequencies of the spectrograms
+                # and its sampling rate is not below the one the spectrograms are computed at
+                lfp_filtered, lfp_fs = select_traces(self.mea_file_view.results, self.reader.sampling_frequency,
+                                                     self.settings.max_frequency)
+                if lfp_fs >= self.settings.lfp_sampling_rate:
+                    filtered, fs = lfp_filtered, lfp_fs
             self.progress_bar.setValue(0)
             self.progress_label.setText('')
             self.operation_label.setText('Calculating spectrograms')
             self.spectograms_thread = SpectrogramsThread(self, self.reader, self.grid_indices, self.grid_labels,
-                                                         filtered)
+                                                         filtered, self.settings, fs=fs,
+                                                         skipped_indices=self.skipped_indices)
             self.spectograms_thread.progress_made.connect(self.on_progress_made)
             self.spectograms_thread.operation_changed.connect(self.on_operation_changed)
             self.spectograms_thread.finished.connect(self.on_spectrograms_thread_finished)
@@ -77,15 +88,25 @@ class SpectrogramsTab(QtWidgets.QWidget):
         self.operation_label.setText(operation)
 
     def on_spectrograms_thread_finished(self):
-        self.progress_label.setText('Finished :)')
+        error_message = self.spectograms_thread.error_message
+        spectrogram_file = self.spectograms_thread.spectrogram_file
         self.frequencies = self.spectograms_thread.frequencies
         self.time = self.spectograms_thread.time
         self.Sxx = self.spectograms_thread.Sxx
         self.spectograms_thread = None
+        if error_message is not None:
+            self.progress_label.setText('Calculation of spectrograms failed: ' + error_message)
+            return
+        self.progress_label.setText('Finished :)')
         self.plot()
+        # the plots hold the spectrograms now, so the file is closed and can be written again by the next calculation
+        spectrogram_file.close()
+        self.Sxx = None
 
     def plot(self):
         for idx, label in enumerate(self.grid_labels):
+            if idx in self.skipped_indices:
+                continue
             self.create_plot_tab(label)
             plot_widget = self.get_plot_widget(label)
             sns.set()
@@ -93,11 +114,13 @@ class SpectrogramsTab(QtWidgets.QWidget):
             ax1 = fig.add_subplot(111)
             # overall_power = np.sum(self.Sxx[idx], axis=0)
             # embed()
-            spec_values = 10 * np.log10(self.Sxx[idx]/np.max(self.Sxx[idx]))
+            # the spectrogram of the channel is read from the sidecar file only now
+            channel_Sxx = self.Sxx[idx][:]
+            spec_values = 10 * np.log10(channel_Sxx/np.max(channel_Sxx))
             im = ax1.pcolormesh(self.time[idx], self.frequencies[idx], spec_values, shading='nearest', vmin=-60,
                                 vmax=0)
             # ax1.plot(self.time[idx], overall_power)
-            ax1.set_ylim(0, 100)
+            ax1.set_ylim(self.settings.min_frequency, self.settings.max_frequency)
             ax1.set_ylabel('frequency [Hz]')
             ax1.set_xlabel('time [sec]')
             cbar = fig.colorbar(im, ax=ax1)
@@ -0,0 +1,190 @@
+import os
+import numpy as np
+import h5py
+
+from filtering.filter_engine import FilterEngine
+from filtering.filter_settings import FilterSettings
+from file_handling.channel_statistics import get_source_signature
+
+
+# In this script a recording is preprocessed the way SpyKING CIRCUS (SC) preprocesses it before the spike detection, so
+# the spike check can show the traces SC worked on. SC processes the recording in chunks of chunk_size seconds (see its
+# parameter file, 30 s by default) and in every chunk
+#   1. bandpasses the traces (Butterworth of third order, zero-phase),
+#   2. subtracts the median of every channel over the chunk,
+#   3. subtracts the common median reference (median of all channels at every sample),
+#   4. optionally applies its spatial whitening matrix.
+# A chunk of all channels does not have to fit into memory here, the recording is processed in two passes:
+#   - the first pass filters SC's chunks in groups of channels and subtracts the median of every channel over the
+#     chunk. Like in the FilterEngine every chunk is read with some padding on both sides, so the bandpass has no edge
+#     transients at the chunk borders.
+#   - the second pass reads time blocks of all channels back from the file and subtracts the common median reference
+#     and applies the whitening, which both only combine the channels of a single sample.
+# Only the channels SC analyzed (all but the dead channels) are written, as float32, into a chunked sidecar file next to
+# the recording (<recording>_preprocessed.h5), one chunk holds a long time span of one channel, so a single channel is
+# read quickly for the preview.
+
+PREPROCESSED_DATASET = 'preprocessed'
+# length of SC's chunks in seconds, if the parameter file does not set it
+SC_CHUNK_SIZE = 30.0
+
+
+def get_preprocessed_path(recording_path):
+    return os.path.splitext(recording_path)[0] + '_preprocessed.h5'
+
+
+def get_preprocessing_parameters(cut_off, filter_order, remove_median, whitening, sc_chunk_size=SC_CHUNK_SIZE):
+    """
+    :return: dictionary of the parameters, stored as attributes of the sidecar file
+    """
+    return dict(cut_off=np.asarray(cut_off, dtype=np.float64), filter_order=int(filter_order),
+                remove_median=bool(remove_median), whitened=whitening is not None,
+                sc_chunk_size=float(sc_chunk_size))
+
+
+def preprocess_block(block, remove_median=True, whitening=None):
+    """
+    Subtracts the common median reference and applies the whitening to a block, whose channels are already filtered
+    and free of their chunk medians (see preprocess_recording)
+    :param block: block in uV with shape (channels, samples), changed in place
+    :param remove_median: if True, the common median reference is subtracted
+    :param whitening: spatial whitening matrix of SC with shape (channels, channels) or None
+    :return: preprocessed block
+    """
+    if remove_median:
+        block -= np.median(block, axis=0, keepdims=True)
+    if whitening is not None:
+        # SC multiplies the (samples, channels) chunk from the right, i.e. every output channel is a weighted sum of
+        # all channels. One matrix product per block, which numpy hands to BLAS.
+        block = whitening.T @ block
+    return block
+
+
+def preprocess_recording(reader, target_path, rows, cut_off, filter_order=3, remove_median=True, whitening=None,
+                         sc_chunk_size=SC_CHUNK_SIZE, block_bytes=2**27, chunk_samples=2**16, should_stop=None):
+    """
+    Preprocesses the rows of a recording and writes them to target_path. This is a generator, which yields the progress
+    in percent after every block. The file is written into a temporary file first, so a cancelled or failed run never
+    leaves an incomplete file behind.
+    :param reader: reader of the recording (see recording_reader.py)
+    :param target_path: path of the sidecar file, an existing file is replaced
+    :param rows: rows of the channels SC analyzed (in the order of SC's channels)
+    :param cut_off: lower and upper cutoff frequency of the bandpass in Hz
+    :param filter_order: order of the Butterworth bandpass
+    :param remove_median: if True, the common median reference is subtracted
+    :param whitening: spatial whitening matrix of SC with shape (len(rows), len(rows)) or None
+    :param sc_chunk_size: length of SC's chunks in seconds, the median of every channel is taken over these chunks
+    :param block_bytes: approximate size of the blocks (float64) which are processed at once
+    :param chunk_samples: samples per chunk of the sidecar file (every chunk holds a single channel)
+    :param should_stop: function returning True if the preprocessing should be cancelled
+    """
+    rows = list(rows)
+    if whitening is not None:
+        whitening = np.asarray(whitening, dtype=np.float64)
+        if whitening.shape != (len(rows), len(rows)):
+            raise ValueError('The whitening matrix has the shape ' + str(whitening.shape) + ', but ' + str(len(rows))
+                             + ' channels are preprocessed')
+    fs = reader.sampling_frequency
+    n_samples = reader.voltage_traces_dataset.shape[1]
+    engine = FilterEngine(FilterSettings.Mode.BANDPASS, cut_off[0], cut_off[1], fs, filter_order)
+    chunk_samples = max(1, min(chunk_samples, n_samples))
+    # first pass: SC's chunks (with padding) of as many channels as fit into block_bytes
+    sc_chunks = engine.plan_blocks(n_samples, max(1, int(round(sc_chunk_size * fs))))
+    sc_chunk_bytes = (min(int(round(sc_chunk_size * fs)), n_samples) + 2 * engine.get_padding()) * 8
+    channels_per_group = max(1, min(len(rows), block_bytes // max(sc_chunk_bytes, 1)))
+    groups = [range(group_start, min(group_start + channels_per_group, len(rows)))
+              for group_start in range(0, len(rows), channels_per_group)]
+    # second pass: the blocks consist of whole chunks of the sidecar file, so every chunk is rewritten only once
+    block_samples = max(1, block_bytes // (max(len(rows), 1) * 8 * chunk_samples)) * chunk_samples
+    second_pass = remove_median or whitening is not None
+    n_steps = len(sc_chunks) * len(groups) + (len(range(0, n_samples, block_samples)) if second_pass else 0)
+
+    temporary_path = target_path + '.part'
+    completed = False
+    try:
+        with h5py.File(temporary_path, 'w') as file:
+            file.attrs['n_samples'] = n_samples
+            file.attrs['source_mtime'], file.attrs['source_size'] = get_source_signature(reader.file_path)
+            for key, value in get_preprocessing_parameters(cut_off, filter_order, remove_median, whitening,
+                                                           sc_chunk_size).items():
+                file.attrs[key] = value
+            file.create_dataset('rows', data=np.asarray(rows, dtype=np.int64))
+            preprocessed = file.create_dataset(PREPROCESSED_DATASET, shape=(len(rows), n_samples), dtype=np.float32,
+                                               chunks=(1, chunk_samples))
+            preprocessed.attrs['fs'] = fs
+
+            step = 0
+            for chunk_start, chunk_stop, read_start, read_stop in sc_chunks:
+                for group in groups:
+                    if should_stop is not None and should_stop():
+                        return
+                    padded_block = reader.scale(reader.read_rows([rows[p] for p in group], read_start, read_stop))
+                    filtered = engine.filter_block(padded_block)[:, chunk_start - read_start:chunk_stop - read_start]
+                    filtered -= np.median(filtered, axis=1, keepdims=True)
+                    preprocessed[group[0]:group[-1] + 1, chunk_start:chunk_stop] = filtered
+                    step += 1
+                    yield round(step / max(n_steps, 1) * 100.0, 2)
+
+            if second_pass:
+                for block_start in range(0, n_samples, block_samples):
+                    if should_stop is not None and should_stop():
+                        return
+                    block_stop = min(block_start + block_samples, n_samples)
+                    block = preprocessed[:, block_start:block_stop].astype(np.float64)
+                    preprocessed[:, block_start:block_stop] = preprocess_block(block, remove_median, whitening)
+                    step += 1
+                    yield round(step / max(n_steps, 1) * 100.0, 2)
+        os.replace(temporary_path, target_path)
+        completed = True
+    finally:
+        if not completed and os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+class PreprocessedRecording:
+    """
+    The PreprocessedRecording reads the traces of the sidecar file written by preprocess_recording
+    """
+    def __init__(self, path):
+        self.file_path = path
+        self.file = h5py.File(path, 'r')
+        self.attrs = dict(self.file.attrs)
+        self.preprocessed = self.file[PREPROCESSED_DATASET]
+        self.sampling_frequency = self.preprocessed.attrs['fs']
+        # position of every row of the recording in the sidecar file
+        self.row_positions = {int(row): position for position, row in enumerate(self.file['rows'][:])}
+
+    @staticmethod
+    def open(recording_path, cut_off, filter_order=3, remove_median=True, whitening=None,
+             sc_chunk_size=SC_CHUNK_SIZE):
+        """
+        :return: the PreprocessedRecording of the recording or None if there is no sidecar file for the current version
+        of the recording, which was preprocessed with the given parameters
+        """
+        path = get_preprocessed_path(recording_path)
+        if not os.path.exists(path):
+            return None
+        try:
+            preprocessed = PreprocessedRecording(path)
+        except (OSError, KeyError):
+            return None
+        attrs = preprocessed.attrs
+        parameters = get_preprocessing_parameters(cut_off, filter_order, remove_median, whitening, sc_chunk_size)
+        if (attrs.get('source_mtime'), attrs.get('source_size')) != get_source_signature(recording_path) or \
+                any(key not in attrs or not np.array_equal(attrs[key], value) for key, value in parameters.items()):
+            preprocessed.close()
+            return None
+        return preprocessed
+
+    def has_row(self, row):
+        return row in self.row_positions
+
+    def get_trace(self, row, start=None, stop=None):
+        """
+        :param row: row of the channel in the recording
+        :return: preprocessed trace in uV (for whitened traces in whitened units) between start and stop
+        """
+        return self.preprocessed[self.row_positions[row], start:stop]
+
+    def close(self):
+        self.file.close()
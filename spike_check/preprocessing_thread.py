@@ -1,95 +1,58 @@
 from PyQt5 import QtCore
-import numpy as np
-from scipy.signal import filtfilt, butter
-import time
-from file_handling import SC_data_reader
-from utility.channel_utility import ChannelUtility
+
+from spike_check.preprocessing_engine import preprocess_recording, get_preprocessed_path, PreprocessedRecording
 
 
 class PreprocessingThread(QtCore.QThread):
+    """
+    Preprocesses the recording like SpyKING CIRCUS did (see preprocessing_engine.py) and writes it to a sidecar file.
+    A sidecar file of an earlier run with the same parameters is reused. Can be cancelled with abort().
+    """
     operation_changed = QtCore.pyqtSignal(str)
     progress_made = QtCore.pyqtSignal(float)
-    data_updated = QtCore.pyqtSignal(list)
     finished = QtCore.pyqtSignal()
 
     def __init__(self, parent, mcs_reader, sc_reader):
         super().__init__(parent)
         self.mcs_reader = mcs_reader
         self.sc_reader = sc_reader
+        self.aborted = False
 
-        self.scaled_matrix = None
-        self.filtered_matrix = None
-        self.preproc_matrix = None
-
-        self.labels = self.mcs_reader.labels
-
-    def get_scaled_channel_matrix(self, labels):
-        self.operation_changed.emit('Scaling traces...')
-        scaled_matrix = []
-        for idx, label in enumerate(labels):
-            scaled_channels_voltage_trace = self.mcs_reader.get_scaled_channel(label)
-            scaled_matrix.append(scaled_channels_voltage_trace)
-            progress = round(((idx + 1) / len(labels)) * 100.0, 2)
-            self.progress_made.emit(progress)
-        return scaled_matrix
-
-    def butter_bandpass(self, lowcut, highcut, fs, order=3):
-        nyq = 0.5 * fs
-        low = lowcut / nyq
-        high = highcut / nyq
-        b, a = butter(order, [low, high], btype='pass')
-        return b, a
+        # PreprocessedRecording once the preprocessing is done
+        self.preprocessed = None
+        self.error_message = None
 
-    def butter_bandpass_filter(self, data, lowcut, highcut, fs, order=3):
-        b, a = self.butter_bandpass(lowcut, highcut, fs, order=order)
-        y = filtfilt(b, a, data, axis=0)
-        return y
+    def abort(self):
+        self.aborted = True
 
-    def preprocess_file(self):
-        self.operation_changed.emit('Filtering traces and substracting median...')
-        num_of_elements = len(self.scaled_matrix[0])
-        # ToDo: find a clever way to get the dead channels
-        dead_channels = SC_data_reader.dead_channels
-
-        cluster_to_channel_index = dict()
-        channel_to_cluster_index = dict()  # note: dead channels do not have a cluster
-
-        cluster_index = 0
-        for channel_index in range(ChannelUtility.get_label_count()):
-            if channel_index not in dead_channels:
-                cluster_to_channel_index[cluster_index] = channel_index
-                channel_to_cluster_index[channel_index] = cluster_index
-                cluster_index += 1  # increase cluster index
-
-        fs = self.mcs_reader.sampling_frequency
-        preproc_matrix = np.full([len(self.scaled_matrix), num_of_elements], np.nan)
-        filtered_matrix = np.full([len(self.scaled_matrix), num_of_elements], np.nan)
-        step_size = self.chunk_size * fs
-        chunk_windows = np.arange(0, num_of_elements + step_size, step_size)
+    def get_parameters(self):
+        # the same parameters SC used, the whitening matrix only if SC computed one
         spatial_matrix = self.sc_reader.retrieve_spatial_mat()
-        # How many steps does it take, according to len of single channels, when we consider 30s chunks?:
-        for i, chunk_idx in enumerate(chunk_windows[:-1]):
-            local_chunk = np.asarray(self.scaled_matrix)[:, int(chunk_idx):int(chunk_windows[i+1])]
-            filtered = self.butter_bandpass_filter(local_chunk, 300, 4750, fs)
-            filtered_matrix[:, int(chunk_idx):int(chunk_windows[i+1])] = filtered
-            filtered -= np.median(filtered, 0)
-            global_median = np.median(filtered, 1)
-            filtered -= global_median[:, np.newaxis]
+        whitening = spatial_matrix[:] if spatial_matrix is not None else None
+        return dict(cut_off=self.sc_reader.cut_off, filter_order=3, remove_median=self.sc_reader.remove_median,
+                    whitening=whitening, sc_chunk_size=self.sc_reader.chunk_size)
 
-            # ToDo: find a way to remove dead channels and add them together later
-            # if self.label_index not in dead_channels:
-            # filtered = np.dot(spatial_matrix, filtered)
-            preproc_matrix[:, int(chunk_idx):int(chunk_windows[i+1])] = filtered
-            progress = round(((i + 1) / len(chunk_windows[:-1])) * 100.0, 2)
+    def preprocess_file(self):
+        parameters = self.get_parameters()
+        preprocessed = PreprocessedRecording.open(self.mcs_reader.file_path, **parameters)
+        if preprocessed is not None:
+            return preprocessed
+        self.operation_changed.emit('Filtering traces and subtracting median...')
+        # SC only analyzes the channels which are not dead, in the order of the rows of the recording
+        n_channels = self.mcs_reader.voltage_traces_dataset.shape[0]
+        rows = [row for row in range(n_channels) if row not in self.sc_reader.dead_channels]
+        target_path = get_preprocessed_path(self.mcs_reader.file_path)
+        for progress in preprocess_recording(self.mcs_reader, target_path, rows,
+                                             should_stop=lambda: self.aborted, **parameters):
             self.progress_made.emit(progress)
-        return filtered_matrix, preproc_matrix
+        if self.aborted:
+            return None
+        return PreprocessedRecording(target_path)
 
     def run(self):
         self.operation_changed.emit("preprocessing data")
-        t0 = time.time()
-
-        self.scaled_matrix = self.mcs_reader.voltage_traces
-        self.filtered_matrix, self.preproc_matrix = self.preprocess_file()
-        t1 = time.time() - t0
-        print('time for preprocessing file: ', t1)
+        try:
+            self.preprocessed = self.preprocess_file()
+        except (OSError, ValueError) as error:
+            self.error_message = str(error)
         self.finished.emit()
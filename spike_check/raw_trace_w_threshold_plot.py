@@ -1,17 +1,17 @@
 from PyQt5 import QtWidgets
 import numpy as np
 import seaborn as sns
-import matplotlib as mpl
 import matplotlib.gridspec as gridspec
 
 from plots.plot_widget import PlotWidget
+from plots.raw_trace_plot.lod_trace_line import LodTraceLine
+from utility.adc_histogram import AdcHistogram
 from utility.channel_utility import ChannelUtility
 
 
 class RawTraceWThresholdPlot(QtWidgets.QWidget):
     def __init__(self, parent, mcs_reader, sc_reader, label, label_index):
         super().__init__(parent)
-        mpl.rcParams['agg.path.chunksize'] = 10000
         self.mcs_reader = mcs_reader
         self.sc_reader = sc_reader
         self.label = label
@@ -20,6 +20,10 @@ class RawTraceWThresholdPlot(QtWidgets.QWidget):
         self.time = None
         self.filter_trace = None
         self.base_file_trace = None
+        self.trace_line = None
+        # PreprocessedRecording (see preprocessing_engine.py), its trace is drawn over the raw trace
+        self.preprocessed = None
+        self.preprocessed_line = None
         self.scatter_mua_time = None
         self.scatter_mua_indices = None
         self.scatter_mua_amps = None
@@ -67,13 +71,8 @@ class RawTraceWThresholdPlot(QtWidgets.QWidget):
         main_layout.addWidget(plot_widget)
 
     def scale_trace(self, trace_to_scale):
-        vt = trace_to_scale
-        conversion_factor = \
-            self.mcs_reader.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel'][0]['ConversionFactor']
-        exponent = self.mcs_reader.file['Data']['Recording_0']['AnalogStream']['Stream_0']['InfoChannel'][0]['Exponent'] + 6
-        # 6 = pV -> uV
-        scaled_trace = vt * conversion_factor * np.power(10.0, exponent)
-        return scaled_trace
+        # the conversion factor and exponent are read once by the McsDataReader
+        return self.mcs_reader.scale(trace_to_scale)
 
     def plot(self, label):
         # self.label_index = ChannelUtility.get_ordered_index(label)
@@ -81,8 +80,9 @@ class RawTraceWThresholdPlot(QtWidgets.QWidget):
 
         # CAUTION: Filtering is now done by SC
         # self.filter_trace = self.mcs_reader.get_scaled_channel(label)
-        self.base_file_trace = self.sc_reader.base_file_voltage_traces[self.label_index]
-        self.base_file_trace = self.scale_trace(self.base_file_trace)
+        # the trace is kept as raw ADC values, only the drawn points, the spike amplitudes and the bin edges of the
+        # histogram are scaled
+        self.base_file_trace = self.sc_reader.base_file_voltage_traces[self.label_index, :]
         self.time = np.arange(0, len(self.base_file_trace) / fs, 1 / fs)
 
         if len(self.dead_channels) > 0:
@@ -101,11 +101,11 @@ class RawTraceWThresholdPlot(QtWidgets.QWidget):
                     scatter_jdx = sj
                     try:
                         self.scatter_cluster_time.append(self.time[scatter_jdx])
-                        self.scatter_cluster_amps.append(self.base_file_trace[scatter_jdx])
+                        self.scatter_cluster_amps.append(self.scale_trace(self.base_file_trace[scatter_jdx]))
                     except IndexError:
                         scatter_t_max_jdx = min(scatter_jdx, len(self.time) - 1)
                         self.scatter_cluster_time.append(self.time[scatter_t_max_jdx])
-                        self.scatter_cluster_amps.append(self.base_file_trace[scatter_t_max_jdx])
+                        self.scatter_cluster_amps.append(self.scale_trace(self.base_file_trace[scatter_t_max_jdx]))
         else:
             # self.scatter_mua_indices, sorted_mua_amplitudes = self.sc_reader.retrieve_mua_spikes()
             spike_index = self.channel_to_cluster_index[self.label_index]
@@ -119,14 +119,14 @@ class RawTraceWThresholdPlot(QtWidgets.QWidget):
                 scatter_jdx = sj
                 try:
                     self.scatter_cluster_time.append(self.time[scatter_jdx])
-                    self.scatter_cluster_amps.append(self.base_file_trace[scatter_jdx])
+                    self.scatter_cluster_amps.append(self.scale_trace(self.base_file_trace[scatter_jdx]))
                 except IndexError:
                     scatter_t_max_jdx = min(scatter_jdx, len(self.time) - 1)
                     self.scatter_cluster_time.append(self.time[scatter_t_max_jdx])
-                    self.scatter_cluster_amps.append(self.base_file_trace[scatter_t_max_jdx])
+                    self.scatter_cluster_amps.append(self.scale_trace(self.base_file_trace[scatter_t_max_jdx]))
 
         self.ax_preproc.cla()
-        self.ax_preproc.plot(self.time, self.base_file_trace, zorder=1)
+        self.plot_trace(fs)
         if len(self.dead_channels) > 0:
             if self.label_index not in self.dead_channels:
                 self.ax_preproc.scatter(self.scatter_cluster_time, self.scatter_cluster_amps, marker='o', color='k',
@@ -143,20 +143,44 @@ class RawTraceWThresholdPlot(QtWidgets.QWidget):
                                     zorder=2)
             self.ax_preproc.set_xlabel('time [s]')
             self.ax_preproc.set_ylabel(r'voltage [$\mu\,$V]')
-        trace = self.base_file_trace
         self.ax_hist.cla()
-        vert_hist = np.histogram(trace, bins=1000)
-        height = np.ceil(max(vert_hist[1])) - np.floor(min(vert_hist[1]))
-        height = height / len(vert_hist[0])
-        self.ax_hist.barh(vert_hist[1][:-1], vert_hist[0], height=height)
+        # exact histogram of the ADC steps (np.bincount instead of np.histogram on a scaled float copy)
+        counts, raw_edges = self.get_histogram().get_binned_counts(1000)
+        edges = self.scale_trace(raw_edges)
+        self.ax_hist.barh(edges[:-1], counts, height=np.diff(edges), align='edge')
         self.ax_hist.get_xaxis().set_visible(False)
         self.ax_hist.get_yaxis().set_visible(False)
         self.figure.canvas.draw_idle()
 
+    def get_histogram(self):
+        # the histogram is taken from the precomputed statistics of the recording, if they belong to the base file
+        statistics = self.mcs_reader.get_channel_statistics()
+        if statistics is not None and statistics.matches_source(self.sc_reader.base_filepath,
+                                                                self.sc_reader.base_file_voltage_traces.shape):
+            return statistics.get_histogram(self.label_index)
+        return AdcHistogram.from_values(self.base_file_trace)
+
+    def set_preprocessed(self, preprocessed):
+        self.preprocessed = preprocessed
+
+    def plot_trace(self, fs):
+        # only as many points as there are pixels are drawn (as min/max envelope) instead of every sample, the visible
+        # window is drawn again whenever the axis is zoomed or panned
+        self.trace_line = LodTraceLine(self.ax_preproc, lambda start, stop: self.base_file_trace[start:stop],
+                                       len(self.base_file_trace), fs, scale=self.scale_trace, zorder=1)
+        self.preprocessed_line = None
+        if self.preprocessed is not None and self.preprocessed.has_row(self.label_index):
+            # the trace SC detected the spikes on (read from the sidecar file, only the visible window)
+            self.preprocessed_line = LodTraceLine(
+                self.ax_preproc, lambda start, stop: self.preprocessed.get_trace(self.label_index, start, stop),
+                len(self.base_file_trace), fs, zorder=1, color='#006d7c', alpha=0.8)
+            self.preprocessed_line.draw()
+        self.trace_line.draw()
+
     def on_scatter_plot_updated(self, label_idx, index):
         self.ax_preproc.cla()
         self.ax_preproc.grid(False)
-        self.ax_preproc.plot(self.time, self.base_file_trace, zorder=1)
+        self.plot_trace(self.mcs_reader.sampling_frequency)
         print(label_idx)
         if len(self.dead_channels) > 0:
             if label_idx not in self.dead_channels:
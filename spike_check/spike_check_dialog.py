@@ -21,8 +21,8 @@ class SpikeCheckDialog(QtWidgets.QDialog):
         self.st_index = 0
 
         self.pre_proc_thread = None
-        self.filtered_matrix = None
-        self.preproc_mat = None
+        # PreprocessedRecording with the traces as SC preprocessed them, see preprocessing_engine.py
+        self.preprocessed = None
 
         self.setWindowFlag(QtCore.Qt.CustomizeWindowHint, True)
         self.setWindowFlag(QtCore.Qt.WindowTitleHint, True)
@@ -60,16 +60,29 @@ class SpikeCheckDialog(QtWidgets.QDialog):
         main_layout.addWidget(self.navigation_buttons_widget, 3, 0, 1, 2)
         self.navigation_buttons_widget.index_changed.connect(self.on_spiketime_index_changed)
 
+        # the preprocessing of SC is repeated on demand, it takes a while for long recordings
+        preprocessing_layout = QtWidgets.QHBoxLayout()
+        self.preprocessing_button = QtWidgets.QPushButton('Show SC preprocessing', self)
+        self.preprocessing_button.pressed.connect(self.initialize_preprocessing_thread)
+        preprocessing_layout.addWidget(self.preprocessing_button)
+        self.operation_label = QtWidgets.QLabel(self)
+        preprocessing_layout.addWidget(self.operation_label)
+        self.progress_bar = QtWidgets.QProgressBar(self)
+        self.progress_bar.setRange(0, 100)
+        preprocessing_layout.addWidget(self.progress_bar)
+        self.progress_label = QtWidgets.QLabel(self)
+        preprocessing_layout.addWidget(self.progress_label)
+        main_layout.addLayout(preprocessing_layout, 4, 0, 1, 2)
+
         # self.histogram_plot_widget.plot(self.label_index)
         self.spike_time_plot_widget.plot(self.label_index, self.st_index)
         self.raw_trace_plot_widget.plot(self.label)
         self.spike_sorting_plot_widget.plot(self.label, self.st_index)
 
-        # self.initialize_preprocessing_thread()
-
     @QtCore.pyqtSlot()
     def initialize_preprocessing_thread(self):
-        if self.preproc_mat is None:
+        if self.preprocessed is None and self.pre_proc_thread is None:
+            self.preprocessing_button.setEnabled(False)
             self.progress_bar.setValue(0)
             self.progress_label.setText('')
             self.pre_proc_thread = PreprocessingThread(self, self.mcs_reader, self.sc_reader)
@@ -77,7 +90,7 @@ class SpikeCheckDialog(QtWidgets.QDialog):
             self.pre_proc_thread.operation_changed.connect(self.on_operation_changed)
             self.pre_proc_thread.finished.connect(self.on_pre_proc_thread_finished)
 
-            debug_mode = True  # set to 'True' in order to debug plot creation with embed
+            debug_mode = False  # set to 'True' in order to debug plot creation with embed
             if debug_mode:
                 # synchronous plotting (runs in main thread and thus allows debugging)
                 self.pre_proc_thread.run()
@@ -99,14 +112,25 @@ class SpikeCheckDialog(QtWidgets.QDialog):
 
     @QtCore.pyqtSlot()
     def on_pre_proc_thread_finished(self):
+        self.preprocessed = self.pre_proc_thread.preprocessed
+        error_message = self.pre_proc_thread.error_message
+        self.pre_proc_thread = None
+        if self.preprocessed is None:
+            self.progress_label.setText('Preprocessing failed: ' + str(error_message))
+            self.preprocessing_button.setEnabled(True)
+            return
         self.progress_label.setText("Finished :)")
-        if self.pre_proc_thread.preproc_matrix is not None:
-            self.preproc_mat = self.pre_proc_thread.preproc_matrix.copy()
-        if self.pre_proc_thread.filtered_matrix is not None:
-            self.filtered_matrix = self.pre_proc_thread.filtered_matrix.copy()
+        self.raw_trace_plot_widget.set_preprocessed(self.preprocessed)
+        self.raw_trace_plot_widget.plot(self.label)
 
-        self.pre_proc_thread = None
-        self.raw_trace_plot_widget.plot(self.label, self.preproc_mat)
+    def done(self, result):
+        # the preprocessing is cancelled when the dialog is closed, the sidecar file is only kept if it is complete
+        if self.pre_proc_thread is not None:
+            self.pre_proc_thread.abort()
+            self.pre_proc_thread.wait()
+        if self.preprocessed is not None:
+            self.preprocessed.close()
+        super().done(result)
 
     @QtCore.pyqtSlot(str)
     def on_channel_selection_changed(self, label):
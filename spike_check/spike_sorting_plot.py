@@ -53,7 +53,8 @@ class SpikeSortingPlot(QtWidgets.QWidget):
                 self.ax.cla()
                 fs = self.mcs_reader.sampling_frequency
 
-                trace = self.mcs_reader.voltage_traces[label_index]
+                # only the raw windows around the spikes are read, not the whole channel
+                n_samples = self.mcs_reader.voltage_traces_dataset.shape[1]
 
                 step_index = 0.002 * fs
                 spike_index = self.channel_to_cluster_index[label_index]
@@ -61,8 +62,8 @@ class SpikeSortingPlot(QtWidgets.QWidget):
                 spike_amplitudes = []
                 for spike_index in spike_indices:
                     spike_min_idx = int(max(0, spike_index - step_index))
-                    spike_max_idx = int(min(spike_index + step_index, len(trace)))
-                    spike_vt = trace[spike_min_idx:spike_max_idx]
+                    spike_max_idx = int(min(spike_index + step_index, n_samples))
+                    spike_vt = self.mcs_reader.voltage_traces[label_index, spike_min_idx:spike_max_idx]
                     spike_amplitudes.append(spike_vt)
                     spike_time = np.arange(-0.002, 0.002, 1/fs)
                     for i, spike_amp in enumerate(spike_amplitudes):
@@ -80,7 +81,8 @@ class SpikeSortingPlot(QtWidgets.QWidget):
             self.ax.cla()
             fs = self.mcs_reader.sampling_frequency
 
-            trace = self.mcs_reader.voltage_traces[label_index]
+            # only the raw windows around the spikes are read, not the whole channel
+            n_samples = self.mcs_reader.voltage_traces_dataset.shape[1]
 
             step_index = 0.002 * fs
             spike_index = self.channel_to_cluster_index[label_index]
@@ -88,8 +90,8 @@ class SpikeSortingPlot(QtWidgets.QWidget):
             spike_amplitudes = []
             for spike_index in spike_indices:
                 spike_min_idx = int(max(0, spike_index - step_index))
-                spike_max_idx = int(min(spike_index + step_index, len(trace)))
-                spike_vt = trace[spike_min_idx:spike_max_idx]
+                spike_max_idx = int(min(spike_index + step_index, n_samples))
+                spike_vt = self.mcs_reader.voltage_traces[label_index, spike_min_idx:spike_max_idx]
                 spike_amplitudes.append(spike_vt)
                 spike_time = np.arange(-0.002, 0.002, 1 / fs)
                 for i, spike_amp in enumerate(spike_amplitudes):
@@ -53,14 +53,16 @@ class SpikeTimePlot(QtWidgets.QWidget):
                 spike_label_index = label_index
         else:
             spike_label_index = label_index
-        trace = self.sc_reader.base_file_voltage_traces[label_index]
         fs = self.mcs_reader.sampling_frequency
 
         spiketime_index = self.sc_reader.spiketimes[spike_label_index][spike_idx]
 
         spiketime = spiketime_index/fs
+        # only the samples around the spike are read from the base file
+        trace_length = self.sc_reader.base_file_voltage_traces.shape[1]
         st_start_index = max(int(spiketime_index - 500), 0)   # entspricht 50 ms
-        st_end_index = min(int(spiketime_index + 500), len(trace))
+        st_end_index = min(int(spiketime_index + 500), trace_length)
+        window = self.sc_reader.base_file_voltage_traces[label_index, st_start_index:st_end_index]
         time = np.arange((st_start_index/fs), (st_end_index/fs), 1/fs)
         if len(self.dead_channels) > 0:
             if label_index not in self.dead_channels:
@@ -68,24 +70,26 @@ class SpikeTimePlot(QtWidgets.QWidget):
                 self.ax.set_xticklabels([])
                 self.ax.set_yticklabels([])
                 try:
-                    self.ax.plot(time, trace[st_start_index:st_end_index])
+                    self.ax.plot(time, window)
                 except ValueError:
-                    self.ax.plot(time[:-1], trace[st_start_index:st_end_index])
-                if spiketime_index < len(trace):
-                    self.ax.scatter(spiketime, trace[spiketime_index], marker='o', color='red', zorder=2)
+                    self.ax.plot(time[:-1], window)
+                if spiketime_index < trace_length:
+                    self.ax.scatter(spiketime, window[spiketime_index - st_start_index], marker='o', color='red',
+                                    zorder=2)
                     self.ax.set_xticklabels([])
                     self.ax.set_yticklabels([])
                 self.figure.canvas.draw_idle()
         else:
             self.ax.cla()
             try:
-                self.ax.plot(time, trace[st_start_index:st_end_index])
+                self.ax.plot(time, window)
             except ValueError:
-                self.ax.plot(time[:-1], trace[st_start_index:st_end_index])
+                self.ax.plot(time[:-1], window)
             self.ax.set_xticklabels([])
             self.ax.set_yticklabels([])
-            if spiketime_index < len(trace):
-                self.ax.scatter(spiketime, trace[spiketime_index], marker='o', color='red', zorder=2)
+            if spiketime_index < trace_length:
+                self.ax.scatter(spiketime, window[spiketime_index - st_start_index], marker='o', color='red',
+                                zorder=2)
                 self.ax.set_xticklabels([])
                 self.ax.set_yticklabels([])
             self.figure.canvas.draw_idle()
@@ -2,6 +2,7 @@ from PyQt5 import QtWidgets
 import seaborn as sns
 
 from plots.plot_widget import PlotWidget
+from utility.adc_histogram import AdcHistogram
 
 
 class VoltageTraceHistogramPlot(QtWidgets.QWidget):
@@ -30,7 +31,18 @@ class VoltageTraceHistogramPlot(QtWidgets.QWidget):
 
     def plot(self, label_index):
         self.label_index = label_index
-        trace = self.sc_reader.base_file_voltage_traces[self.label_index]
         self.ax.cla()
-        self.ax.hist(trace, density=True, bins=1000)
+        # the ADC steps are counted with np.bincount (or taken from the precomputed statistics of the recording), only
+        # the bin edges are converted to uV. The counts are handed to hist as weights of the bin positions, so
+        # matplotlib does not bin the samples again. The statistics are only used if they were computed from the base
+        # file of the spyking circus results.
+        statistics = self.mcs_reader.get_channel_statistics()
+        if statistics is not None and statistics.matches_source(self.sc_reader.base_filepath,
+                                                                self.sc_reader.base_file_voltage_traces.shape):
+            histogram = statistics.get_histogram(self.label_index)
+        else:
+            histogram = AdcHistogram.from_values(self.sc_reader.base_file_voltage_traces[self.label_index])
+        counts, raw_edges = histogram.get_binned_counts(1000)
+        edges = self.mcs_reader.scale(raw_edges)
+        self.ax.hist(edges[:-1], bins=edges, weights=counts, density=True)
         self.figure.canvas.draw_idle()
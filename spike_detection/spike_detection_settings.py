@@ -18,6 +18,7 @@ class SpikeDetectionSettings:
         self.spike_window = 0.2  # in seconds
         self.mode = SpikeDetectionSettings.Mode.BOTH
         self.threshold_factor = 5
+        self.dead_time = 0.003  # in seconds
         self.save_spiketimes = False
         self.append_to_file = False
         self.channel_selection = SpikeDetectionSettings.ChannelSelection.ALL
@@ -28,6 +29,7 @@ class SpikeDetectionSettings:
         result["spike_window"] = self.spike_window
         result["mode"] = self.mode
         result["threshold_factor"] = self.threshold_factor
+        result["dead_time"] = self.dead_time
         result["save spiketimes"] = self.save_spiketimes
         result["append to file"] = self.append_to_file
         result["channel selection"] = self.channel_selection
@@ -42,6 +44,8 @@ class SpikeDetectionSettings:
             self.mode = dictionary["mode"]
         if "threshold_factor" in dictionary.keys():
             self.threshold_factor = dictionary["threshold_factor"]
+        if "dead_time" in dictionary.keys():
+            self.dead_time = dictionary["dead_time"]
         if "save spiketimes" in dictionary.keys():
             self.save_spiketimes = dictionary["save spiketimes"]
         if "append to file" in dictionary.keys():
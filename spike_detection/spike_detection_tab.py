@@ -9,7 +9,7 @@ from spike_detection.spike_detection_thread import SpikeDetectionThread
 
 
 class SpikeDetectionTab(QtWidgets.QWidget):
-    def __init__(self, parent, meae_filename, reader, grid_indices, grid_labels, settings):
+    def __init__(self, parent, meae_filename, reader, grid_indices, grid_labels, settings, skipped_indices=()):
         super().__init__(parent)
         # set input class variables
         self.meae_filename = meae_filename
@@ -17,6 +17,8 @@ class SpikeDetectionTab(QtWidgets.QWidget):
         self.grid_indices = grid_indices
         self.grid_labels = grid_labels
         self.settings = settings
+        # grid indices of bad channels, which are not searched for spikes (they get no spikes)
+        self.skipped_indices = skipped_indices
 
         # set spike_detection_thread to none
         self.spike_detection_thread = None
@@ -129,7 +131,8 @@ class SpikeDetectionTab(QtWidgets.QWidget):
             self.progress_label.setText("Detecting Spikes")
             self.spike_detection_thread = SpikeDetectionThread(self, self.reader, self.settings.file_mode,
                                                                self.settings.spike_window, self.settings.mode,
-                                                               self.settings.threshold_factor, self.grid_indices)
+                                                               self.settings.threshold_factor, self.grid_indices,
+                                                               self.settings.dead_time, self.skipped_indices)
             self.spike_detection_thread.progress_made.connect(self.on_progress_made)
             self.spike_detection_thread.operation_changed.connect(self.on_operation_changed)
             self.spike_detection_thread.channel_data_updated.connect(self.on_channel_data_updated)
@@ -171,7 +174,7 @@ class SpikeDetectionTab(QtWidgets.QWidget):
         if self.settings.save_spiketimes:
             path = os.path.split(self.reader.file_path)[0]
             if self.meae_filename is None:
-                self.meae_filename = os.path.split(self.reader.file_path)[-1][:-3] + '.meae'
+                self.meae_filename = os.path.splitext(os.path.split(self.reader.file_path)[-1])[0] + '.meae'
             self.save_spike_mat(self.spike_mat, self.spike_indices, self.reader.file_path)
 
     @QtCore.pyqtSlot(list)
@@ -179,6 +182,7 @@ class SpikeDetectionTab(QtWidgets.QWidget):
 
         if len(data) == 4: # old spike detection
             signal, spiketime_index, spike_value, threshold = data[0], data[1], data[2], data[3]
+            self.threshold = threshold
             if len(signal) > 0:
                 self.voltage_trace.append(signal)
                 self.time_vt.append(list(np.arange(0, len(signal) * (1 / self.fs), 1 / self.fs)))
@@ -2,10 +2,11 @@ from PyQt5 import QtCore
 import numpy as np
 from scipy import signal
 from spike_detection.spike_detection_settings import SpikeDetectionSettings
-import time
 from IPython import embed
 
 from .spike_detection_settings import SpikeDetectionSettings
+from spike_detection import threshold_detection
+from utility.parallel_executor import ParallelExecutor, McsTraceSource, Hdf5TraceSource
 
 
 class SpikeDetectionThread(QtCore.QThread):
@@ -15,7 +16,8 @@ class SpikeDetectionThread(QtCore.QThread):
     channel_data_updated = QtCore.pyqtSignal(list)
     finished = QtCore.pyqtSignal()
 
-    def __init__(self, parent, reader, file_mode, spike_window, mode, threshold_factor, grid_indices):
+    def __init__(self, parent, reader, file_mode, spike_window, mode, threshold_factor, grid_indices, dead_time=0.0,
+                 skipped_indices=()):
         super().__init__(parent)
         self.reader = reader
         self.file_mode = file_mode
@@ -23,6 +25,9 @@ class SpikeDetectionThread(QtCore.QThread):
         self.mode = mode
         self.threshold_factor = threshold_factor
         self.grid_indices = grid_indices
+        self.dead_time = dead_time
+        # bad channels (see channel_quality.py) keep their place in the results, but are not read
+        self.skipped_indices = set(skipped_indices)
 
         self.spike_indices, self.spike_mat = None, None
 
@@ -50,7 +55,6 @@ class SpikeDetectionThread(QtCore.QThread):
             # in this case, the whole channel should be loaded, since the filter should be applied at once
             signal = signals[ch_id]
             threshold = self.threshold_factor * np.median(np.absolute(signal) / 0.6745)
-            print(threshold)
             collect_peaks = (self.mode == SpikeDetectionSettings.Mode.PEAKS or
                              self.mode == SpikeDetectionSettings.Mode.BOTH)
             collect_troughs = (self.mode == SpikeDetectionSettings.Mode.TROUGHS or
@@ -125,7 +129,6 @@ class SpikeDetectionThread(QtCore.QThread):
             signals = reader.filtered_traces
         ids = reader.channel_ids
         fs = reader.sampling_frequency
-        print('grid indices:', self.grid_indices, '\n', 'channel ids:', ids)
         if self.grid_indices in ids:
             selected_ids = [ids[g_idx] for g_idx in self.grid_indices]
         else:
@@ -134,7 +137,6 @@ class SpikeDetectionThread(QtCore.QThread):
         for idx, ch_id in enumerate(selected_ids):
             # in this case, the whole channel should be loaded, since the filter should be applied at once
             ch_signal = signals[ch_id]
-            print(ch_id, ch_signal)
             threshold = self.threshold_factor * np.median(np.absolute(ch_signal) / 0.6745)
             collect_peaks = (self.mode == SpikeDetectionSettings.Mode.PEAKS or
                              self.mode == SpikeDetectionSettings.Mode.BOTH)
@@ -154,7 +156,6 @@ class SpikeDetectionThread(QtCore.QThread):
             self.single_spike_data_updated.emit(single_spike_data)
 
             spiketimes = np.asarray(channel_spike_indices) / fs
-            print(spiketimes)
             spike_mat.append(spiketimes)
             data = [spiketimes]
             self.channel_data_updated.emit(data)
@@ -163,10 +164,66 @@ class SpikeDetectionThread(QtCore.QThread):
             self.progress_made.emit(progress)
         return indices, spike_mat
 
+    def vectorized_spike_detection(self, mea_data_reader):
+        reader = mea_data_reader
+        ids = reader.channel_ids
+        fs = reader.sampling_frequency
+        selected_indices = [g_idx for g_idx in self.grid_indices if g_idx < len(ids)]
+        # positions (in the results) of the channels which are searched, skipped channels get no spikes
+        positions = [position for position, g_idx in enumerate(selected_indices) if g_idx not in self.skipped_indices]
+        detected_indices = [selected_indices[position] for position in positions]
+        dead_time_samples = int(self.dead_time * fs)
+        half_window = int((self.spike_window / 2) * fs)
+
+        # The channels are distributed over all cores. Every worker process opens the file itself and reads the whole
+        # channel, since the threshold is computed on the whole trace.
+        detection_function = threshold_detection.detect_channel_spikes
+        scaling_kwargs = dict()
+        channel_kwargs = dict()
+        if self.file_mode == SpikeDetectionSettings.FileMode.MCS:
+            raw_scaling = reader.get_raw_scaling()
+            # raw recordings are searched on their integer ADC values, only the threshold and the amplitudes of the
+            # live plot are converted to uV
+            source = McsTraceSource(reader.file_path, [reader.labels[g_idx] for g_idx in detected_indices],
+                                    raw=raw_scaling is not None)
+            if raw_scaling is not None:
+                detection_function = threshold_detection.detect_channel_spikes_raw
+                scaling_kwargs = dict(zero=raw_scaling[0], gain=raw_scaling[1])
+                # with precomputed statistics the workers do not have to count the ADC steps of the channels again
+                statistics = reader.get_channel_statistics()
+                if statistics is not None:
+                    absolute_medians = [statistics.get_histogram(ids[g_idx]).get_absolute_deviation_median(
+                        raw_scaling[0]) for g_idx in detected_indices]
+                    channel_kwargs = dict(absolute_median=absolute_medians)
+        elif self.file_mode == SpikeDetectionSettings.FileMode.MEAE:
+            source = Hdf5TraceSource(reader.file_path, reader.filtered_traces.name,
+                                     [ids[g_idx] for g_idx in detected_indices])
+        indices = [np.array([], dtype=np.int64) for _ in selected_indices]
+        spike_mat = [np.array([]) for _ in selected_indices]
+        if len(detected_indices) == 0:
+            return indices, spike_mat
+        with ParallelExecutor() as executor:
+            for finished, (idx, (channel_spike_indices, threshold, single_spike_data)) in enumerate(
+                    executor.map_channels(detection_function, source, threshold_factor=self.threshold_factor,
+                                          mode=self.mode, dead_time_samples=dead_time_samples,
+                                          half_window=half_window, channel_kwargs=channel_kwargs,
+                                          **scaling_kwargs)):
+                # instead of one signal per spike, only the last spike of a channel is sent to the live plot
+                if single_spike_data is not None:
+                    self.single_spike_data_updated.emit(single_spike_data)
+
+                spiketimes = channel_spike_indices / fs
+                spike_mat[positions[idx]] = spiketimes
+                data = [spiketimes]
+                self.channel_data_updated.emit(data)
+
+                indices[positions[idx]] = channel_spike_indices
+
+                progress = round(((finished + 1) / len(detected_indices)) * 100.0, 2)
+                self.progress_made.emit(progress)
+        return indices, spike_mat
+
     def run(self):
         self.operation_changed.emit("Detecting spikes")
-        t0 = time.time()
-        self.spike_indices, self.spike_mat = self.old_spike_detection(self.reader)
-        t1 = time.time() - t0
-        print('time for one channel via new spike detection: ', t1)
+        self.spike_indices, self.spike_mat = self.vectorized_spike_detection(self.reader)
         self.finished.emit()
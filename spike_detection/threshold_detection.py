@@ -0,0 +1,165 @@
+import numpy as np
+
+from spike_detection.spike_detection_settings import SpikeDetectionSettings
+from utility.adc_histogram import AdcHistogram
+
+
+# NumPy implementation of the threshold crossing spike detection. Instead of walking through every sample of a channel
+# in a python loop, the supra-threshold regions of the whole trace are found with boolean masks and the extreme value
+# of each region is taken as spike.
+# Unfiltered recordings can be searched on their raw integer ADC values (detect_channel_spikes_raw): the scaling to uV
+# is linear, so instead of scaling the whole trace into a float64 copy, only the threshold and the reported amplitudes
+# are converted.
+
+def mad_threshold(signal, threshold_factor):
+    """
+    Computes the detection threshold from the median absolute deviation of the signal
+    :param signal: voltage trace as 1-dimensional numpy array
+    :param threshold_factor: factor the noise estimate is multiplied with
+    :return: positive threshold value
+    """
+    return threshold_factor * np.median(np.absolute(signal) / 0.6745)
+
+
+def find_regions(mask):
+    """
+    Run-length segmentation of a boolean mask
+    :param mask: 1-dimensional boolean numpy array
+    :return: start indices and end indices (exclusive) of all regions in which mask is True. Regions that are still
+    open at the end of the signal are dropped, because their extreme value is not known yet.
+    """
+    edges = np.diff(mask.astype(np.int8))
+    starts = np.flatnonzero(edges == 1) + 1
+    ends = np.flatnonzero(edges == -1) + 1
+    if mask.size > 0 and mask[0]:
+        starts = np.insert(starts, 0, 0)
+    # every end belongs to the start before it, a start without end is the open region at the end of the signal
+    return starts[:len(ends)], ends
+
+
+def region_extrema(signal, starts, ends, find_maximum):
+    """
+    Finds the index of the maximum (or minimum) of each region
+    :param signal: 1-dimensional numpy array
+    :param starts: start indices of the regions
+    :param ends: end indices (exclusive) of the regions
+    :param find_maximum: True to search for maxima (peaks), False to search for minima (troughs)
+    :return: index of the first extreme value of each region
+    """
+    if len(starts) == 0:
+        return np.array([], dtype=np.int64)
+    # reduceat reduces signal[boundaries[i]:boundaries[i + 1]], so with interleaved starts and ends every second
+    # result is the extreme value of a region (ends are always smaller than len(signal) since regions are closed)
+    boundaries = np.empty(2 * len(starts), dtype=np.int64)
+    boundaries[0::2] = starts
+    boundaries[1::2] = ends
+    reduce = np.maximum if find_maximum else np.minimum
+    extreme_values = reduce.reduceat(signal, boundaries)[0::2]
+
+    # compare every sample inside a region with the extreme value of its region and keep the first hit per region
+    lengths = ends - starts
+    region_ids = np.repeat(np.arange(len(starts)), lengths)
+    offsets = starts - (np.cumsum(lengths) - lengths)
+    sample_indices = np.arange(lengths.sum()) + np.repeat(offsets, lengths)
+    hits = signal[sample_indices] == extreme_values[region_ids]
+    _, first_hits = np.unique(region_ids[hits], return_index=True)
+    return sample_indices[hits][first_hits]
+
+
+def enforce_dead_time(spike_indices, dead_time_samples):
+    """
+    Removes spikes that follow a kept spike within the dead time
+    :param spike_indices: sorted spike indices
+    :param dead_time_samples: minimal distance of two spikes in samples
+    :return: spike indices with at least dead_time_samples between each other
+    """
+    if dead_time_samples <= 0 or len(spike_indices) < 2:
+        return spike_indices
+    kept = []
+    position = 0
+    # this loop runs once per kept spike, not per sample
+    while position < len(spike_indices):
+        kept.append(position)
+        position = np.searchsorted(spike_indices, spike_indices[position] + dead_time_samples, side='left')
+    return spike_indices[kept]
+
+
+def detect_spikes(signal, threshold, mode, dead_time_samples=0, center=0):
+    """
+    Detects spikes as extreme values of the regions in which the signal is above center + threshold or below
+    center - threshold
+    :param signal: voltage trace as 1-dimensional numpy array
+    :param threshold: positive threshold value
+    :param mode: SpikeDetectionSettings.Mode (PEAKS, TROUGHS or BOTH)
+    :param dead_time_samples: minimal distance of two detected spikes in samples
+    :param center: value the threshold is applied around, e.g. the raw value of 0 uV
+    :return: sorted spike indices
+    """
+    signal = np.asarray(signal)
+    # float64 limits, so integer signals are not compared with a float of their own (possibly too small) precision
+    upper_limit, lower_limit = np.float64(center + threshold), np.float64(center - threshold)
+    spike_indices = []
+    if mode == SpikeDetectionSettings.Mode.PEAKS or mode == SpikeDetectionSettings.Mode.BOTH:
+        starts, ends = find_regions(signal > upper_limit)
+        spike_indices.append(region_extrema(signal, starts, ends, find_maximum=True))
+    if mode == SpikeDetectionSettings.Mode.TROUGHS or mode == SpikeDetectionSettings.Mode.BOTH:
+        starts, ends = find_regions(signal < lower_limit)
+        spike_indices.append(region_extrema(signal, starts, ends, find_maximum=False))
+    if len(spike_indices) == 0:
+        return np.array([], dtype=np.int64)
+    spike_indices = np.sort(np.concatenate(spike_indices))
+    return enforce_dead_time(spike_indices, dead_time_samples)
+
+
+def detect_channel_spikes(signal, threshold_factor, mode, dead_time_samples, half_window):
+    """
+    Detects the spikes of one channel, this function is called by the worker processes of the SpikeDetectionThread
+    :param signal: voltage trace as 1-dimensional numpy array
+    :param threshold_factor: factor the noise estimate is multiplied with
+    :param mode: SpikeDetectionSettings.Mode (PEAKS, TROUGHS or BOTH)
+    :param dead_time_samples: minimal distance of two detected spikes in samples
+    :param half_window: number of samples before and after the last spike which are returned for the live plot
+    :return: spike indices, threshold and single spike data [voltage, index, height, threshold] of the last spike (None
+    if there is no spike)
+    """
+    threshold = mad_threshold(signal, threshold_factor)
+    spike_indices = detect_spikes(signal, threshold, mode, dead_time_samples)
+    single_spike_data = None
+    if len(spike_indices) > 0:
+        spike_index = spike_indices[-1]
+        lower_index = max(spike_index - half_window, 0)
+        upper_index = spike_index + half_window
+        single_spike_data = [signal[lower_index:upper_index], spike_index - lower_index, signal[spike_index],
+                             threshold]
+    return spike_indices, threshold, single_spike_data
+
+
+def detect_channel_spikes_raw(raw_signal, zero, gain, threshold_factor, mode, dead_time_samples, half_window,
+                              absolute_median=None):
+    """
+    Same as detect_channel_spikes, but on the raw integer ADC values of a channel (uV = (raw - zero) * gain). The MAD
+    is computed from the histogram of the ADC steps, the detection compares the raw values with the threshold in ADC
+    steps. Only the threshold and the single spike data are converted to uV.
+    :param raw_signal: raw values of the channel as 1-dimensional integer numpy array
+    :param zero: raw value of 0 uV
+    :param gain: uV per raw step, has to be positive
+    :param absolute_median: median of |raw - zero| if it is known already (e.g. from the ChannelStatistics), None
+    computes it from raw_signal
+    :return: spike indices, threshold in uV and single spike data [voltage in uV, index, height in uV, threshold in uV]
+    of the last spike (None if there is no spike)
+    """
+    raw_signal = np.asarray(raw_signal)
+    if absolute_median is None:
+        absolute_median = AdcHistogram.from_values(raw_signal).get_absolute_deviation_median(zero)
+    raw_threshold = threshold_factor * absolute_median / 0.6745
+    spike_indices = detect_spikes(raw_signal, raw_threshold, mode, dead_time_samples, center=zero)
+    threshold = raw_threshold * gain
+    single_spike_data = None
+    if len(spike_indices) > 0:
+        spike_index = spike_indices[-1]
+        lower_index = max(spike_index - half_window, 0)
+        upper_index = spike_index + half_window
+        # only the few samples of the live plot are converted to uV (as float, unsigned values would wrap around)
+        single_spike_data = [(raw_signal[lower_index:upper_index].astype(np.float64) - zero) * gain,
+                             spike_index - lower_index, (float(raw_signal[spike_index]) - zero) * gain, threshold]
+    return spike_indices, threshold, single_spike_data
@@ -1,6 +1,7 @@
 import sys
 import os
 import ctypes
+import multiprocessing
 import PyQt5.QtWidgets as QtWidgets
 
 
@@ -26,10 +27,13 @@ def my_exception_hook(exctype, value, traceback):
 sys.excepthook = my_exception_hook
 # end of exception hook creation
 
-application = QtWidgets.QApplication(sys.argv)
-mainWindow = MainWindow('MEAsure')
-mainWindow.show()
+# the guard is needed, because the worker processes of the ParallelExecutor import this module again when they start
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    application = QtWidgets.QApplication(sys.argv)
+    mainWindow = MainWindow('MEAsure')
+    mainWindow.show()
 
-application.setActiveWindow(mainWindow)
-application.main_window = mainWindow
-sys.exit(application.exec())
\ No newline at end of file
+    application.setActiveWindow(mainWindow)
+    application.main_window = mainWindow
+    sys.exit(application.exec())
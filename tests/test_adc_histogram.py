@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from utility.adc_histogram import AdcHistogram, compute_adc_histograms
+
+
+@pytest.mark.parametrize('n_samples', [10001, 10000])
+def test_statistics_match_numpy(n_samples):
+    # odd and even numbers of samples (the median of an even number lies between two ADC steps)
+    values = np.random.default_rng(0).normal(3.0, 40.0, n_samples).astype(np.int16)
+    histogram = AdcHistogram.from_values(values)
+
+    median = np.median(values)
+    assert histogram.get_median() == median
+    np.testing.assert_array_equal(histogram.get_percentiles([0, 1, 25, 63.3, 99, 100]),
+                                  np.percentile(values, [0, 1, 25, 63.3, 99, 100]))
+    # median of the absolute values (MAD thresholds) and median absolute deviation from the median
+    assert histogram.get_absolute_deviation_median() == np.median(np.abs(values.astype(np.int64)))
+    assert histogram.get_absolute_deviation_median(median) == np.median(np.abs(values - median))
+
+
+def test_blockwise_histograms_match_numpy():
+    # several small blocks, the histograms have to grow as values outside their range come in
+    matrix = np.random.default_rng(1).normal(0.0, 100.0, (4, 5000)).astype(np.int16)
+    matrix[2, 4000:] += 3000
+    histograms = compute_adc_histograms(matrix, [3, 0, 2], block_bytes=1000)
+
+    for histogram, row in zip(histograms, [3, 0, 2]):
+        assert histogram.get_sample_count() == matrix.shape[1]
+        assert histogram.get_median() == np.median(matrix[row])
+        assert histogram.get_absolute_deviation_median() == np.median(np.abs(matrix[row].astype(np.int64)))
+        counts, edges = histogram.get_binned_counts(50)
+        assert counts.sum() == matrix.shape[1]
+        np.testing.assert_array_equal(counts, np.histogram(matrix[row], bins=edges)[0])
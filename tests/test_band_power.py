@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+import scipy.fft
+
+from frequency_bands_analysis.band_power import compute_band_powers
+from frequency_bands_analysis.frequency_bands_analysis_settings import FrequencyBandsAnalysisSettings
+
+
+def legacy_band_name(frequency):
+    # get_band_name of the baseline FrequencyBandsTab for the ictal activity bands
+    if 0 <= frequency <= 1:
+        return '< 1 Hz'
+    if 2 <= frequency < 6:
+        return 'delta'
+    elif 6 <= frequency < 11:
+        return 'theta'
+    elif 11 <= frequency < 16:
+        return 'alpha'
+    elif 21 <= frequency < 41:
+        return 'beta'
+    elif 41 <= frequency < 101:
+        return 'gamma'
+    return None
+
+
+@pytest.mark.parametrize('fs, nperseg', [(1000.0, 4096), (1000.0, 1000), (250.0, 500)])
+def test_ictal_bands_match_legacy_rule(fs, nperseg):
+    # with nperseg a multiple of fs there is a bin at exactly 1 Hz, which belongs to the '< 1 Hz' band
+    band_table = FrequencyBandsAnalysisSettings.DEFAULT_BAND_TABLES['ictal activity']
+    frequencies = scipy.fft.rfftfreq(nperseg, 1 / fs)
+    psd = np.random.default_rng(0).uniform(0.0, 10.0, (3, len(frequencies)))
+
+    band_powers = compute_band_powers(psd, fs, nperseg, band_table)
+
+    band_names = np.array([legacy_band_name(frequency) for frequency in frequencies])
+    for band_index, band in enumerate(band_table):
+        expected = psd[:, band_names == band[0]].mean(axis=1)
+        np.testing.assert_allclose(band_powers[:, band_index], expected, rtol=1e-12)
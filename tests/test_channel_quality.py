@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from file_handling.channel_quality import get_line_noise_fraction
+
+
+@pytest.mark.parametrize('line_fraction', [0.2, 0.67, 0.89])
+def test_line_noise_fraction_of_short_probes(line_fraction):
+    # ten probes of 0.2 s (5 Hz frequency bins) of white noise plus a 50 Hz tone with random phase
+    fs, n_samples = 25000.0, 5000
+    rng = np.random.default_rng(0)
+    time = np.arange(n_samples) / fs
+    amplitude = np.sqrt(2 * line_fraction / (1 - line_fraction))
+    phases = rng.uniform(0, 2 * np.pi, size=(10, 1, 1))
+    probes = rng.normal(size=(10, 1, n_samples)) + amplitude * np.sin(2 * np.pi * 50.0 * time + phases)
+
+    fraction = get_line_noise_fraction(probes, fs, 50.0)
+
+    assert fraction[0] == pytest.approx(line_fraction, abs=0.03)
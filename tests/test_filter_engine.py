@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+from scipy.signal import sosfiltfilt
+
+from filtering.filter_engine import FilterEngine
+from filtering.filter_settings import FilterSettings
+
+
+FILTERS = [
+    (FilterSettings.Mode.BANDPASS, 300.0, 3000.0, 10000.0),
+    (FilterSettings.Mode.LOWPASS, 20.0, None, 1000.0),
+    (FilterSettings.Mode.NOTCH, 50.0, None, 1000.0),
+    # low cutoff, the padding is much longer than most of the blocks
+    (FilterSettings.Mode.HIGHPASS, 0.1, None, 1000.0),
+]
+
+
+def filter_in_blocks(engine, traces, block_samples):
+    # the way FilterThread.chunked_filtering filters: every padded block is filtered on its own, only the inner part
+    # is kept
+    filtered = np.empty_like(traces)
+    for block_start, block_stop, read_start, read_stop in engine.plan_blocks(traces.shape[1], block_samples):
+        filtered_block = engine.filter_block(traces[:, read_start:read_stop])
+        filtered[:, block_start:block_stop] = filtered_block[:, block_start - read_start:block_stop - read_start]
+    return filtered
+
+
+@pytest.mark.parametrize('mode, cutoff_1, cutoff_2, fs', FILTERS)
+@pytest.mark.parametrize('block_samples', [5000, 65536, 150000])
+def test_padded_blocks_match_whole_trace(mode, cutoff_1, cutoff_2, fs, block_samples):
+    rng = np.random.default_rng(0)
+    # noise with a slow drift, so the low cutoff highpass has something to remove
+    traces = rng.normal(0.0, 10.0, (4, 200000)) + 50.0 * np.sin(np.arange(200000) / fs * 2 * np.pi * 0.02)
+    engine = FilterEngine(mode, cutoff_1, cutoff_2, fs)
+
+    expected = sosfiltfilt(engine.sos, traces, axis=-1)
+    filtered = filter_in_blocks(engine, traces, block_samples)
+
+    assert np.allclose(filtered, expected, rtol=0.0, atol=1e-7 * np.abs(expected).max())
+
+
+def test_padding_is_not_capped():
+    # the impulse response of a 0.1 Hz highpass at 1 kHz takes far longer than 10 s to decay
+    engine = FilterEngine(FilterSettings.Mode.HIGHPASS, 0.1, None, 1000.0)
+    assert engine.get_padding() > 10 * 1000
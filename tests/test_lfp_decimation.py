@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from scipy.signal import resample_poly
+
+from filtering.lfp_decimation import LfpDecimator, get_lfp_decimation
+
+
+@pytest.mark.parametrize('block_samples', [1000, 4321, 100000])
+@pytest.mark.parametrize('fs', [10000.0, 25000.0])
+def test_blockwise_decimation_matches_whole_trace(block_samples, fs):
+    traces = np.random.default_rng(0).normal(0.0, 10.0, (3, 50003))
+    decimator = LfpDecimator(fs, get_lfp_decimation(fs))
+
+    lfp = decimator.decimate(lambda start, stop: traces[:, start:stop], traces.shape[0], traces.shape[1],
+                             block_samples)
+
+    expected = resample_poly(traces, 1, decimator.decimation, axis=-1)
+    assert lfp.shape == expected.shape
+    np.testing.assert_allclose(lfp, expected, rtol=0.0, atol=1e-10 * np.abs(expected).max())
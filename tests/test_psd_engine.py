@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from scipy.signal import welch
+
+from frequency_bands_analysis.psd_engine import WelchAccumulator
+
+
+@pytest.mark.parametrize('segments_per_block', [1, 3, 100])
+@pytest.mark.parametrize('nperseg', [256, 255])
+def test_accumulated_blocks_match_welch(segments_per_block, nperseg):
+    # the last samples do not fill a whole segment, like scipy.signal.welch they are left out
+    fs = 1000.0
+    traces = np.random.default_rng(0).normal(0.0, 10.0, (3, 5000)) + 5.0
+    accumulator = WelchAccumulator(fs, nperseg=nperseg)
+
+    for start, stop in accumulator.plan_blocks(traces.shape[1], segments_per_block):
+        accumulator.add_block(traces[:, start:stop], workers=1)
+    frequencies, psd = accumulator.get_psd()
+
+    expected_frequencies, expected_psd = welch(traces, fs, nperseg=nperseg, axis=-1)
+    np.testing.assert_allclose(frequencies, expected_frequencies)
+    np.testing.assert_allclose(psd, expected_psd, rtol=1e-10)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+from scipy.signal import spectrogram, resample_poly
+
+from spectrograms.spectrogram_engine import SpectrogramEngine
+
+
+def compute_in_blocks(engine, traces, segments_per_block):
+    n_samples = traces.shape[1]
+    columns = [engine.compute_block(lambda start, stop: traces[:, start:stop], n_samples, first, stop)
+               for first, stop in engine.plan_blocks(n_samples, segments_per_block)]
+    return np.concatenate(columns, axis=-1)
+
+
+@pytest.mark.parametrize('segments_per_block', [1, 4, 1000])
+@pytest.mark.parametrize('decimation', [1, 5])
+def test_blocks_match_spectrogram(segments_per_block, decimation):
+    fs = 10000.0
+    traces = np.random.default_rng(0).normal(0.0, 10.0, (2, 60001))
+    engine = SpectrogramEngine(fs, decimation=decimation, segment_duration=0.1, min_frequency=20.0,
+                               max_frequency=400.0)
+
+    power = compute_in_blocks(engine, traces, segments_per_block)
+
+    # the engine equals scipy.signal.spectrogram of the trace decimated as a whole, cropped to the frequency range
+    decimated = resample_poly(traces, 1, decimation, axis=-1) if decimation > 1 else traces
+    frequencies, times, expected = spectrogram(decimated, engine.output_fs, window=('tukey', 0.25),
+                                               nperseg=engine.nperseg, noverlap=engine.noverlap, axis=-1)
+    np.testing.assert_allclose(engine.frequencies, frequencies[engine.bins])
+    np.testing.assert_allclose(engine.get_times(traces.shape[1]), times)
+    expected = expected[:, engine.bins, :]
+    # the engine stores float32
+    np.testing.assert_allclose(power, expected, rtol=1e-5, atol=1e-6 * expected.max())
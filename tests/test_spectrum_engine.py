@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+
+from frequency_analysis.spectrum_engine import get_frequencies, magnitude_spectra
+
+
+@pytest.mark.parametrize('bin_averaging', [1, 4])
+def test_magnitude_spectra_match_full_fft(bin_averaging):
+    # 2**14 samples need no zero padding, so the bins are those of the full FFT the frequency analysis plotted before
+    fs, n_samples, max_frequency = 1000.0, 2**14, 100.0
+    traces = np.random.default_rng(0).normal(0.0, 10.0, (3, n_samples))
+
+    frequencies = get_frequencies(n_samples, fs, max_frequency, bin_averaging)
+    spectra = magnitude_spectra(traces, fs, max_frequency, bin_averaging, workers=1)
+
+    # single sided amplitude spectrum of the hann windowed trace, as plotted by the old FrequencyAnalysisTab
+    n_half = int(n_samples / 2 + 1)
+    full_frequencies = np.linspace(0, fs / 2, n_half, endpoint=True)
+    full_spectra = 2.0 * np.abs(np.fft.fft(np.hanning(n_samples) * traces, axis=-1)[:, :n_half]) / n_half
+    n_bins = len(frequencies) * bin_averaging
+    assert full_frequencies[n_bins - 1] <= max_frequency < full_frequencies[n_bins + bin_averaging - 1]
+    np.testing.assert_allclose(frequencies, full_frequencies[:n_bins].reshape(-1, bin_averaging).mean(axis=1))
+    expected = full_spectra[:, :n_bins].reshape(3, -1, bin_averaging).mean(axis=-1)
+    # the engine stores float32
+    np.testing.assert_allclose(spectra, expected, rtol=1e-5)
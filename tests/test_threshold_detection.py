@@ -0,0 +1,175 @@
+import numpy as np
+import pytest
+
+from spike_detection.spike_detection_settings import SpikeDetectionSettings
+from spike_detection.threshold_detection import detect_spikes, detect_channel_spikes
+
+
+MODES = [SpikeDetectionSettings.Mode.PEAKS, SpikeDetectionSettings.Mode.TROUGHS, SpikeDetectionSettings.Mode.BOTH]
+
+
+def legacy_spike_detection(signal, threshold_factor, mode, spike_window=0.002, fs=10000.0):
+    """
+    The per-sample loop of SpikeDetectionThread.old_spike_detection for one channel, copied verbatim from the baseline.
+    Only the single spike data are collected in a list instead of being emitted to the live plot.
+    :return: spike indices of the channel and the threshold
+    """
+    single_spikes = []
+    above_upper_threshold = False
+    below_lower_threshold = False
+    current_extreme_index_and_value = None  # current local minimum or maximum
+
+    threshold = threshold_factor * np.median(np.absolute(signal) / 0.6745)
+    collect_peaks = (mode == SpikeDetectionSettings.Mode.PEAKS or
+                     mode == SpikeDetectionSettings.Mode.BOTH)
+    collect_troughs = (mode == SpikeDetectionSettings.Mode.TROUGHS or
+                       mode == SpikeDetectionSettings.Mode.BOTH)
+    channel_spike_indices = []
+    for index, value in enumerate(signal):
+        if above_upper_threshold:  # last value was above positive threshold limit
+            if value <= threshold:  # leaving upper area
+                # -> add current maximum index to list
+                if collect_peaks:
+                    channel_spike_indices.append(current_extreme_index_and_value[0])
+
+                    lower_index = current_extreme_index_and_value[0] - int((spike_window / 2) * fs)
+                    upper_index = current_extreme_index_and_value[0] + int((spike_window / 2) * fs)
+                    single_spike_voltage = signal[lower_index:upper_index]
+                    single_spike_index = (current_extreme_index_and_value[0] - lower_index)
+                    single_spike_height = signal[current_extreme_index_and_value[0]]
+                    single_spike_data = [single_spike_voltage, single_spike_index, single_spike_height,
+                                         threshold]
+                    single_spikes.append(single_spike_data)
+            else:  # still above positive threshold
+                # check if value is bigger than current maximum
+                if value > current_extreme_index_and_value[1]:
+                    current_extreme_index_and_value = (index, value)
+
+        elif below_lower_threshold:  # last value was below negative threshold limit
+            if value <= threshold:  # leaving lower area
+                # -> add current minimum index to list
+                if collect_troughs:
+                    channel_spike_indices.append(current_extreme_index_and_value[0])
+
+                    lower_index = current_extreme_index_and_value[0] - int((spike_window / 2) * fs)
+                    upper_index = current_extreme_index_and_value[0] + int((spike_window / 2) * fs)
+                    single_spike_voltage = signal[lower_index:upper_index]
+                    single_spike_index = (current_extreme_index_and_value[0] - lower_index)
+                    single_spike_height = signal[current_extreme_index_and_value[0]]
+                    single_spike_data = [single_spike_voltage, single_spike_index, single_spike_height,
+                                         threshold]
+                    single_spikes.append(single_spike_data)
+            else:  # still below negative threshold
+                # check if value is smaller than current maximum
+                if value < current_extreme_index_and_value[1]:
+                    current_extreme_index_and_value = (index, value)
+
+        else:  # last value was within threshold limits
+            if value > threshold or value < -threshold:  # crossing threshold limit
+                # initialise new local extreme value
+                current_extreme_index_and_value = (index, value)
+
+        # update state
+        below_lower_threshold = (value < -threshold)
+        above_upper_threshold = (value > threshold)
+    return np.asarray(channel_spike_indices, dtype=np.int64), threshold
+
+
+def make_trace(seed, n_samples=20000):
+    # noise with spikes that stay a few samples above or below the threshold, every spike is either positive or
+    # negative, so the trace never crosses from one threshold straight to the other
+    rng = np.random.default_rng(seed)
+    trace = rng.normal(0.0, 5.0, n_samples)
+    waveform = np.array([0.3, 0.7, 1.0, 0.8, 0.5, 0.3])
+    for spike_start in range(100, n_samples - 100, 150):
+        spike_start += rng.integers(0, 40)
+        trace[spike_start:spike_start + len(waveform)] += rng.choice([-1.0, 1.0]) * rng.uniform(80.0, 150.0) * waveform
+    return trace
+
+
+def get_region_length(trace, start, threshold):
+    # number of samples from start on, for which the trace stays below -threshold
+    length = 0
+    while start + length < len(trace) and trace[start + length] < -threshold:
+        length += 1
+    return length
+
+
+def check_peaks(legacy_peaks, spike_peaks):
+    # for peaks the old loop and the new detector agree
+    np.testing.assert_array_equal(spike_peaks, legacy_peaks)
+
+
+def check_troughs(trace, threshold, legacy_troughs, spike_troughs):
+    # Intended difference: the old loop compared troughs with +threshold, so a trough "ended" one sample after it
+    # crossed -threshold. It reports the crossing sample instead of the minimum and repeats it once for every sample the
+    # trace stays below -threshold. The new detector reports the minimum of the region once.
+    crossings = np.unique(legacy_troughs)
+    assert len(crossings) == len(spike_troughs)
+    for crossing, spike_index in zip(crossings, spike_troughs):
+        region_length = get_region_length(trace, crossing, threshold)
+        assert np.count_nonzero(legacy_troughs == crossing) == region_length
+        assert crossing <= spike_index < crossing + region_length
+        assert trace[spike_index] == trace[crossing:crossing + region_length].min()
+    assert np.any(np.diff(legacy_troughs) == 0)
+
+
+def check_dead_time(spike_indices, spike_indices_without_dead_time, dead_time_samples):
+    # Intended difference: the old loop has no dead time. A spike is dropped, if it follows the last kept spike within
+    # the dead time.
+    assert np.all(np.isin(spike_indices, spike_indices_without_dead_time))
+    assert np.all(np.diff(spike_indices) >= dead_time_samples)
+    for spike_index in np.setdiff1d(spike_indices_without_dead_time, spike_indices):
+        last_kept = spike_indices[np.searchsorted(spike_indices, spike_index) - 1]
+        assert 0 <= spike_index - last_kept < dead_time_samples
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_detect_spikes_against_legacy_loop(mode, seed):
+    trace = make_trace(seed)
+    legacy_indices, threshold = legacy_spike_detection(trace, 4, mode)
+    spike_indices = detect_spikes(trace, threshold, mode)
+    assert len(spike_indices) > 0
+
+    # in BOTH mode the peaks and the troughs are compared separately
+    legacy_positive, spike_positive = trace[legacy_indices] > 0, trace[spike_indices] > 0
+    if mode != SpikeDetectionSettings.Mode.TROUGHS:
+        check_peaks(legacy_indices[legacy_positive], spike_indices[spike_positive])
+    else:
+        assert not np.any(spike_positive)
+    if mode != SpikeDetectionSettings.Mode.PEAKS:
+        check_troughs(trace, threshold, legacy_indices[~legacy_positive], spike_indices[~spike_positive])
+    else:
+        assert np.all(spike_positive)
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_detect_spikes_dead_time(mode, seed):
+    trace = make_trace(seed)
+    _, threshold = legacy_spike_detection(trace, 4, mode)
+    spike_indices_without_dead_time = detect_spikes(trace, threshold, mode)
+    spike_indices = detect_spikes(trace, threshold, mode, dead_time_samples=200)
+
+    assert len(spike_indices) < len(spike_indices_without_dead_time)
+    check_dead_time(spike_indices, spike_indices_without_dead_time, 200)
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('dead_time_samples', [0, 200])
+def test_detect_channel_spikes_against_legacy_loop(mode, dead_time_samples):
+    trace = make_trace(3)
+    legacy_indices, legacy_threshold = legacy_spike_detection(trace, 5, mode)
+
+    spike_indices, threshold, single_spike_data = detect_channel_spikes(trace, 5, mode, dead_time_samples,
+                                                                        half_window=50)
+
+    assert threshold == pytest.approx(legacy_threshold)
+    np.testing.assert_array_equal(spike_indices, detect_spikes(trace, threshold, mode, dead_time_samples))
+    if mode == SpikeDetectionSettings.Mode.PEAKS and dead_time_samples == 0:
+        check_peaks(legacy_indices, spike_indices)
+    # the live plot gets the window around the last spike
+    voltage, index, height, _ = single_spike_data
+    assert height == trace[spike_indices[-1]]
+    assert voltage[index] == height
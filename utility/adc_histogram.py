@@ -0,0 +1,140 @@
+import numpy as np
+
+from file_handling.io_planner import read_rows
+
+
+# In this script the value distribution of channels is computed on the raw integer ADC values of ChannelData instead of
+# scaled float copies: np.bincount counts how often every ADC step occurs, which needs neither a float conversion nor
+# sorting of the (often 15 million samples long) traces. Medians, percentiles and the median absolute deviation (MAD)
+# follow exactly from the cumulative counts and are converted to uV afterwards with the scale of the reader
+# (ConversionFactor and Exponent of the channel), i.e. they are identical to np.median and np.percentile of the scaled
+# trace.
+
+class AdcHistogram:
+    """
+    Number of samples for every raw value of a channel: counts[i] is the number of samples with the raw value offset + i
+    """
+    def __init__(self):
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.offset = 0
+
+    @staticmethod
+    def from_values(values):
+        histogram = AdcHistogram()
+        histogram.add(values)
+        return histogram
+
+    def add(self, values):
+        """
+        Counts further samples, the histogram grows if they are outside of its current range
+        :param values: integer numpy array (any shape)
+        """
+        values = np.asarray(values).ravel()
+        if values.size == 0:
+            return
+        if values.dtype.kind not in 'iub':
+            raise TypeError('AdcHistogram needs integer ADC values, not ' + str(values.dtype))
+        low, high = int(values.min()), int(values.max())
+        if self.counts.size == 0:
+            self.offset = low
+            self.counts = np.zeros(high - low + 1, dtype=np.int64)
+        elif low < self.offset or high >= self.offset + self.counts.size:
+            new_offset = min(low, self.offset)
+            new_size = max(high, self.offset + self.counts.size - 1) - new_offset + 1
+            counts = np.zeros(new_size, dtype=np.int64)
+            counts[self.offset - new_offset:self.offset - new_offset + self.counts.size] = self.counts
+            self.counts, self.offset = counts, new_offset
+        # int64, so small dtypes do not overflow when the offset is subtracted
+        self.counts += np.bincount(values.astype(np.int64) - self.offset, minlength=self.counts.size)
+
+    def get_sample_count(self):
+        return int(self.counts.sum())
+
+    def get_values(self):
+        return np.arange(self.offset, self.offset + self.counts.size)
+
+    def get_kth_values(self, k):
+        """
+        :param k: indices into the sorted samples (numpy array of ints)
+        :return: raw values of the samples at these positions, as if the samples were sorted
+        """
+        return self.offset + np.searchsorted(np.cumsum(self.counts), np.asarray(k), side='right')
+
+    def get_percentiles(self, q):
+        """
+        :param q: percentiles between 0 and 100 (number or array)
+        :return: raw values (float) at the percentiles, with linear interpolation between samples like np.percentile
+        """
+        n = self.get_sample_count()
+        if n == 0:
+            return np.full(np.shape(q), np.nan)
+        positions = np.asarray(q, dtype=np.float64) / 100.0 * (n - 1)
+        lower = np.floor(positions).astype(np.int64)
+        fraction = positions - lower
+        lower_values = self.get_kth_values(lower)
+        upper_values = self.get_kth_values(np.minimum(lower + 1, n - 1))
+        return lower_values + fraction * (upper_values - lower_values)
+
+    def get_median(self):
+        return float(self.get_percentiles(50.0))
+
+    def get_absolute_deviation_median(self, center=0.0):
+        """
+        :param center: raw value the deviations are taken from, 0 gives the median of the absolute raw values as used
+        for the MAD thresholds, get_median() gives the classic median absolute deviation
+        :return: median of |raw value - center| (float)
+        """
+        if self.counts.size == 0:
+            return np.nan
+        # the center may be a half step (the median of an even number of samples), so the deviations are counted in
+        # half steps, which keeps them integer
+        doubled_center = int(round(2 * center))
+        doubled_deviations = np.abs(2 * self.get_values() - doubled_center)
+        deviations = AdcHistogram()
+        deviations.offset = int(doubled_deviations.min())
+        deviations.counts = np.bincount(doubled_deviations - deviations.offset, weights=self.counts).astype(np.int64)
+        return deviations.get_median() / 2.0
+
+    def get_binned_counts(self, n_bins):
+        """
+        Combines the counts into at most n_bins bins of equal width. Every bin holds whole ADC steps, so no step is split
+        between two bins (as it would be by np.histogram with float bin edges).
+        :return: counts and raw bin edges (len(counts) + 1), the edges lie half a step beside the values
+        """
+        width = max(1, -(-self.counts.size // n_bins))
+        n_bins = -(-self.counts.size // width)
+        padded = np.zeros(n_bins * width, dtype=np.int64)
+        padded[:self.counts.size] = self.counts
+        edges = self.offset - 0.5 + width * np.arange(n_bins + 1)
+        return padded.reshape(n_bins, width).sum(axis=1), edges
+
+
+def accumulate_adc_histograms(histograms, dataset, rows, block_bytes=2**26):
+    """
+    Adds the samples of several channels to their histograms in one pass through the recording: blocks of whole chunks
+    (in time) of all rows are read one after the other, see io_planner.py. This is a generator, which yields the
+    progress in percent after every block.
+    :param histograms: list of AdcHistogram, one per row
+    :param dataset: h5py dataset or numpy array of raw integer values with shape (channels, samples)
+    :param rows: rows of the channels
+    :param block_bytes: approximate size of one block
+    """
+    n_samples = dataset.shape[1]
+    chunk_samples = dataset.chunks[1] if getattr(dataset, 'chunks', None) is not None else 1
+    block_samples = max(1, block_bytes // (max(len(rows), 1) * dataset.dtype.itemsize * chunk_samples)) * chunk_samples
+    for start in range(0, n_samples, block_samples):
+        stop = min(start + block_samples, n_samples)
+        block = read_rows(dataset, rows, start, stop)
+        for histogram, values in zip(histograms, block):
+            histogram.add(values)
+        yield round(stop / n_samples * 100.0, 2)
+
+
+def compute_adc_histograms(dataset, rows, block_bytes=2**26):
+    """
+    :return: list of AdcHistogram of the rows, computed in one pass with accumulate_adc_histograms
+    """
+    histograms = [AdcHistogram() for _ in rows]
+    for _ in accumulate_adc_histograms(histograms, dataset, rows, block_bytes):
+        pass
+    return histograms
@@ -0,0 +1,333 @@
+import math
+import os
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from multiprocessing import shared_memory
+import numpy as np
+import h5py
+
+from file_handling.io_planner import open_hdf5_file, read_rows
+
+
+# In this script the channels of an analysis are distributed over several processes. A QThread only keeps one core
+# busy and, since numpy and scipy do not release the GIL all the time, also slows down the GUI. With the
+# ParallelExecutor the QThread only hands out the work and sends the results, which come back from the worker
+# processes, to its tab via the usual signals.
+# The traces are not sent to the workers. Instead, a trace source tells each worker where to read them: either from the
+# HDF5 file (every worker opens it read-only itself) or from a shared memory block for traces that only exist in memory.
+
+# HDF5 files and readers a worker process has opened, they are kept open for all following tasks of this worker
+_open_files = {}
+_open_mcs_readers = {}
+
+
+def _get_file(path, dataset_name):
+    if path not in _open_files:
+        # the chunk cache of the file is sized to the chunks of the dataset that is read (see io_planner.py)
+        _open_files[path] = open_hdf5_file(path, dataset_name)
+    return _open_files[path]
+
+
+def _get_mcs_reader(path):
+    if path not in _open_mcs_readers:
+        # imported here, so worker processes that never read recordings do not need to import the readers
+        from file_handling.recording_reader import open_recording
+        _open_mcs_readers[path] = open_recording(path, lazy=True)
+    return _open_mcs_readers[path]
+
+
+class McsTraceSource:
+    """
+    Scaled voltage traces (in uV) of channels of a recording (MCS .h5 file or a file of the MemmapDataReader)
+    """
+    def __init__(self, path, labels, raw=False):
+        """
+        :param path: path of the recording
+        :param labels: channel labels, position i of the source is the channel labels[i]
+        :param raw: if True the raw values are read instead of the scaled traces (see RecordingReader.get_raw_scaling)
+        """
+        self.path = path
+        self.labels = [str(label) for label in labels]
+        self.raw = raw
+
+    def __len__(self):
+        return len(self.labels)
+
+    def read(self, position, start=None, stop=None):
+        reader = _get_mcs_reader(self.path)
+        if self.raw:
+            return reader.get_raw_channel(self.labels[position], start, stop)
+        return reader.get_scaled_channel(self.labels[position], start, stop)
+
+    def read_window(self, positions, start=None, stop=None):
+        reader = _get_mcs_reader(self.path)
+        labels = [self.labels[p] for p in positions]
+        if self.raw:
+            return reader.read_rows([reader.get_channel_id(label) for label in labels], start, stop)
+        return reader.get_scaled_window(labels, start, stop)
+
+    def close(self):
+        # nothing to release, the workers close their files when they exit
+        pass
+
+
+class Hdf5TraceSource:
+    """
+    Traces stored as rows of a dataset in a HDF5 file, e.g. the 'filter' dataset of a .meae file
+    """
+    def __init__(self, path, dataset_name, rows):
+        """
+        :param path: path of the HDF5 file
+        :param dataset_name: name of the dataset inside the file, e.g. '/filter'
+        :param rows: rows of the dataset, position i of the source is the row rows[i]
+        """
+        self.path = path
+        self.dataset_name = dataset_name
+        self.rows = [int(row) for row in rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def read(self, position, start=None, stop=None):
+        return _get_file(self.path, self.dataset_name)[self.dataset_name][self.rows[position], start:stop]
+
+    def read_window(self, positions, start=None, stop=None):
+        return read_rows(_get_file(self.path, self.dataset_name)[self.dataset_name], [self.rows[p] for p in positions],
+                         start, stop)
+
+    def close(self):
+        pass
+
+
+class Hdf5RowView:
+    """
+    Selected rows of an open h5py dataset, e.g. the rows of the selected channels of the 'filter' dataset of a .meae
+    file. Like the dataset itself, a row is only read when it is accessed.
+    """
+    def __init__(self, dataset, rows):
+        """
+        :param dataset: open h5py dataset (channels x samples)
+        :param rows: rows of the dataset, position i of the view is the row rows[i]
+        """
+        self.dataset = dataset
+        self.rows = [int(row) for row in rows]
+        self.shape = (len(self.rows), dataset.shape[1])
+        self.dtype = dataset.dtype
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, key):
+        # view[position] reads a whole row, view[position, start:stop] only the samples between start and stop
+        if isinstance(key, tuple):
+            position, samples = key
+            return self.dataset[self.rows[position], samples]
+        return self.dataset[self.rows[key]]
+
+
+class SharedTraceSource:
+    """
+    Traces that are held in memory are copied once into a shared memory block, which all workers can read without the
+    traces being pickled and sent to each of them. close() has to be called by the process that created the source.
+    """
+    def __init__(self, traces):
+        """
+        :param traces: matrix or list of equally long traces (channels x samples)
+        """
+        # The traces are copied row by row into the shared memory block. np.asarray of a list of traces would build
+        # another complete copy of the matrix first.
+        first_trace = np.asarray(traces[0]) if len(traces) > 0 else np.empty(0)
+        self.shape, self.dtype = (len(traces), first_trace.shape[0]), first_trace.dtype
+        n_bytes = self.shape[0] * self.shape[1] * self.dtype.itemsize
+        self.shared_memory = shared_memory.SharedMemory(create=True, size=max(n_bytes, 1))
+        self.matrix = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shared_memory.buf)
+        for idx in range(self.shape[0]):
+            self.matrix[idx] = traces[idx]
+        self.owner = True
+
+    def __getstate__(self):
+        # only the name of the memory block is sent to the workers
+        return {'name': self.shared_memory.name, 'shape': self.shape, 'dtype': self.dtype.str}
+
+    def __setstate__(self, state):
+        self.shape, self.dtype = state['shape'], np.dtype(state['dtype'])
+        # the workers are started by the process that created the block and share its resource tracker, so the block
+        # is only removed once close() is called by the creating process
+        self.shared_memory = shared_memory.SharedMemory(name=state['name'])
+        self.matrix = np.ndarray(self.shape, dtype=self.dtype, buffer=self.shared_memory.buf)
+        self.owner = False
+
+    def __len__(self):
+        return self.shape[0]
+
+    def read(self, position, start=None, stop=None):
+        return np.array(self.matrix[position, start:stop])
+
+    def read_window(self, positions, start=None, stop=None):
+        return self.matrix[list(positions), start:stop]
+
+    def close(self):
+        self.matrix = None
+        self.shared_memory.close()
+        if self.owner:
+            self.shared_memory.unlink()
+
+
+def trace_source_from_traces(traces):
+    """
+    Creates the fitting trace source for traces handed to an analysis (e.g. the filter_mat of the ResultStoring)
+    :param traces: h5py dataset or Hdf5RowView (read by the workers from file) or list/matrix of traces (copied to
+    shared memory)
+    :return: Hdf5TraceSource or SharedTraceSource
+    """
+    if isinstance(traces, h5py.Dataset):
+        return Hdf5TraceSource(traces.file.filename, traces.name, range(traces.shape[0]))
+    if isinstance(traces, Hdf5RowView):
+        return Hdf5TraceSource(traces.dataset.file.filename, traces.dataset.name, traces.rows)
+    return SharedTraceSource(traces)
+
+
+def get_n_samples(traces):
+    """
+    :param traces: traces handed to an analysis (see trace_source_from_traces)
+    :return: number of samples of every trace, for a h5py dataset it is taken from its shape without reading a row
+    """
+    if isinstance(traces, (h5py.Dataset, Hdf5RowView, np.ndarray)):
+        return traces.shape[1]
+    return len(traces[0])
+
+
+def read_trace(traces, position, start=None, stop=None):
+    """
+    :param traces: traces handed to an analysis (see trace_source_from_traces)
+    :return: samples between start and stop of the trace at position, of a h5py dataset only these samples are read
+    """
+    if isinstance(traces, (h5py.Dataset, Hdf5RowView, np.ndarray)):
+        return traces[position, start:stop]
+    return np.asarray(traces[position][start:stop])
+
+
+def _process_channel_batch(function, source, positions, kwargs, channel_kwargs=None):
+    # runs in the worker process, channel_kwargs holds the additional keyword arguments of every position
+    if channel_kwargs is None:
+        channel_kwargs = [dict()] * len(positions)
+    return [function(source.read(position), **kwargs, **extra_kwargs)
+            for position, extra_kwargs in zip(positions, channel_kwargs)]
+
+
+class ParallelExecutor:
+    """
+    The ParallelExecutor distributes channels (or other independent tasks) over a pool of worker processes and hands
+    the results back as soon as they are finished
+    """
+    # number of executors currently used in a with block, background tasks (e.g. the overviews of the data list) wait
+    # while an analysis is running
+    active_count = 0
+    active_count_lock = threading.Lock()
+
+    def __init__(self, max_workers=None):
+        """
+        :param max_workers: number of worker processes, None uses all cores. With 1 worker everything runs in the
+        calling thread, which allows debugging.
+        """
+        self.max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            # 'spawn' starts fresh interpreters, forking the GUI process with its running threads is not safe
+            self.pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return self.pool
+
+    def map_channels(self, function, source, positions=None, batch_size=None, channel_kwargs=None, **kwargs):
+        """
+        Applies function(trace, **kwargs) to the traces of the source
+        :param function: module level function (it has to be pickled to be sent to the workers)
+        :param source: McsTraceSource, Hdf5TraceSource or SharedTraceSource
+        :param positions: positions of the source to process, None processes all
+        :param batch_size: number of channels a worker processes per task, by default every worker gets about four
+        tasks, so the workers are kept busy until the end
+        :param channel_kwargs: keyword arguments which differ between the channels, a dictionary mapping the name of
+        the argument to a list with one value per position of the source (e.g. precomputed noise levels)
+        :return: generator yielding (position, result) in the order the channels are finished
+        """
+        if positions is None:
+            positions = range(len(source))
+        positions = list(positions)
+        if channel_kwargs is None:
+            channel_kwargs = dict()
+        extra_kwargs = [{name: values[position] for name, values in channel_kwargs.items()} for position in positions]
+        if self.max_workers == 1:
+            for position, position_kwargs in zip(positions, extra_kwargs):
+                yield position, function(source.read(position), **kwargs, **position_kwargs)
+            return
+        if batch_size is None:
+            batch_size = max(1, math.ceil(len(positions) / (4 * self.max_workers)))
+        tasks = [(function, source, positions[i:i + batch_size], kwargs, extra_kwargs[i:i + batch_size])
+                 for i in range(0, len(positions), batch_size)]
+        for task_index, results in self.map_tasks(_process_channel_batch, tasks):
+            for position, result in zip(tasks[task_index][2], results):
+                yield position, result
+
+    def map_tasks(self, function, tasks, ordered=False, max_pending=None):
+        """
+        Calls function(*arguments) for every tuple of arguments in tasks
+        :param function: module level function
+        :param tasks: list of argument tuples
+        :param ordered: if True, results are handed back in the order of the tasks (e.g. to write blocks in order)
+        :param max_pending: maximal number of submitted tasks whose results were not handed back yet, limits the memory
+        used by results waiting for an earlier task. None means two tasks per worker if ordered, otherwise unlimited.
+        :return: generator yielding (task index, result)
+        """
+        if self.max_workers == 1:
+            for task_index, arguments in enumerate(tasks):
+                yield task_index, function(*arguments)
+            return
+        if max_pending is None:
+            max_pending = 2 * self.max_workers if ordered else len(tasks)
+        pool = self.get_pool()
+        pending = {}
+        finished = {}
+        next_task, next_result = 0, 0
+        try:
+            while next_result < len(tasks):
+                while next_task < len(tasks) and len(pending) + len(finished) < max(max_pending, 1):
+                    pending[pool.submit(function, *tasks[next_task])] = next_task
+                    next_task += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finished[pending.pop(future)] = future.result()
+                if ordered:
+                    while next_result in finished:
+                        yield next_result, finished.pop(next_result)
+                        next_result += 1
+                else:
+                    for task_index in list(finished):
+                        yield task_index, finished.pop(task_index)
+                        next_result += 1
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    @staticmethod
+    def is_any_active():
+        return ParallelExecutor.active_count > 0
+
+    def __enter__(self):
+        with ParallelExecutor.active_count_lock:
+            ParallelExecutor.active_count += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self.shutdown()
+        finally:
+            with ParallelExecutor.active_count_lock:
+                ParallelExecutor.active_count -= 1